@@ -0,0 +1,35 @@
+# Compare converting many short texts one job per text with the batch methods,
+# which join up to batch_size texts into one job and split the results at the bookmarks.
+import time
+import common
+
+def main():
+    parser = common.createArgumentParser("Compare one job per text with the batch methods")
+    parser.add_argument("--items", type = int, default = 500, help = "number of texts")
+    parser.add_argument("--length", type = int, default = 12, help = "characters per text")
+    parser.add_argument("--batch-size", default = "1,8,64", help = "comma separated values of batch_size to try")
+    parser.add_argument("--job-cost", type = float, default = 0.0005, help = "seconds spent starting a job (simulated)")
+    parser.set_defaults(real_time_factor = 0.0, kana_cost = 0.0)
+    args = parser.parse_args()
+    texts = [common.createText(args.length + index % 8)[index % 8:] + "。" for index in range(args.items)]
+
+    results = []
+    with common.openVcRoid2(args, job_cost = args.job_cost) as vc:
+        start = time.perf_counter()
+        for text in texts:
+            vc.textToSpeech(text, raw = True)
+        elapsed = time.perf_counter() - start
+        results.append({"case": "per item", "seconds": elapsed, "items_per_second": len(texts) / elapsed})
+        for batch_size in [int(value) for value in args.batch_size.split(",")]:
+            start = time.perf_counter()
+            vc.textToSpeechBatch(texts, raw = True, batch_size = batch_size)
+            elapsed = time.perf_counter() - start
+            results.append({"case": "batch {}".format(batch_size), "seconds": elapsed, "items_per_second": len(texts) / elapsed})
+
+    print("{:>12} {:>10} {:>10}".format("case", "seconds", "items/s"))
+    for result in results:
+        print("{:>12} {:>10.3f} {:>10.1f}".format(result["case"], result["seconds"], result["items_per_second"]))
+    common.saveResults(args, "batch", results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+# Sweep the size of the raw buffer and show the callbacks per second of speech, the time to the first chunk
+# of textToSpeechStream() and the total time of textToSpeech().
+import time
+import common
+from pyvcroid2.buffers import BufferSizes, LATENCY, THROUGHPUT
+
+SAMPLE_RATE = 44100
+
+def main():
+    parser = common.createArgumentParser("Sweep the sizes of the buffers")
+    parser.add_argument("--length", type = int, default = 200, help = "characters per request")
+    parser.add_argument("--raw-buf-bytes", default = "1000,{},22050,88200,{}".format(LATENCY.rawBufBytes, THROUGHPUT.rawBufBytes),
+        help = "comma separated sizes of the raw buffer to try")
+    parser.set_defaults(real_time_factor = 0.01, kana_cost = 0.0)
+    args = parser.parse_args()
+    text = common.createText(args.length)
+
+    jobs = []
+    results = []
+    with common.openVcRoid2(args, {"metrics": jobs.append}) as vc:
+        for raw_buf_bytes in sorted(set(int(value) for value in args.raw_buf_bytes.split(","))):
+            buffers = BufferSizes(raw_buf_bytes = raw_buf_bytes)
+            vc.textToSpeech(text, buffers = buffers) # Set the engine to the sizes
+
+            first_chunk = []
+            def stream():
+                start = time.perf_counter()
+                iterator = vc.textToSpeechStream(text, buffers = buffers)
+                next(iterator)
+                first_chunk.append(time.perf_counter() - start)
+                for _ in iterator:
+                    pass
+
+            del jobs[:]
+            total = common.measure(lambda: vc.textToSpeech(text, raw = True, buffers = buffers), args.repeat)
+            speech = [job for job in jobs if job.kind == "speech"]
+            callbacks = sum(job.callbacks for job in speech)
+            seconds_of_speech = sum(job.bytes for job in speech) / 2 / SAMPLE_RATE
+            common.measure(stream, args.repeat)
+            results.append({
+                "raw_buf_bytes": raw_buf_bytes,
+                "callbacks_per_second_of_speech": callbacks / seconds_of_speech,
+                "first_chunk": common.summarize(first_chunk),
+                "total": common.summarize(total),
+            })
+
+    print("{:>14} {:>16} {:>16} {:>12}".format("raw_buf_bytes", "callbacks/s", "first chunk[ms]", "total[ms]"))
+    for result in results:
+        print("{:>14} {:>16.1f} {:>16.2f} {:>12.2f}".format(result["raw_buf_bytes"], result["callbacks_per_second_of_speech"],
+            result["first_chunk"]["p50"] * 1000, result["total"]["p50"] * 1000))
+    common.saveResults(args, "buffers", results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+# Measure the Python overhead of the binding layer.
+#   per request  : textToKana + kanaToSpeech of one character with a simulated engine that costs nothing
+#   per callback : the extra time per RAWBUF_FULL callback when the engine hands out tiny buffers
+#   micro        : the rawbuf callback body called through ctypes, as it was with per-call thunks,
+#                  enum lookups and fresh out-parameters, and as it is now
+import time
+from ctypes import *
+import common
+from pyvcroid2 import aitalk
+
+SAMPLES = 64
+SAMPLE_RATE = 44100
+
+class StubEngine(object):
+    # GetData that hands out a buffer of silence without any other work
+    def __init__(self, result):
+        self.result = result
+
+    def AITalkAPI_GetData(self, job_id, raw_buf, len_buf, samples_read):
+        getattr(samples_read, "_obj", samples_read).value = 0
+        return self.result
+
+def legacyRawBufCallback(engine, raw_buf):
+    def rawbuf_callback(reason_code, job_id, tick, user_data):
+        reason = aitalk.EventReasonCode(reason_code)
+        if (reason != aitalk.EventReasonCode.RAWBUF_FULL) and (reason != aitalk.EventReasonCode.RAWBUF_FLUSH) and (reason != aitalk.EventReasonCode.RAWBUF_CLOSE):
+            return 0
+        while True:
+            samples_read = c_uint32()
+            result = engine.AITalkAPI_GetData(c_int32(job_id), raw_buf, c_uint32(sizeof(raw_buf) // 2), byref(samples_read))
+            if result != aitalk.ResultCode.SUCCESS:
+                break
+            if (samples_read.value * 2) < sizeof(raw_buf):
+                break
+        return 0
+    return rawbuf_callback
+
+def currentRawBufCallback(engine, raw_buf):
+    raw_buf_size = sizeof(raw_buf)
+    samples_read = c_uint32()
+    samples_read_ref = byref(samples_read)
+    get_data = engine.AITalkAPI_GetData
+    success = aitalk.ResultCode.SUCCESS.value
+    rawbuf_full = aitalk.EventReasonCode.RAWBUF_FULL.value
+    rawbuf_flush = aitalk.EventReasonCode.RAWBUF_FLUSH.value
+    rawbuf_close = aitalk.EventReasonCode.RAWBUF_CLOSE.value
+    def rawbuf_callback(reason_code, job_id, tick, user_data):
+        if (reason_code != rawbuf_full) and (reason_code != rawbuf_flush) and (reason_code != rawbuf_close):
+            return 0
+        while True:
+            result = get_data(job_id, raw_buf, raw_buf_size // 2, samples_read_ref)
+            if result != success:
+                break
+            if (samples_read.value * 2) < raw_buf_size:
+                break
+        return 0
+    return rawbuf_callback
+
+def microCallback(callback, count):
+    reason = aitalk.EventReasonCode.RAWBUF_FULL.value
+    start = time.perf_counter()
+    for _ in range(count):
+        callback(reason, 1, 0, None)
+    return (time.perf_counter() - start) / count
+
+def microPerRequest(count):
+    # Thunks and the parameter structure that used to be created for every request
+    raw_buf = (c_char * 1024)()
+    engine = StubEngine(aitalk.ResultCode.SUCCESS)
+    start = time.perf_counter()
+    for _ in range(count):
+        aitalk.ProcTextBuf(lambda reason_code, job_id, user_data: 0)
+        aitalk.ProcRawBuf(legacyRawBufCallback(engine, raw_buf))
+        aitalk.ProcEventTts(lambda reason_code, job_id, tick, name, user_data: 0)
+    return (time.perf_counter() - start) / count
+
+def microTtsParam(count):
+    start = time.perf_counter()
+    for _ in range(count):
+        class TTtsParam(Structure):
+            _fields_ = [("size", c_uint32), ("speaker", aitalk.TSpeakerParam * 2)]
+            _pack_ = 1
+    legacy = (time.perf_counter() - start) / count
+    start = time.perf_counter()
+    for _ in range(count):
+        aitalk.createTtsParam(2)
+    current = (time.perf_counter() - start) / count
+    return legacy, current
+
+def main():
+    parser = common.createArgumentParser("Measure the overhead of the binding layer")
+    parser.add_argument("--count", type = int, default = 20000, help = "number of calls of the micro benchmarks")
+    parser.set_defaults(kana_cost = 0.0, real_time_factor = 0.0, msec_per_char = 100)
+    args = parser.parse_args()
+    results = {}
+
+    # End-to-end through VcRoid2
+    with common.openVcRoid2(args, phonetic_events = False) as vc:
+        kana = vc.textToKana("あ")
+        samples = common.measure(lambda: vc.kanaToSpeech(vc.textToKana("あ")), args.repeat * 20)
+        results["per_request"] = common.summarize(samples)
+    if args.engine == "simulated":
+        with common.openVcRoid2(args, phonetic_events = False, chunk_samples = SAMPLES) as vc:
+            callbacks = (args.msec_per_char * SAMPLE_RATE // 1000) // SAMPLES
+            samples = common.measure(lambda: vc.kanaToSpeech(kana), args.repeat * 4)
+            results["per_callback"] = (common.percentile(samples, 50) - results["per_request"]["p50"]) / callbacks
+
+    # Micro benchmarks of the callback body called through ctypes
+    raw_buf = (c_char * 1024)()
+    legacy_engine = StubEngine(aitalk.ResultCode.SUCCESS)
+    current_engine = StubEngine(aitalk.ResultCode.SUCCESS.value)
+    results["callback_legacy"] = microCallback(aitalk.ProcRawBuf(legacyRawBufCallback(legacy_engine, raw_buf)), args.count)
+    results["callback_current"] = microCallback(aitalk.ProcRawBuf(currentRawBufCallback(current_engine, raw_buf)), args.count)
+    results["thunks_per_request_legacy"] = microPerRequest(args.count // 10)
+    results["tts_param_legacy"], results["tts_param_current"] = microTtsParam(args.count // 10)
+
+    print("per request (p50)          : {:10.1f} us".format(results["per_request"]["p50"] * 1e6))
+    if "per_callback" in results:
+        print("per callback               : {:10.2f} us".format(results["per_callback"] * 1e6))
+    print("callback body  legacy      : {:10.2f} us".format(results["callback_legacy"] * 1e6))
+    print("callback body  current     : {:10.2f} us".format(results["callback_current"] * 1e6))
+    print("thunks per request legacy  : {:10.2f} us (now created once per instance)".format(results["thunks_per_request_legacy"] * 1e6))
+    print("TTtsParam class  legacy    : {:10.2f} us".format(results["tts_param_legacy"] * 1e6))
+    print("TTtsParam class  current   : {:10.2f} us".format(results["tts_param_current"] * 1e6))
+    common.saveResults(args, "callbacks", results)
+
+if __name__ == "__main__":
+    main()
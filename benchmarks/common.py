@@ -0,0 +1,130 @@
+# Helpers shared by the benchmark scripts.
+import argparse
+import datetime
+import functools
+import json
+import math
+import platform
+import statistics
+import sys
+import time
+import pyvcroid2
+
+SAMPLE_TEXT = (
+    "吾輩は猫である。名前はまだ無い。どこで生れたかとんと見当がつかぬ。"
+    "何でも薄暗いじめじめした所でニャーニャー泣いていた事だけは記憶している。"
+    "吾輩はここで始めて人間というものを見た。しかもあとで聞くとそれは書生という人間中で一番獰悪な種族であったそうだ。"
+)
+
+def createText(length):
+    '''
+    Create Japanese text of the given number of characters
+    '''
+    repeat = length // len(SAMPLE_TEXT) + 1
+    return (SAMPLE_TEXT * repeat)[0:length]
+
+def createArgumentParser(description):
+    '''
+    Create the argument parser with the options selecting the engine
+    '''
+    parser = argparse.ArgumentParser(description = description)
+    parser.add_argument("--engine", choices = ["simulated", "dll"], default = "simulated" if sys.platform != "win32" else "dll",
+        help = "engine backend to benchmark")
+    parser.add_argument("--install-path", help = "install path of VOICEROID2 (dll)")
+    parser.add_argument("--language", help = "language library to load")
+    parser.add_argument("--voice", help = "voice library to load")
+    parser.add_argument("--kana-cost", type = float, default = 0.000005, help = "seconds per character to convert to AIKANA (simulated)")
+    parser.add_argument("--real-time-factor", type = float, default = 0.001, help = "seconds spent per second of speech (simulated)")
+    parser.add_argument("--msec-per-char", type = int, default = 5, help = "speech duration per character (simulated)")
+    parser.add_argument("--repeat", type = int, default = 5, help = "number of measurements per case")
+    parser.add_argument("--output", help = "path of the JSON file to save the results to")
+    return parser
+
+def createEngineFactory(args, **kwargs):
+    '''
+    Create a picklable callable creating the engine backend selected by the arguments, None means aitalked.dll
+    '''
+    if args.engine == "dll":
+        return None
+    from pyvcroid2.simulator import SimulatedEngine
+    options = dict(kana_cost = args.kana_cost, real_time_factor = args.real_time_factor, msec_per_char = args.msec_per_char)
+    options.update(kwargs)
+    return functools.partial(SimulatedEngine, **options)
+
+def createEngine(args, **kwargs):
+    '''
+    Create the engine backend selected by the arguments, None means aitalked.dll
+    '''
+    engine_factory = createEngineFactory(args, **kwargs)
+    return None if engine_factory is None else engine_factory()
+
+def openVcRoid2(args, options = None, **kwargs):
+    '''
+    Open VcRoid2 and load the language and voice selected by the arguments.
+    options are passed to VcRoid2 and kwargs to the simulated engine.
+    '''
+    engine = createEngine(args, **kwargs)
+    options = dict(options or {})
+    if engine is None:
+        vc = pyvcroid2.VcRoid2(install_path = args.install_path, **options)
+    else:
+        vc = pyvcroid2.VcRoid2(engine = engine, **options)
+    language_list = vc.listLanguages()
+    if args.language is not None:
+        vc.loadLanguage(args.language)
+    else:
+        vc.loadLanguage("standard" if "standard" in language_list else language_list[0])
+    vc.loadVoice(args.voice if args.voice is not None else vc.listVoices()[0])
+    return vc
+
+def measure(func, repeat):
+    '''
+    Call func repeatedly and return the elapsed seconds of each call
+    '''
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def percentile(samples, p):
+    '''
+    Nearest-rank percentile
+    '''
+    ordered = sorted(samples)
+    index = max(0, math.ceil(len(ordered) * p / 100) - 1)
+    return ordered[index]
+
+def summarize(samples):
+    '''
+    Summarize elapsed seconds into a JSON friendly dictionary
+    '''
+    return {
+        "count": len(samples),
+        "mean": statistics.mean(samples),
+        "min": min(samples),
+        "p50": percentile(samples, 50),
+        "p90": percentile(samples, 90),
+        "p99": percentile(samples, 99),
+        "max": max(samples),
+    }
+
+def saveResults(args, name, results):
+    '''
+    Save the results with the environment into args.output if specified
+    '''
+    if args.output is None:
+        return
+    document = {
+        "benchmark": name,
+        "version": pyvcroid2.__version__,
+        "engine": args.engine,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "arguments": vars(args),
+        "results": results,
+    }
+    with open(args.output, "w", encoding = "utf-8") as f:
+        json.dump(document, f, indent = 2, ensure_ascii = False)
@@ -0,0 +1,44 @@
+# Sweep the number of jobs VcRoid2 runs in one engine at the same time
+# to find where the throughput stops improving and the latency starts growing.
+import concurrent.futures
+import time
+import common
+
+def run(args, max_jobs, texts):
+    with common.openVcRoid2(args, {"max_jobs": max_jobs}, max_jobs = args.engine_max_jobs, busy = args.busy) as vc:
+        latencies = []
+        def convert(text):
+            start = time.perf_counter()
+            vc.textToSpeech(text)
+            latencies.append(time.perf_counter() - start)
+        with concurrent.futures.ThreadPoolExecutor(args.threads) as executor:
+            start = time.perf_counter()
+            list(executor.map(convert, texts))
+            elapsed = time.perf_counter() - start
+    return elapsed, latencies
+
+def main():
+    parser = common.createArgumentParser("Sweep the number of concurrent jobs in one engine")
+    parser.add_argument("--requests", type = int, default = 32, help = "number of requests per case")
+    parser.add_argument("--length", type = int, default = 100, help = "characters per request")
+    parser.add_argument("--threads", type = int, default = 16, help = "number of threads submitting requests")
+    parser.add_argument("--max-jobs", default = "1,2,4,8,16", help = "comma separated values of max_jobs to try")
+    parser.add_argument("--engine-max-jobs", type = int, default = 64, help = "number of jobs the engine accepts (simulated)")
+    parser.add_argument("--busy", action = "store_true", help = "spend the simulated costs on the CPU instead of sleeping")
+    parser.set_defaults(kana_cost = 0.0005, real_time_factor = 0.05)
+    args = parser.parse_args()
+    texts = [common.createText(args.length)] * args.requests
+
+    results = []
+    print("{:>8} {:>10} {:>10} {:>10} {:>10}".format("max_jobs", "seconds", "req/s", "p50[ms]", "p99[ms]"))
+    for max_jobs in [int(value) for value in args.max_jobs.split(",")]:
+        elapsed, latencies = run(args, max_jobs, texts)
+        summary = common.summarize(latencies)
+        results.append({"max_jobs": max_jobs, "seconds": elapsed, "requests_per_second": len(texts) / elapsed, "latency": summary})
+        print("{:>8} {:>10.3f} {:>10.1f} {:>10.1f} {:>10.1f}".format(max_jobs, elapsed, len(texts) / elapsed, summary["p50"] * 1000, summary["p99"] * 1000))
+    best = max(results, key = lambda result: result["requests_per_second"])
+    print("best throughput at max_jobs={}".format(best["max_jobs"]))
+    common.saveResults(args, "concurrency", results)
+
+if __name__ == "__main__":
+    main()
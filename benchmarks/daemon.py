@@ -0,0 +1,35 @@
+# Compare a short-lived script which opens VcRoid2 for one sentence with sending the sentence to a warm daemon.
+import os
+import tempfile
+import common
+from pyvcroid2.daemon import Daemon
+from pyvcroid2.client import VcRoid2Client
+
+def main():
+    parser = common.createArgumentParser("Compare opening VcRoid2 per request with a warm daemon")
+    parser.add_argument("--length", type = int, default = 30, help = "characters per request")
+    parser.add_argument("--init-cost", type = float, default = 0.3, help = "seconds spent in AITalkAPI_Init (simulated)")
+    parser.add_argument("--lang-load-cost", type = float, default = 0.5, help = "seconds spent in AITalkAPI_LangLoad (simulated)")
+    parser.add_argument("--voice-load-cost", type = float, default = 0.3, help = "seconds spent in AITalkAPI_VoiceLoad (simulated)")
+    args = parser.parse_args()
+    text = common.createText(args.length)
+    costs = dict(init_cost = args.init_cost, lang_load_cost = args.lang_load_cost, voice_load_cost = args.voice_load_cost)
+
+    def cold():
+        with common.openVcRoid2(args, **costs) as vc:
+            vc.textToSpeech(text)
+
+    results = {"cold": common.summarize(common.measure(cold, args.repeat))}
+    path = os.path.join(tempfile.mkdtemp(), "pyvcroid2.sock")
+    with Daemon(common.openVcRoid2(args, **costs), unix_path = path) as daemon:
+        daemon.start()
+        client = VcRoid2Client(unix_path = path)
+        results["daemon"] = common.summarize(common.measure(lambda: client.textToSpeech(text), args.repeat))
+    os.rmdir(os.path.dirname(path))
+
+    for name, result in results.items():
+        print("{:8}: mean {:8.2f} ms, p50 {:8.2f} ms".format(name, result["mean"] * 1000, result["p50"] * 1000))
+    common.saveResults(args, "daemon", results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+# Compare the latency of the two-stage textToSpeech (textToKana + kanaToSpeech)
+# with the single-job PLAIN_TO_WAVE path.
+# The engine is selected by --engine, so the comparison also runs on SimulatedEngine without VOICEROID2.
+import sys
+import common
+
+LENGTHS = [10, 40, 200, 1000]
+
+def main(argv = None):
+    parser = common.createArgumentParser("Compare two-stage and direct textToSpeech")
+    parser.add_argument("--lengths", type = int, nargs = "+", default = LENGTHS, help = "characters per text")
+    args = parser.parse_args(argv)
+
+    results = []
+    with common.openVcRoid2(args) as vc:
+        print("{:>8} {:>12} {:>12} {:>12}".format("chars", "two-stage", "direct", "saved"))
+        for length in args.lengths:
+            text = common.createText(length)
+            if vc.textToSpeech(text, direct = False) != vc.textToSpeech(text, direct = True):
+                print("direct textToSpeech differs from two-stage at {} chars".format(length))
+                sys.exit(1)
+            two_stage = common.summarize(common.measure(lambda: vc.textToSpeech(text, direct = False), args.repeat))
+            direct = common.summarize(common.measure(lambda: vc.textToSpeech(text, direct = True), args.repeat))
+            saved = two_stage["p50"] - direct["p50"]
+            results.append({"length": length, "two_stage": two_stage, "direct": direct, "saved_p50": saved})
+            print("{:>8} {:>10.1f}ms {:>10.1f}ms {:>10.1f}ms".format(length, two_stage["p50"] * 1000, direct["p50"] * 1000, saved * 1000))
+    common.saveResults(args, "direct_to_wave", results)
+    return results
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# Measure how much of a long document DocumentRenderer renders again after it was interrupted,
+# compared with rendering the whole document from scratch.
+import shutil
+import tempfile
+import time
+import common
+from pyvcroid2.document import DocumentRenderer
+
+class _Interrupted(Exception):
+    pass
+
+class _Interrupter(object):
+    # Fails every segment after the given number of them as if the process was stopped
+    def __init__(self, vc, count):
+        self.maxJobs = vc.maxJobs
+        self.__vc = vc
+        self.__count = count
+
+    def textToSpeech(self, text, **kwargs):
+        self.__count -= 1
+        if self.__count < 0:
+            raise _Interrupted()
+        return self.__vc.textToSpeech(text, **kwargs)
+
+def createDocument(chapters, sentences, length):
+    text = ""
+    for chapter in range(chapters):
+        text += "# Chapter {}\n".format(chapter + 1)
+        for sentence in range(sentences):
+            text += common.createText(length + chapter * sentences + sentence)[-length:] + "。\n"
+    return text
+
+def main():
+    parser = common.createArgumentParser("Compare rendering a document from scratch with resuming it")
+    parser.add_argument("--chapters", type = int, default = 10, help = "number of chapters")
+    parser.add_argument("--sentences", type = int, default = 20, help = "number of sentences per chapter")
+    parser.add_argument("--length", type = int, default = 30, help = "characters per sentence")
+    parser.add_argument("--interrupt", type = float, default = 0.8, help = "fraction of the segments finished before the interruption")
+    args = parser.parse_args()
+    document = createDocument(args.chapters, args.sentences, args.length)
+
+    results = {}
+    with common.openVcRoid2(args, {"max_jobs": 2}) as vc:
+        directory = tempfile.mkdtemp()
+        try:
+            start = time.perf_counter()
+            renderer = DocumentRenderer(vc, directory)
+            with tempfile.TemporaryFile() as f:
+                renderer.render(document, f)
+            results["scratch"] = time.perf_counter() - start
+            results["segments"] = segments = renderer.synthesized
+            shutil.rmtree(directory)
+
+            try:
+                with tempfile.TemporaryFile() as f:
+                    DocumentRenderer(_Interrupter(vc, int(segments * args.interrupt)), directory).render(document, f)
+            except _Interrupted:
+                pass
+            renderer = DocumentRenderer(vc, directory)
+            start = time.perf_counter()
+            with tempfile.TemporaryFile() as f:
+                renderer.render(document, f)
+            results["resume"] = time.perf_counter() - start
+            results["synthesized"] = renderer.synthesized
+            results["skipped"] = renderer.skipped
+        finally:
+            shutil.rmtree(directory, ignore_errors = True)
+
+    print("from scratch : {:8.3f} s ({} segments)".format(results["scratch"], results["segments"]))
+    print("resume       : {:8.3f} s ({} synthesized, {} skipped)".format(results["resume"], results["synthesized"], results["skipped"]))
+    common.saveResults(args, "document", results)
+
+if __name__ == "__main__":
+    main()
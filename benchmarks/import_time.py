@@ -0,0 +1,63 @@
+# Measure the time to import the package and its modules in fresh interpreters,
+# and fail if importing the package loads the modules only the engine needs.
+import os
+import subprocess
+import sys
+import common
+
+CASES = (
+    ("pyvcroid2", "import pyvcroid2"),
+    ("pyvcroid2.aitalk", "import pyvcroid2.aitalk"),
+    ("pyvcroid2.shiftjis", "import pyvcroid2.shiftjis"),
+    ("pyvcroid2.output", "import pyvcroid2.output"),
+    ("VcRoid2", "from pyvcroid2 import VcRoid2"),
+)
+
+# Modules which importing the package must not load
+HEAVY_MODULES = ("asyncio", "concurrent.futures", "http.server", "ctypes", "pyvcroid2.pyvcroid2", "pyvcroid2.engine")
+
+SCRIPT = '''
+import sys, time
+start = time.perf_counter()
+{}
+print(time.perf_counter() - start)
+print(",".join(name for name in {!r} if name in sys.modules))
+'''
+
+def run(statement):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH = root + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    output = subprocess.run([sys.executable, "-c", SCRIPT.format(statement, HEAVY_MODULES)],
+        env = env, check = True, stdout = subprocess.PIPE, universal_newlines = True).stdout.splitlines()
+    return float(output[0]), [name for name in output[1].split(",") if name != ""]
+
+def main():
+    parser = common.createArgumentParser("Measure the time to import the package")
+    parser.add_argument("--max-ms", type = float, help = "fail if importing the package takes longer than this at p50")
+    args = parser.parse_args()
+
+    results = {}
+    loaded = []
+    for name, statement in CASES:
+        samples = []
+        for _ in range(args.repeat):
+            seconds, modules = run(statement)
+            samples.append(seconds)
+            if name == "pyvcroid2":
+                loaded = modules
+        results[name] = common.summarize(samples)
+
+    for name, _ in CASES:
+        print("{:20}: p50 {:8.2f} ms, max {:8.2f} ms".format(name, results[name]["p50"] * 1000, results[name]["max"] * 1000))
+    print("heavy modules loaded by import pyvcroid2: {}".format(", ".join(loaded) if loaded else "none"))
+    common.saveResults(args, "import_time", {"cases": results, "heavy_modules": loaded})
+
+    failed = 0 < len(loaded)
+    if (args.max_ms is not None) and (args.max_ms < results["pyvcroid2"]["p50"] * 1000):
+        print("import pyvcroid2 is slower than {} ms".format(args.max_ms))
+        failed = True
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+# Compare rendering a long text again after editing one sentence with textToSpeech()
+# and with IncrementalRenderer, which synthesizes only the edited sentences.
+import time
+import common
+from pyvcroid2.incremental import IncrementalRenderer
+
+def main():
+    parser = common.createArgumentParser("Compare rendering an edited text from scratch and incrementally")
+    parser.add_argument("--lines", type = int, default = 200, help = "number of sentences of the text")
+    parser.add_argument("--length", type = int, default = 30, help = "characters per sentence")
+    parser.add_argument("--edits", default = "1,10,50", help = "comma separated numbers of sentences to edit")
+    args = parser.parse_args()
+    sentences = [common.createText(args.length + index)[-args.length:].replace("。", "、") + "。" for index in range(args.lines)]
+
+    results = []
+    with common.openVcRoid2(args) as vc:
+        renderer = IncrementalRenderer(vc)
+        renderer.render("".join(sentences), raw = True)
+        for edits in [int(value) for value in args.edits.split(",")]:
+            step = max(1, args.lines // edits)
+            edited = list(sentences)
+            for index in range(0, args.lines, step)[0:edits]:
+                edited[index] = "改" + edited[index]
+            text = "".join(edited)
+
+            start = time.perf_counter()
+            vc.textToSpeech(text, raw = True, chunk_length = 200)
+            full = time.perf_counter() - start
+            start = time.perf_counter()
+            renderer.render(text, raw = True)
+            incremental = time.perf_counter() - start
+            results.append({"edits": edits, "full": full, "incremental": incremental, "synthesized": renderer.synthesized})
+            # Go back to the original text for the next case
+            renderer.render("".join(sentences), raw = True)
+
+    print("{:>6} {:>10} {:>12} {:>12}".format("edits", "full[s]", "increment[s]", "synthesized"))
+    for result in results:
+        print("{:>6} {:>10.3f} {:>12.3f} {:>12}".format(result["edits"], result["full"], result["incremental"], result["synthesized"]))
+    common.saveResults(args, "incremental", results)
+
+if __name__ == "__main__":
+    main()
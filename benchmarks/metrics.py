@@ -0,0 +1,33 @@
+# Measure the overhead of the metrics hook and print the per-stage breakdown collected by PrometheusExporter.
+import common
+from pyvcroid2.metrics import PrometheusExporter
+
+def main():
+    parser = common.createArgumentParser("Measure the overhead of the metrics hook")
+    parser.add_argument("--length", type = int, default = 20, help = "characters per request")
+    parser.add_argument("--requests", type = int, default = 200, help = "number of requests per measurement")
+    parser.add_argument("--show", action = "store_true", help = "print the exported metrics")
+    parser.set_defaults(real_time_factor = 0.0, kana_cost = 0.0)
+    args = parser.parse_args()
+    text = common.createText(args.length)
+
+    exporter = PrometheusExporter()
+    cases = (("disabled", None), ("no-op hook", lambda metrics: None), ("prometheus", exporter))
+    results = {}
+    with common.openVcRoid2(args) as vc:
+        def run():
+            for _ in range(args.requests):
+                vc.textToSpeech(text, raw = True)
+        for name, hook in cases:
+            vc.metrics = hook
+            run() # Warm up
+            results[name] = common.summarize([seconds / args.requests for seconds in common.measure(run, args.repeat)])
+
+    for name, _ in cases:
+        print("{:12}: {:8.1f} us/request (p50 {:8.1f} us)".format(name, results[name]["mean"] * 1e6, results[name]["p50"] * 1e6))
+    if args.show:
+        print(exporter.render())
+    common.saveResults(args, "metrics", results)
+
+if __name__ == "__main__":
+    main()
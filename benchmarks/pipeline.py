@@ -0,0 +1,77 @@
+# Throughput and latency of each stage of the synthesis pipeline for text of various lengths.
+#   python benchmarks/pipeline.py --lengths 10,1000,100000 --output pipeline.json
+import time
+import tracemalloc
+from pyvcroid2.output import createWaveHeader
+from pyvcroid2.shiftjis import calculateShiftJisCharacterPositions, replaceIrqMark
+import common
+
+def stageResult(length, stage, samples, **extra):
+    result = {"length": length, "stage": stage}
+    result.update(common.summarize(samples))
+    result["chars_per_sec"] = length / result["p50"] if 0 < result["p50"] else None
+    result.update(extra)
+    return result
+
+def benchmarkLength(vc, length, repeat):
+    text = common.createText(length)
+    results = []
+
+    # Python side helpers
+    samples = common.measure(lambda: calculateShiftJisCharacterPositions(text), repeat)
+    results.append(stageResult(length, "shiftjis_positions", samples))
+    kana = vc.textToKana(text)
+    shiftjis_string, shiftjis_positions = calculateShiftJisCharacterPositions(text)
+    samples = common.measure(lambda: replaceIrqMark(kana, shiftjis_positions), repeat)
+    results.append(stageResult(length, "replace_irq_mark", samples))
+
+    # Engine jobs
+    samples = common.measure(lambda: vc.textToKana(text), repeat)
+    results.append(stageResult(length, "text_to_kana", samples))
+
+    first_chunk = []
+    def stream():
+        start = time.perf_counter()
+        for chunk, events in vc.kanaToSpeechStream(kana):
+            first_chunk.append(time.perf_counter() - start)
+            break
+    common.measure(stream, repeat)
+    results.append(stageResult(length, "kana_to_speech_first_chunk", first_chunk))
+
+    speech, tts_events = vc.kanaToSpeech(kana)
+    audio_seconds = (len(speech) - 44) / 2 / 44100
+    samples = common.measure(lambda: vc.kanaToSpeech(kana), repeat)
+    results.append(stageResult(length, "kana_to_speech", samples,
+        audio_seconds = audio_seconds, real_time_factor = common.percentile(samples, 50) / audio_seconds))
+
+    samples = common.measure(lambda: createWaveHeader(len(speech) - 44), max(repeat, 1000))
+    results.append(stageResult(length, "wave_header", samples))
+
+    # End to end
+    samples = common.measure(lambda: vc.textToSpeech(text), repeat)
+    tracemalloc.start()
+    vc.textToSpeech(text)
+    allocated = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    results.append(stageResult(length, "text_to_speech", samples,
+        audio_seconds = audio_seconds, real_time_factor = common.percentile(samples, 50) / audio_seconds,
+        peak_bytes_allocated = allocated, peak_bytes_per_audio_second = allocated / audio_seconds))
+    return results
+
+def main():
+    parser = common.createArgumentParser("Benchmark each stage of the synthesis pipeline")
+    parser.add_argument("--lengths", default = "10,100,1000,10000,100000", help = "comma separated text lengths")
+    args = parser.parse_args()
+
+    results = []
+    with common.openVcRoid2(args) as vc:
+        print("{:>8} {:<28} {:>10} {:>10} {:>10} {:>14}".format("length", "stage", "p50[ms]", "p90[ms]", "p99[ms]", "chars/s"))
+        for length in [int(value) for value in args.lengths.split(",")]:
+            for result in benchmarkLength(vc, length, args.repeat):
+                results.append(result)
+                print("{:>8} {:<28} {:>10.3f} {:>10.3f} {:>10.3f} {:>14.0f}".format(
+                    length, result["stage"], result["p50"] * 1000, result["p90"] * 1000, result["p99"] * 1000, result["chars_per_sec"] or 0))
+    common.saveResults(args, "pipeline", results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+# Measure the throughput of VcRoid2Pool against a single VcRoid2 as the number of processes grows.
+# The simulated engine spins on the CPU so that each process occupies a core like aitalked.dll.
+import os
+import time
+import common
+from pyvcroid2.pool import VcRoid2Pool
+
+def runSingle(args, texts):
+    with common.openVcRoid2(args, busy = True) as vc:
+        start = time.perf_counter()
+        for text in texts:
+            vc.textToSpeech(text)
+        return time.perf_counter() - start
+
+def runPool(args, texts, processes):
+    engine_factory = common.createEngineFactory(args, busy = True)
+    language = args.language if args.language is not None else "standard"
+    voice = args.voice if args.voice is not None else "akari_44"
+    with VcRoid2Pool(language, voice, processes = processes, install_path = args.install_path, engine_factory = engine_factory) as pool:
+        # Warm up every worker before measuring
+        for future in [pool.submit("textToKana", "あ") for _ in range(processes)]:
+            future.result()
+        start = time.perf_counter()
+        futures = [pool.submit("textToSpeech", text) for text in texts]
+        for future in futures:
+            future.result()
+        return time.perf_counter() - start
+
+def main():
+    parser = common.createArgumentParser("Measure the throughput of VcRoid2Pool")
+    parser.add_argument("--requests", type = int, default = 32, help = "number of requests per case")
+    parser.add_argument("--length", type = int, default = 200, help = "characters per request")
+    parser.add_argument("--processes", default = None, help = "comma separated numbers of processes")
+    parser.set_defaults(kana_cost = 0.0001, real_time_factor = 0.05)
+    args = parser.parse_args()
+    if args.processes is None:
+        counts = sorted(set([1, 2, 4, os.cpu_count() or 1]))
+    else:
+        counts = [int(count) for count in args.processes.split(",")]
+    texts = [common.createText(args.length)] * args.requests
+
+    results = []
+    single = runSingle(args, texts)
+    results.append({"processes": 0, "seconds": single, "requests_per_second": len(texts) / single})
+    print("{:>10} {:>10} {:>10} {:>10}".format("processes", "seconds", "req/s", "speedup"))
+    print("{:>10} {:>10.3f} {:>10.1f} {:>10.2f}".format("single", single, len(texts) / single, 1.0))
+    for count in counts:
+        elapsed = runPool(args, texts, count)
+        results.append({"processes": count, "seconds": elapsed, "requests_per_second": len(texts) / elapsed})
+        print("{:>10} {:>10.3f} {:>10.1f} {:>10.2f}".format(count, elapsed, len(texts) / elapsed, single / elapsed))
+    common.saveResults(args, "pool", results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+# Measure the cost of the voice parameters set per request.
+#   same      : every request uses the same preset, the engine is set once
+#   alternate : the requests alternate between two presets, the engine is set for every request
+#   param     : the requests write param before each conversion as callers did before presets
+import time
+import common
+
+def run(args, vc, kana, presets):
+    samples = []
+    for index in range(args.requests):
+        preset = presets[index % len(presets)]
+        start = time.perf_counter()
+        if preset is None:
+            vc.param.speed = 1.0 + (index % 2) * 0.5
+            vc.kanaToSpeech(kana)
+        else:
+            vc.kanaToSpeech(kana, preset = preset)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def main():
+    parser = common.createArgumentParser("Measure the cost of the voice parameters set per request")
+    parser.add_argument("--requests", type = int, default = 200, help = "number of requests per case")
+    parser.add_argument("--length", type = int, default = 20, help = "characters per request")
+    parser.add_argument("--set-param-cost", type = float, default = 0.0005, help = "seconds spent in AITalkAPI_SetParam (simulated)")
+    parser.set_defaults(real_time_factor = 0.0)
+    args = parser.parse_args()
+
+    results = {}
+    with common.openVcRoid2(args, set_param_cost = args.set_param_cost) as vc:
+        kana = vc.textToKana(common.createText(args.length))
+        normal = vc.param.createPreset(speed = 1.0)
+        fast = vc.param.createPreset(speed = 1.5)
+        cases = (("same", [normal]), ("alternate", [normal, fast]), ("param", [None]))
+        print("{:>10} {:>10} {:>10}".format("case", "p50[ms]", "p99[ms]"))
+        for name, presets in cases:
+            summary = common.summarize(run(args, vc, kana, presets))
+            results[name] = summary
+            print("{:>10} {:>10.3f} {:>10.3f}".format(name, summary["p50"] * 1000, summary["p99"] * 1000))
+    common.saveResults(args, "presets", results)
+
+if __name__ == "__main__":
+    main()
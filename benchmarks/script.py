@@ -0,0 +1,36 @@
+# Compare rendering a dialogue line by line in script order with renderScript(), which groups the lines by voice.
+# With max_voices=1 every voice switch loads the voice again, as loadVoice always did.
+import time
+import common
+
+def main():
+    parser = common.createArgumentParser("Compare rendering a dialogue in script order with renderScript()")
+    parser.add_argument("--voices", type = int, default = 3, help = "number of voices the dialogue alternates between (simulated)")
+    parser.add_argument("--lines", type = int, default = 30, help = "number of lines of the dialogue")
+    parser.add_argument("--length", type = int, default = 20, help = "characters per line")
+    parser.add_argument("--max-voices", type = int, default = 1, help = "number of voices kept loaded")
+    parser.add_argument("--voice-load-cost", type = float, default = 0.02, help = "seconds spent in AITalkAPI_VoiceLoad (simulated)")
+    args = parser.parse_args()
+    voices = ["voice{}".format(index) for index in range(args.voices)]
+    args.voice = voices[0]
+    lines = [(voices[index % len(voices)], None, common.createText(args.length)) for index in range(args.lines)]
+
+    results = {}
+    with common.openVcRoid2(args, {"max_voices": args.max_voices}, voices = voices, voice_load_cost = args.voice_load_cost) as vc:
+        start = time.perf_counter()
+        for voice, preset, text in lines:
+            vc.loadVoice(voice)
+            vc.textToSpeech(text, preset = preset)
+        results["script_order"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        _, _, switches_avoided = vc.renderScript(lines)
+        results["render_script"] = time.perf_counter() - start
+        results["switches_avoided"] = switches_avoided
+
+    print("script order  : {:8.3f} s".format(results["script_order"]))
+    print("renderScript  : {:8.3f} s ({} switches avoided)".format(results["render_script"], results["switches_avoided"]))
+    common.saveResults(args, "script", results)
+
+if __name__ == "__main__":
+    main()
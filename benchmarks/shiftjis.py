@@ -0,0 +1,103 @@
+# Compare the Shift-JIS position mapping and the Irq MARK rewrite with the former per-character implementation.
+#   python benchmarks/shiftjis.py --lengths 1000,100000,1000000
+import argparse
+import io
+import re
+import common
+from pyvcroid2.shiftjis import calculateShiftJisCharacterPositions, replaceIrqMark
+
+def legacyCalculateShiftJisCharacterPositions(input_string):
+    shiftjis_string = bytearray()
+    shiftjis_positions = []
+    encode = "shift-jis"
+    for input_index in range(len(input_string)):
+        input_char = input_string[input_index]
+        shiftjis_char = input_char.encode(encode)
+        for offset in range(len(shiftjis_char)):
+            shiftjis_positions.append(input_index)
+        shiftjis_string.extend(shiftjis_char)
+    shiftjis_positions.append(len(input_string))
+    return bytes(shiftjis_string), shiftjis_positions
+
+def legacyReplaceIrqMark(input_string, input_positions):
+    output = io.StringIO()
+    shiftjis_length = len(input_positions)
+    index = 0
+    start_of_irq = "(Irq MARK=_AI@"
+    end_of_irq = ")"
+    while True:
+        start_pos = input_string.find(start_of_irq, index)
+        if start_pos < 0:
+            output.write(input_string[index:])
+            break
+        start_pos += len(start_of_irq)
+        output.write(input_string[index:start_pos])
+        end_pos = input_string.find(end_of_irq, start_pos)
+        if end_pos < 0:
+            raise RuntimeError()
+        if not input_string[start_pos:end_pos].isnumeric():
+            raise RuntimeError()
+        shiftjis_index = int(input_string[start_pos:end_pos])
+        if (shiftjis_index < 0) or (shiftjis_length <= shiftjis_index):
+            raise RuntimeError()
+        output.write(str(input_positions[shiftjis_index]))
+        index = end_pos
+    output.seek(0)
+    return output.read()
+
+def createKana(text):
+    # AIKANA-like string with a mark carrying the Shift-JIS offset at the start of each sentence
+    kana = []
+    offset = 0
+    for sentence in re.findall(r"[^。]*。?", text):
+        if len(sentence) == 0:
+            continue
+        kana.append("(Irq MARK=_AI@{})".format(offset))
+        kana.append(sentence)
+        offset += len(sentence.encode("shift-jis"))
+    return "".join(kana)
+
+def outcome(func, *args):
+    try:
+        result = func(*args)
+        return ("ok", result[0], list(result[1])) if isinstance(result, tuple) else ("ok", result)
+    except Exception as e:
+        return ("error", type(e))
+
+def checkIdentical():
+    texts = ["", "abc", "こんにちは", "ABCｱｲｳ¥‾~\\漢字。", common.createText(1000) + "mixed ascii 123!"]
+    for text in texts:
+        assert outcome(calculateShiftJisCharacterPositions, text) == outcome(legacyCalculateShiftJisCharacterPositions, text), text
+    assert outcome(calculateShiftJisCharacterPositions, "\U0001F600") == outcome(legacyCalculateShiftJisCharacterPositions, "\U0001F600")
+    positions = legacyCalculateShiftJisCharacterPositions(texts[3])[1]
+    kanas = [
+        "", "no marks", createKana(texts[3]), "(Irq MARK=_AI@3)ア(Irq MARK=other)",
+        "(Irq MARK=_AI@3", "(Irq MARK=_AI@x)", "(Irq MARK=_AI@99)", "(Irq MARK=_AI@五)",
+        "(Irq MARK=_AI@１)", "(Irq MARK=_AI@1(Irq MARK=_AI@2)", "(Irq MARK=_AI@)",
+    ]
+    for kana in kanas:
+        assert outcome(replaceIrqMark, kana, positions) == outcome(legacyReplaceIrqMark, kana, positions), kana
+
+def main():
+    parser = argparse.ArgumentParser(description = "Compare Shift-JIS helpers with the former implementation")
+    parser.add_argument("--lengths", default = "1000,10000,100000,1000000", help = "comma separated text lengths")
+    parser.add_argument("--repeat", type = int, default = 5, help = "number of measurements per case")
+    args = parser.parse_args()
+    checkIdentical()
+
+    print("{:>8} {:<20} {:>12} {:>12} {:>8}".format("length", "function", "legacy[ms]", "current[ms]", "speedup"))
+    for length in [int(value) for value in args.lengths.split(",")]:
+        text = common.createText(length)
+        kana = createKana(text)
+        positions = calculateShiftJisCharacterPositions(text)[1]
+        cases = [
+            ("positions", lambda: legacyCalculateShiftJisCharacterPositions(text), lambda: calculateShiftJisCharacterPositions(text)),
+            ("replace_irq_mark", lambda: legacyReplaceIrqMark(kana, positions), lambda: replaceIrqMark(kana, positions)),
+        ]
+        for name, legacy, current in cases:
+            legacy_time = common.percentile(common.measure(legacy, args.repeat), 50)
+            current_time = common.percentile(common.measure(current, args.repeat), 50)
+            print("{:>8} {:<20} {:>12.3f} {:>12.3f} {:>7.1f}x".format(length, name, legacy_time * 1000, current_time * 1000, legacy_time / current_time))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+# Compare the peak memory of textToSpeech() returning the speech with writing it to a file through sink.
+import tempfile
+import time
+import tracemalloc
+import common
+
+def run(args, vc, text, use_sink):
+    tracemalloc.start()
+    start = time.perf_counter()
+    if use_sink:
+        with tempfile.TemporaryFile() as f:
+            size, _ = vc.textToSpeech(text, sink = f)
+    else:
+        speech, _ = vc.textToSpeech(text)
+        size = len(speech)
+        del speech
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"seconds": elapsed, "bytes": size, "peak_bytes": peak}
+
+def main():
+    parser = common.createArgumentParser("Compare the peak memory with and without sink")
+    parser.add_argument("--length", default = "1000,4000", help = "comma separated numbers of characters to try")
+    parser.set_defaults(msec_per_char = 100, real_time_factor = 0.0)
+    args = parser.parse_args()
+
+    results = []
+    print("{:>8} {:>6} {:>12} {:>12} {:>10}".format("length", "sink", "speech[MB]", "peak[MB]", "seconds"))
+    with common.openVcRoid2(args) as vc:
+        for length in [int(value) for value in args.length.split(",")]:
+            text = common.createText(length)
+            for use_sink in (False, True):
+                result = run(args, vc, text, use_sink)
+                result.update(length = length, sink = use_sink)
+                results.append(result)
+                print("{:>8} {:>6} {:>12.1f} {:>12.1f} {:>10.3f}".format(length, str(use_sink), result["bytes"] / 1e6, result["peak_bytes"] / 1e6, result["seconds"]))
+    common.saveResults(args, "sink", results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+# Measure the latency of switching voices for dialogue that alternates between characters.
+#   resident : all voices stay loaded and switching selects their cached parameters
+#   reload   : max_voices=1, every switch loads the voice again as loadVoice always did
+import time
+import common
+
+def run(args, voices, max_voices):
+    with common.openVcRoid2(args, {"max_voices": max_voices}, voices = voices, voice_load_cost = args.voice_load_cost) as vc:
+        kana = vc.textToKana(common.createText(args.length))
+        vc.preloadVoices(voices[0:max_voices])
+        switches = []
+        start = time.perf_counter()
+        for index in range(args.lines):
+            vc.loadVoice(voices[index % len(voices)])
+            switches.append(vc.voiceSwitchTime)
+            vc.kanaToSpeech(kana)
+        elapsed = time.perf_counter() - start
+    return elapsed, switches
+
+def main():
+    parser = common.createArgumentParser("Measure the latency of switching voices")
+    parser.add_argument("--voices", type = int, default = 4, help = "number of voices the dialogue alternates between (simulated)")
+    parser.add_argument("--voice-names", help = "comma separated voice libraries the dialogue alternates between (dll)")
+    parser.add_argument("--lines", type = int, default = 40, help = "number of lines of the dialogue")
+    parser.add_argument("--length", type = int, default = 20, help = "characters per line")
+    parser.add_argument("--voice-load-cost", type = float, default = 0.02, help = "seconds spent in AITalkAPI_VoiceLoad (simulated)")
+    args = parser.parse_args()
+    if args.voice_names is not None:
+        voices = args.voice_names.split(",")
+    else:
+        voices = ["voice{}".format(index) for index in range(args.voices)]
+    args.voice = voices[0]
+
+    results = {}
+    print("{:>10} {:>10} {:>14} {:>14}".format("case", "seconds", "switch p50[ms]", "switch p99[ms]"))
+    for name, max_voices in (("resident", len(voices)), ("reload", 1)):
+        elapsed, switches = run(args, voices, max_voices)
+        summary = common.summarize(switches)
+        results[name] = {"seconds": elapsed, "switch": summary}
+        print("{:>10} {:>10.3f} {:>14.3f} {:>14.3f}".format(name, elapsed, summary["p50"] * 1000, summary["p99"] * 1000))
+    common.saveResults(args, "voices", results)
+
+if __name__ == "__main__":
+    main()
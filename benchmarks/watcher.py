@@ -0,0 +1,66 @@
+# Measure the stall of the conversions when the user dictionary is polled by reloading it unconditionally
+# compared with DictionaryWatcher, which reloads it only when the file changed.
+import os
+import tempfile
+import threading
+import time
+import common
+from pyvcroid2.watcher import DictionaryWatcher
+
+def main():
+    parser = common.createArgumentParser("Compare reloading the user dictionary unconditionally with DictionaryWatcher")
+    parser.add_argument("--length", type = int, default = 50, help = "characters per request")
+    parser.add_argument("--requests", type = int, default = 100, help = "number of requests per thread")
+    parser.add_argument("--threads", type = int, default = 4, help = "number of threads sending requests")
+    parser.add_argument("--interval", type = float, default = 0.01, help = "seconds between the polls")
+    parser.add_argument("--dictionary", help = "path of the word dictionary, an empty file is created if not specified")
+    parser.set_defaults(real_time_factor = 0.01)
+    args = parser.parse_args()
+    text = common.createText(args.length)
+
+    path = args.dictionary
+    if path is None:
+        path = os.path.join(tempfile.mkdtemp(), "user.wdic")
+        open(path, "wb").close()
+
+    results = {}
+    with common.openVcRoid2(args, {"max_jobs": args.threads}) as vc:
+        watcher = DictionaryWatcher(vc, word = path, settle = 0)
+        watcher.check()
+        polls = {
+            "none": lambda: None,
+            "reload": lambda: vc.reloadWordDictionary(path),
+            "watcher": watcher.check,
+        }
+        for name, poll in polls.items():
+            latencies = []
+            def send():
+                for _ in range(args.requests):
+                    start = time.perf_counter()
+                    vc.textToSpeech(text, raw = True)
+                    latencies.append(time.perf_counter() - start)
+
+            def run():
+                threads = [threading.Thread(target = send) for _ in range(args.threads)]
+                for thread in threads:
+                    thread.start()
+                while any(thread.is_alive() for thread in threads):
+                    poll()
+                    time.sleep(args.interval)
+                for thread in threads:
+                    thread.join()
+
+            total = common.measure(run, args.repeat)
+            results[name] = {"total": common.summarize(total), "request": common.summarize(latencies)}
+
+    if args.dictionary is None:
+        os.remove(path)
+        os.rmdir(os.path.dirname(path))
+
+    for name, result in results.items():
+        print("{:8}: total {:8.2f} ms, request p50 {:8.2f} ms, p99 {:8.2f} ms".format(name, result["total"]["p50"] * 1000,
+            result["request"]["p50"] * 1000, result["request"]["p99"] * 1000))
+    common.saveResults(args, "watcher", results)
+
+if __name__ == "__main__":
+    main()
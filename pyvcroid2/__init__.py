@@ -1,3 +1,14 @@
-from .pyvcroid2 import VcRoid2, TtsEventType
+from .events import TtsEventType
 
 __version__ = "0.2.2"
+
+def __getattr__(name):
+    # VcRoid2 is imported on first use so that importing the package stays cheap and loads no engine
+    if name == "VcRoid2":
+        from .pyvcroid2 import VcRoid2
+        globals()["VcRoid2"] = VcRoid2
+        return VcRoid2
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+def __dir__():
+    return sorted(list(globals()) + ["VcRoid2"])
@@ -103,11 +103,36 @@ class TSpeakerParam(Structure):
     ]
     _pack_ = 1
 
-ProcTextBuf = WINFUNCTYPE(c_int32, c_int32, c_int32, c_void_p)
-ProcRawBuf = WINFUNCTYPE(c_int32, c_int32, c_int32, c_uint64, c_void_p)
-ProcEventTts = WINFUNCTYPE(c_int32, c_int32, c_int32, c_uint64, c_char_p, c_void_p)
+_FUNCTION_TYPES = ("ProcTextBuf", "ProcRawBuf", "ProcEventTts")
+
+def __getattr__(name):
+    # The types of the callbacks are created on first use, see _CreateFunctionTypes()
+    if name in _FUNCTION_TYPES:
+        _CreateFunctionTypes()
+        return globals()[name]
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+def _CreateFunctionTypes():
+    global ProcTextBuf, ProcRawBuf, ProcEventTts
+    if "ProcTextBuf" in globals():
+        return
+    try:
+        function_type = WINFUNCTYPE
+    except NameError:
+        # The calling convention only matters to the DLL which exists on Windows
+        function_type = CFUNCTYPE
+    ProcTextBuf = function_type(c_int32, c_int32, c_int32, c_void_p)
+    ProcRawBuf = function_type(c_int32, c_int32, c_int32, c_uint64, c_void_p)
+    ProcEventTts = function_type(c_int32, c_int32, c_int32, c_uint64, c_char_p, c_void_p)
+
+_TTS_PARAM_CLASSES = {}
 
 def createTtsParam(speaker_count):
+    # Structures of the same size are shared since ctypes classes are expensive to create
+    TTtsParam = _TTS_PARAM_CLASSES.get(speaker_count)
+    if TTtsParam is not None:
+        return TTtsParam
+    _CreateFunctionTypes()
     class TTtsParam(Structure):
         _fields_ = [
             ("size", c_uint32),
@@ -127,5 +152,5 @@ def createTtsParam(speaker_count):
             ("speaker", TSpeakerParam * speaker_count)
         ]
         _pack_ = 1
-    return TTtsParam
+    return _TTS_PARAM_CLASSES.setdefault(speaker_count, TTtsParam)
 
@@ -0,0 +1,131 @@
+import re
+
+# Bookmark put before each item of a batch of AIKANA
+_MARK = "_BATCH@"
+_AUTO_MARK = re.compile(r"\(Irq MARK=_AI@([0-9]+)\)")
+
+def joinTexts(texts):
+    '''
+    Join texts into one text in which each of them starts a sentence
+
+    Parameters
+    ----------
+    texts : string[]
+        The texts to join.
+
+    Returns
+    -------
+    text : string
+        The joined text.
+    offsets : int[]
+        Offset of each text in the joined text.
+    '''
+    offsets = []
+    offset = 0
+    for text in texts:
+        offsets.append(offset)
+        offset += len(text) + 1
+    return "\n".join(texts), offsets
+
+def splitKana(kana, offsets):
+    '''
+    Split AIKANA converted from the text joined by joinTexts() at the AUTO_BOOKMARK marks
+
+    Each text gets the AIKANA from the first mark inside it to the first mark inside the next one,
+    and the positions of its marks are made relative to it.
+
+    Parameters
+    ----------
+    kana : string
+        AIKANA whose marks are character positions in the joined text.
+    offsets : int[]
+        Offsets returned by joinTexts().
+
+    Returns
+    -------
+    kana_list : string[]
+        AIKANA of each text, None if no mark falls inside the text.
+    '''
+    starts = [None] * len(offsets)
+    marks = list(_AUTO_MARK.finditer(kana))
+    item = 0
+    for mark in marks:
+        position = int(mark.group(1))
+        while (item + 1 < len(offsets)) and (offsets[item + 1] <= position):
+            item += 1
+        if (offsets[item] <= position) and (starts[item] is None):
+            starts[item] = mark.start()
+
+    # The AIKANA before the first mark belongs to the first text
+    found = [index for index, start in enumerate(starts) if start is not None]
+    if 0 < len(found):
+        starts[found[0]] = 0
+    kana_list = [None] * len(offsets)
+    for order, index in enumerate(found):
+        end = starts[found[order + 1]] if order + 1 < len(found) else len(kana)
+        offset = offsets[index]
+        kana_list[index] = _AUTO_MARK.sub(lambda match: "(Irq MARK=_AI@{})".format(int(match.group(1)) - offset), kana[starts[index]:end])
+    return kana_list
+
+def joinKana(kana_list):
+    '''
+    Join AIKANA into one putting a bookmark before each of them
+
+    Parameters
+    ----------
+    kana_list : string[]
+        The AIKANA to join.
+
+    Returns
+    -------
+    kana : string
+        The joined AIKANA.
+    '''
+    return "".join("(Irq MARK={}{}){}".format(_MARK, index, kana) for index, kana in enumerate(kana_list))
+
+def splitSpeech(speech, tts_events, count, sample_rate):
+    '''
+    Split the speech of AIKANA joined by joinKana() at the ticks of the bookmarks
+
+    The speech is cut at the millisecond of each bookmark.
+
+    Parameters
+    ----------
+    speech : bytes
+        Raw binary of the speech.
+    tts_events : []
+        Event data of the speech.
+    count : int
+        Number of the joined AIKANA.
+    sample_rate : int
+        Sampling rate of the speech in Hz.
+
+    Returns
+    -------
+    items : [(memoryview, [])]
+        Speech and event data of each AIKANA, whose ticks are relative to it.
+        None if the bookmarks are not reported in order.
+    '''
+    starts = []
+    events = []
+    for event in tts_events:
+        tick, _, value = event
+        if isinstance(value, str) and value.startswith(_MARK):
+            if value != _MARK + str(len(starts)):
+                return None
+            starts.append(tick)
+            events.append([])
+        elif 0 < len(events):
+            events[-1].append(event)
+    if len(starts) != count:
+        return None
+
+    view = memoryview(speech)
+    total = len(speech) // 2
+    items = []
+    for index in range(count):
+        start = min(total, starts[index] * sample_rate // 1000)
+        end = total if index + 1 == count else min(total, starts[index + 1] * sample_rate // 1000)
+        rebased = [(tick - starts[index], event_type, value) for tick, event_type, value in events[index]]
+        items.append((view[start * 2:max(start, end) * 2], rebased))
+    return items
@@ -0,0 +1,87 @@
+class BufferSizes(object):
+    '''
+    Immutable sizes of the buffers a conversion runs with.
+
+    text_buf_bytes is lenTextBufBytes of the engine, which is the interval of TEXTBUF_FULL,
+    and the size of the buffer AITalkAPI_GetKana reads into.
+    raw_buf_bytes is lenRawBufBytes of the engine, which is the interval of RAWBUF_FULL,
+    and half the size of the buffer AITalkAPI_GetData reads into.
+    Small buffers deliver the first chunk sooner at the cost of more callbacks, each of which acquires the GIL.
+    '''
+
+    def __init__(self, *, text_buf_bytes = None, raw_buf_bytes = None):
+        '''
+        Parameters
+        ----------
+        text_buf_bytes : int
+            Size of the text buffer in bytes. The default of the voice if None.
+        raw_buf_bytes : int
+            Size of the raw buffer in bytes. The default of the voice if None.
+        '''
+        if (text_buf_bytes is not None) and (text_buf_bytes < 2):
+            raise ValueError("text_buf_bytes must be at least 2")
+        if (raw_buf_bytes is not None) and (raw_buf_bytes < 2):
+            raise ValueError("raw_buf_bytes must be at least 2")
+        self.__values = (
+            None if text_buf_bytes is None else int(text_buf_bytes),
+            None if raw_buf_bytes is None else int(raw_buf_bytes) & ~1,
+        )
+
+    def __eq__(self, other):
+        if not isinstance(other, BufferSizes):
+            return NotImplemented
+        return self.__values == other.__values
+
+    def __hash__(self):
+        return hash(self.__values)
+
+    def __repr__(self):
+        return "BufferSizes(text_buf_bytes = {!r}, raw_buf_bytes = {!r})".format(*self.__values)
+
+    @property
+    def textBufBytes(self):
+        '''
+        Size of the text buffer in bytes, None for the default : int
+        '''
+        return self.__values[0]
+
+    @property
+    def rawBufBytes(self):
+        '''
+        Size of the raw buffer in bytes, None for the default : int
+        '''
+        return self.__values[1]
+
+# Sizes of the streaming conversions, a chunk of 50 msec of speech
+LATENCY = BufferSizes(text_buf_bytes = 1024, raw_buf_bytes = 4410)
+# Sizes of the conversions returning the whole speech, a chunk of 5 seconds of speech
+THROUGHPUT = BufferSizes(text_buf_bytes = 65536, raw_buf_bytes = 441000)
+# The default of the voice
+DEFAULT = BufferSizes()
+
+_PROFILES = {"latency": LATENCY, "throughput": THROUGHPUT, "default": DEFAULT}
+
+def resolveBufferSizes(buffers, streaming):
+    '''
+    Select the sizes of the buffers of a conversion
+
+    Parameters
+    ----------
+    buffers : BufferSizes or string
+        The sizes, "latency", "throughput", "default" or
+        "adaptive" which is "latency" for streaming conversions and "throughput" for the others.
+    streaming : boolean
+        True if the conversion hands out the speech while the engine produces it.
+
+    Returns
+    -------
+    sizes : BufferSizes
+    '''
+    if isinstance(buffers, BufferSizes):
+        return buffers
+    if buffers == "adaptive":
+        return LATENCY if streaming else THROUGHPUT
+    sizes = _PROFILES.get(buffers)
+    if sizes is None:
+        raise ValueError("unknown buffer sizes: {}".format(buffers))
+    return sizes
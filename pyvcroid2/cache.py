@@ -0,0 +1,434 @@
+import collections
+import hashlib
+import json
+import mmap
+import os
+import sys
+import tempfile
+import threading
+from .events import TtsEventType
+
+class _LruDict(object):
+    # Least recently used mapping bounded by the total size of the values
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.evictions = 0
+        self.__items = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self.__items)
+
+    def get(self, key):
+        item = self.__items.get(key)
+        if item is None:
+            return None
+        self.__items.move_to_end(key)
+        return item[0]
+
+    def put(self, key, value, size):
+        self.pop(key)
+        if self.max_bytes < size:
+            return
+        self.__items[key] = (value, size)
+        self.size += size
+        while self.max_bytes < self.size:
+            _, (_, evicted_size) = self.__items.popitem(last = False)
+            self.size -= evicted_size
+            self.evictions += 1
+
+    def pop(self, key):
+        item = self.__items.pop(key, None)
+        if item is not None:
+            self.size -= item[1]
+        return item
+
+    def items(self):
+        return [(key, item[0]) for key, item in self.__items.items()]
+
+    def clear(self):
+        self.__items.clear()
+        self.size = 0
+
+class _DiskStore(object):
+    # Files named by the key under the directory, bounded by the total size with the oldest mtime evicted first
+    def __init__(self, directory, max_bytes, suffix):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self.__suffix = suffix
+        self.__lock = threading.Lock()
+        os.makedirs(directory, exist_ok = True)
+        self.size = sum(size for _, _, size in self.__scan())
+
+    def path(self, key):
+        return os.path.join(self.directory, key[0:2], key + self.__suffix)
+
+    def touch(self, path):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def write(self, key, data):
+        # The file is written without the lock, which only guards the size accounting and the renaming.
+        # An existing file is kept since the key identifies the content and the file may be mapped.
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        fd, temp_path = tempfile.mkstemp(dir = os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for part in data:
+                    f.write(part)
+            with self.__lock:
+                if os.path.exists(path):
+                    os.remove(temp_path)
+                    return
+                size = os.path.getsize(temp_path)
+                os.replace(temp_path, path)
+                self.size += size
+                if self.max_bytes < self.size:
+                    self.__evict()
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def remove(self, path):
+        with self.__lock:
+            self.__remove(path)
+
+    def __remove(self, path):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+            self.size -= size
+        except OSError:
+            pass
+
+    def __scan(self):
+        result = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith(self.__suffix):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    result.append((stat.st_mtime, path, stat.st_size))
+        return result
+
+    def __evict(self):
+        # Shrink to 90% so that eviction does not run on every write
+        entries = sorted(self.__scan())
+        self.size = sum(size for _, _, size in entries)
+        for _, path, _ in entries:
+            if self.size <= self.max_bytes * 0.9:
+                break
+            self.__remove(path)
+            self.evictions += 1
+
+class KanaCache(object):
+    '''
+    Cache of the results of VcRoid2.textToKana().
+
+    Entries are keyed by the text and a context string which identifies the loaded language and dictionaries.
+    Recently used entries are kept in memory up to max_bytes,
+    and all entries are also stored under directory if specified so that they survive restarts.
+    '''
+
+    def __init__(self, *, max_bytes = 16 * 1024 * 1024, directory = None, max_disk_bytes = 256 * 1024 * 1024):
+        '''
+        Parameters
+        ----------
+        max_bytes : int
+            Upper limit of the memory used by the entries in bytes.
+        directory : string
+            Directory to store the entries in. Nothing is stored on disk if None.
+        max_disk_bytes : int
+            Upper limit of the total size of the files in bytes.
+        '''
+        self.__lock = threading.Lock()
+        self.__memory = _LruDict(max_bytes)
+        self.__disk = None if directory is None else _DiskStore(directory, max_disk_bytes, ".kana")
+        self.__hits = 0
+        self.__disk_hits = 0
+        self.__misses = 0
+
+    @property
+    def hits(self):
+        '''
+        Number of lookups found in memory or on disk : int
+        '''
+        return self.__hits
+
+    @property
+    def diskHits(self):
+        '''
+        Number of lookups found on disk but not in memory : int
+        '''
+        return self.__disk_hits
+
+    @property
+    def misses(self):
+        '''
+        Number of lookups not found : int
+        '''
+        return self.__misses
+
+    @property
+    def evictions(self):
+        '''
+        Number of entries evicted from memory and disk : int
+        '''
+        return self.__memory.evictions + (0 if self.__disk is None else self.__disk.evictions)
+
+    @property
+    def size(self):
+        '''
+        Memory used by the entries in bytes : int
+        '''
+        return self.__memory.size
+
+    def get(self, context, text):
+        '''
+        Look up AIKANA
+
+        Parameters
+        ----------
+        context : string
+            Identifier of the language and dictionaries.
+        text : string
+            The text converted by textToKana().
+
+        Returns
+        -------
+        kana : string or None
+        '''
+        key = KanaCache.__CreateKey(context, text)
+        with self.__lock:
+            item = self.__memory.get(key)
+            if item is not None:
+                self.__hits += 1
+                return item[1]
+        kana = None
+        if self.__disk is not None:
+            path = self.__disk.path(key)
+            try:
+                with open(path, "rb") as f:
+                    kana = f.read().decode("utf-8")
+                self.__disk.touch(path)
+            except OSError:
+                kana = None
+        with self.__lock:
+            if kana is None:
+                self.__misses += 1
+                return None
+            self.__hits += 1
+            self.__disk_hits += 1
+            self.__memory.put(key, (context, kana), KanaCache.__Size(text, kana))
+        return kana
+
+    def put(self, context, text, kana):
+        '''
+        Store AIKANA
+
+        Parameters
+        ----------
+        context : string
+            Identifier of the language and dictionaries.
+        text : string
+            The text converted by textToKana().
+        kana : string
+            The result of textToKana().
+        '''
+        key = KanaCache.__CreateKey(context, text)
+        with self.__lock:
+            self.__memory.put(key, (context, kana), KanaCache.__Size(text, kana))
+        # The file is written without the lock so that lookups do not wait for the disk
+        if (self.__disk is not None) and not os.path.exists(self.__disk.path(key)):
+            self.__disk.write(key, [kana.encode("utf-8")])
+
+    def invalidate(self, context):
+        '''
+        Drop the entries of the context from memory.
+        The entries on disk are kept since they become valid again when the same context comes back.
+        '''
+        with self.__lock:
+            for key, item in self.__memory.items():
+                if item[0] == context:
+                    self.__memory.pop(key)
+
+    def clear(self):
+        '''
+        Drop all entries from memory.
+        '''
+        with self.__lock:
+            self.__memory.clear()
+
+    def __CreateKey(context, text):
+        return hashlib.sha256(context.encode("utf-8") + b"\x00" + text.encode("utf-8")).hexdigest()
+
+    def __Size(text, kana):
+        return sys.getsizeof(text) + sys.getsizeof(kana)
+
+class AudioCache(object):
+    '''
+    Cache of the results of VcRoid2.kanaToSpeech().
+
+    Entries are keyed by a string which identifies the AIKANA, the voice and the parameters,
+    see VcRoid2.kanaToSpeech() for how VcRoid2 creates it.
+    The AIKANA reflects the user dictionaries, so the entries stay valid when they are reloaded.
+    Recently used entries are kept in memory up to max_bytes,
+    and all entries are also stored under directory if specified.
+    Entries found on disk are memory-mapped so that get() does not copy the audio into Python objects.
+    VcRoid2.kanaToSpeech() copies it once into bytes when neither output nor sink is specified,
+    and writes it straight into them otherwise.
+    '''
+    __MAGIC = b"PVC2AUD1"
+    __MAX_MAPPED_FILES = 64
+
+    def __init__(self, *, max_bytes = 256 * 1024 * 1024, directory = None, max_disk_bytes = 4 * 1024 * 1024 * 1024):
+        '''
+        Parameters
+        ----------
+        max_bytes : int
+            Upper limit of the memory used by the audio in bytes.
+        directory : string
+            Directory to store the entries in. Nothing is stored on disk if None.
+        max_disk_bytes : int
+            Upper limit of the total size of the files in bytes.
+        '''
+        self.__lock = threading.Lock()
+        self.__memory = _LruDict(max_bytes)
+        self.__disk = None if directory is None else _DiskStore(directory, max_disk_bytes, ".audio")
+        self.__mapped = collections.OrderedDict()
+        self.__hits = 0
+        self.__disk_hits = 0
+        self.__misses = 0
+
+    @property
+    def hits(self):
+        '''
+        Number of lookups found in memory or on disk : int
+        '''
+        return self.__hits
+
+    @property
+    def diskHits(self):
+        '''
+        Number of lookups found on disk but not in memory : int
+        '''
+        return self.__disk_hits
+
+    @property
+    def misses(self):
+        '''
+        Number of lookups not found : int
+        '''
+        return self.__misses
+
+    @property
+    def evictions(self):
+        '''
+        Number of entries evicted from memory and disk : int
+        '''
+        return self.__memory.evictions + (0 if self.__disk is None else self.__disk.evictions)
+
+    @property
+    def size(self):
+        '''
+        Memory used by the audio in bytes : int
+        '''
+        return self.__memory.size
+
+    def get(self, key):
+        '''
+        Look up audio
+
+        Parameters
+        ----------
+        key : string
+            Identifier of the AIKANA, the voice and the parameters.
+
+        Returns
+        -------
+        speech : memoryview or None
+            Raw binary of the speech, which is read-only.
+        tts_events : []
+            Event data.
+        '''
+        with self.__lock:
+            item = self.__memory.get(key)
+            if item is None:
+                item = self.__mapped.get(key)
+                if item is not None:
+                    self.__mapped.move_to_end(key)
+                    self.__disk_hits += 1
+            if item is not None:
+                self.__hits += 1
+                return item[0], list(item[1])
+        item = None if self.__disk is None else self.__map(key)
+        with self.__lock:
+            if item is None:
+                self.__misses += 1
+                return None
+            self.__hits += 1
+            self.__disk_hits += 1
+            self.__mapped[key] = item
+            while AudioCache.__MAX_MAPPED_FILES < len(self.__mapped):
+                # The mapping is closed when the views handed out are released
+                self.__mapped.popitem(last = False)
+        return item[0], list(item[1])
+
+    def put(self, key, speech, tts_events):
+        '''
+        Store audio
+
+        Parameters
+        ----------
+        key : string
+            Identifier of the AIKANA, the voice and the parameters.
+        speech : bytes-like object
+            Raw binary of the speech.
+            A memoryview of bytes is kept as it is, other objects are copied.
+        tts_events : []
+            Event data.
+        '''
+        speech = memoryview(speech).cast("B")
+        if not isinstance(speech.obj, bytes):
+            speech = memoryview(speech.tobytes())
+        speech = speech.toreadonly()
+        tts_events = list(tts_events)
+        with self.__lock:
+            self.__memory.put(key, (speech, tts_events), len(speech))
+        if (self.__disk is not None) and not os.path.exists(self.__disk.path(key)):
+            # The file is written without the lock so that lookups do not wait for the disk
+            events = json.dumps([[tick, event_type.value, value] for tick, event_type, value in tts_events], ensure_ascii = False).encode("utf-8")
+            self.__disk.write(key, [AudioCache.__MAGIC, len(events).to_bytes(4, byteorder = "little"), events, speech])
+
+    def clear(self):
+        '''
+        Drop all entries from memory.
+        '''
+        with self.__lock:
+            self.__memory.clear()
+            self.__mapped.clear()
+
+    def __map(self, key):
+        path = self.__disk.path(key)
+        try:
+            with open(path, "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        view = memoryview(mapped)
+        header_size = len(AudioCache.__MAGIC) + 4
+        if (len(view) < header_size) or (view[0:len(AudioCache.__MAGIC)] != AudioCache.__MAGIC):
+            return None
+        events_size = int.from_bytes(view[len(AudioCache.__MAGIC):header_size], byteorder = "little")
+        events = json.loads(view[header_size:header_size + events_size].tobytes().decode("utf-8"))
+        self.__disk.touch(path)
+        tts_events = [(tick, TtsEventType(event_type), value) for tick, event_type, value in events]
+        return view[header_size + events_size:], tts_events
@@ -0,0 +1,182 @@
+import http.client
+import json
+import socket
+from .events import TtsEventType
+from .output import WAVE_HEADER_SIZE, createWaveHeader
+from .protocol import FRAME_AUDIO, FRAME_EVENTS, FRAME_ERROR, FRAME_END, readFrame
+
+class _UnixConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout):
+        super().__init__("localhost", timeout = timeout)
+        self.__path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.__path)
+
+class VcRoid2Client(object):
+    '''
+    Client of daemon.Daemon having the methods of VcRoid2 which convert text and AIKANA.
+
+    The client only holds the address, each call opens its own connection and closes it when finished,
+    so that it is cheap to create and safe to share between threads.
+    '''
+
+    def __init__(self, *, unix_path = None, host = "127.0.0.1", port = 50080, timeout = None):
+        '''
+        Parameters
+        ----------
+        unix_path : string
+            If specified, the path of the Unix domain socket of the daemon instead of TCP.
+        host : string
+            Address of the daemon.
+        port : int
+            Port of the daemon.
+        timeout : float
+            Timeout of the socket operations in seconds.
+        '''
+        self.__unix_path = unix_path
+        self.__host = host
+        self.__port = port
+        self.__timeout = timeout
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    def status(self):
+        '''
+        Acquire the state of the daemon
+
+        Returns
+        -------
+        status : dict
+            "queued", "max_queue", "workers" and "voices".
+        '''
+        return self.__get("/status")
+
+    def listLanguages(self):
+        '''
+        Acquire list of installed language library of the daemon. See VcRoid2.listLanguages().
+        '''
+        return self.__get("/listLanguages")
+
+    def listVoices(self):
+        '''
+        Acquire list of installed voice library of the daemon. See VcRoid2.listVoices().
+        '''
+        return self.__get("/listVoices")
+
+    def textToKana(self, text, *, timeout = None):
+        '''
+        Convert text to AIKANA in the daemon. See VcRoid2.textToKana().
+        '''
+        connection, response = self.__post("textToKana", {"text": text, "timeout": timeout})
+        try:
+            return json.loads(response.read().decode("utf-8"))["result"]
+        finally:
+            connection.close()
+
+    def kanaToSpeech(self, kana, *, timeout = None, raw = False, preset = None):
+        '''
+        Convert AIKANA to audio data in the daemon. See VcRoid2.kanaToSpeech().
+        '''
+        return VcRoid2Client.__Collect(self.kanaToSpeechStream(kana, timeout = timeout, raw = raw, preset = preset), raw)
+
+    def textToSpeech(self, text, *, timeout = None, raw = False, chunk_length = None, preset = None):
+        '''
+        Convert text to audio data in the daemon. See VcRoid2.textToSpeech().
+        '''
+        return VcRoid2Client.__Collect(self.textToSpeechStream(text, timeout = timeout, raw = raw, chunk_length = chunk_length, preset = preset), raw)
+
+    def kanaToSpeechStream(self, kana, *, timeout = None, raw = True, preset = None):
+        '''
+        Convert AIKANA to audio data in the daemon, yielding each chunk as soon as it arrives.
+        See VcRoid2.kanaToSpeechStream().
+        '''
+        return self.__stream("kanaToSpeech", {"kana": kana, "timeout": timeout, "raw": raw, "preset": VcRoid2Client.__PresetValues(preset)})
+
+    def textToSpeechStream(self, text, *, timeout = None, raw = True, chunk_length = None, preset = None):
+        '''
+        Convert text to audio data in the daemon, yielding each chunk as soon as it arrives.
+        See VcRoid2.textToSpeechStream().
+        '''
+        return self.__stream("textToSpeech", {"text": text, "timeout": timeout, "raw": raw, "chunk_length": chunk_length, "preset": VcRoid2Client.__PresetValues(preset)})
+
+    def __connect(self):
+        if self.__unix_path is not None:
+            return _UnixConnection(self.__unix_path, self.__timeout)
+        return http.client.HTTPConnection(self.__host, self.__port, timeout = self.__timeout)
+
+    def __get(self, path):
+        connection = self.__connect()
+        try:
+            connection.request("GET", path, headers = {"Connection": "close"})
+            response = connection.getresponse()
+            body = json.loads(response.read().decode("utf-8"))
+            if response.status != 200:
+                raise RuntimeError(body.get("error"))
+            return body
+        finally:
+            connection.close()
+
+    def __post(self, method, arguments):
+        connection = self.__connect()
+        try:
+            connection.request("POST", "/" + method, json.dumps(arguments, ensure_ascii = False).encode("utf-8"),
+                {"Content-Type": "application/json", "Connection": "close"})
+            response = connection.getresponse()
+            if response.status != 200:
+                body = json.loads(response.read().decode("utf-8"))
+                raise RuntimeError(body.get("error"))
+        except BaseException:
+            connection.close()
+            raise
+        return connection, response
+
+    def __stream(self, method, arguments):
+        # The request is sent before the first chunk is requested so that a full queue is reported at once
+        connection, response = self.__post(method, arguments)
+        return VcRoid2Client.__ReadFrames(connection, response)
+
+    def __ReadFrames(connection, response):
+        try:
+            data = None
+            while True:
+                kind, payload = readFrame(response)
+                if kind == FRAME_AUDIO:
+                    if data is not None:
+                        yield data, []
+                    data = payload
+                elif kind == FRAME_EVENTS:
+                    events = [(tick, TtsEventType(event_type), value) for tick, event_type, value in json.loads(payload.decode("utf-8"))]
+                    yield (b"" if data is None else data), events
+                    data = None
+                elif kind == FRAME_ERROR:
+                    raise RuntimeError(json.loads(payload.decode("utf-8")).get("error"))
+                elif kind == FRAME_END:
+                    if data is not None:
+                        yield data, []
+                    return
+                else:
+                    raise EOFError("stream is truncated")
+        finally:
+            connection.close()
+
+    def __Collect(stream, raw):
+        data = bytearray()
+        tts_events = []
+        for chunk, events in stream:
+            data += chunk
+            tts_events.extend(events)
+        if not raw:
+            # The daemon streams the header with unknown sizes
+            data[0:WAVE_HEADER_SIZE] = createWaveHeader(len(data) - WAVE_HEADER_SIZE)
+        return bytes(data), tts_events
+
+    def __PresetValues(preset):
+        return None if preset is None else preset.toDict()
@@ -0,0 +1,330 @@
+import argparse
+import http.server
+import json
+import os
+import queue
+import socketserver
+import threading
+from .pyvcroid2 import VcRoid2
+from .preset import Preset
+from .protocol import FRAME_AUDIO, FRAME_EVENTS, FRAME_ERROR, FRAME_END, encodeFrame, encodeJson
+
+class _Request(object):
+    # A request handed from the HTTP handler to a worker, whose results come back through replies
+    def __init__(self, method, arguments):
+        self.method = method
+        self.arguments = arguments
+        self.replies = queue.Queue(maxsize = 8)
+        self.cancelled = threading.Event()
+
+    def reply(self, item):
+        # Blocks while the client reads slowly, returns False once the client has gone
+        while not self.cancelled.is_set():
+            try:
+                self.replies.put(item, timeout = 0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def address_string(self):
+        # The address of a client of a Unix domain socket is empty
+        return self.client_address[0] if isinstance(self.client_address, tuple) and (0 < len(self.client_address)) else "local"
+
+    def log_message(self, format, *args):
+        if self.server.daemon.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        daemon = self.server.daemon
+        if self.path == "/status":
+            self.__sendJson(200, daemon.status())
+        elif self.path == "/listLanguages":
+            self.__sendJson(200, daemon.listLanguages())
+        elif self.path == "/listVoices":
+            self.__sendJson(200, daemon.listVoices())
+        else:
+            self.__sendJson(404, {"error": "not found"})
+
+    def do_POST(self):
+        daemon = self.server.daemon
+        method = self.path.lstrip("/")
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            arguments = json.loads(self.rfile.read(length).decode("utf-8")) if 0 < length else {}
+        except ValueError:
+            self.__sendJson(400, {"error": "invalid request"})
+            return
+        if method not in Daemon.METHODS:
+            self.__sendJson(404, {"error": "not found"})
+            return
+        request = _Request(method, arguments)
+        if not daemon.submit(request):
+            # Backpressure: the client retries later instead of the queue growing without bound
+            self.send_response(503)
+            self.send_header("Retry-After", "1")
+            self.__sendJson(None, {"error": "queue is full"})
+            return
+        try:
+            self.__respond(request)
+        except OSError:
+            pass
+        finally:
+            request.cancelled.set()
+
+    def __respond(self, request):
+        item = request.replies.get()
+        if item[0] == "error":
+            self.__sendJson(500, {"error": item[1]})
+            return
+        if item[0] == "result":
+            self.__sendJson(200, {"result": item[1]})
+            return
+
+        # The speech is streamed as chunks of the chunked transfer encoding as soon as the engine produces it
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-pyvcroid2-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        while True:
+            if item[0] == "audio":
+                _, data, events = item
+                frame = encodeFrame(FRAME_AUDIO, data)
+                if 0 < len(events):
+                    frame += encodeFrame(FRAME_EVENTS, encodeJson([[tick, event_type.value, value] for tick, event_type, value in events]))
+            elif item[0] == "error":
+                frame = encodeFrame(FRAME_ERROR, encodeJson({"error": item[1]}))
+            else:
+                frame = encodeFrame(FRAME_END)
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(frame), frame))
+            if item[0] != "audio":
+                break
+            item = request.replies.get()
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def __sendJson(self, status, value):
+        body = encodeJson(value)
+        if status is not None:
+            self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class _TcpServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+class Daemon(object):
+    '''
+    Server keeping VcRoid2 objects with their language and voice loaded
+    so that short-lived clients do not pay for the initialization.
+
+    Requests are accepted over local HTTP or HTTP over a Unix domain socket and put into a bounded queue,
+    from which one worker per job the engines run at the same time takes them.
+    When the queue is full the request is refused with 503 so that the clients back off.
+    The speech is streamed in chunks as soon as the engine produces it. See client.VcRoid2Client.
+    '''
+    METHODS = ("textToKana", "kanaToSpeech", "textToSpeech")
+
+    def __init__(self, engines, *, unix_path = None, host = "127.0.0.1", port = 0, max_queue = 16, verbose = False):
+        '''
+        Parameters
+        ----------
+        engines : VcRoid2 or VcRoid2[]
+            Opened objects with the language and the voice loaded. The daemon closes them.
+        unix_path : string
+            If specified, the path of the Unix domain socket to listen to instead of TCP.
+        host : string
+            Address to listen to.
+        port : int
+            Port to listen to, 0 to choose a free one.
+        max_queue : int
+            Maximum number of requests waiting for a worker.
+        verbose : boolean
+            If True, each request is logged to stderr.
+        '''
+        if not isinstance(engines, (list, tuple)):
+            engines = [engines]
+        if len(engines) == 0:
+            raise ValueError("engines must not be empty")
+        self.verbose = verbose
+        self.__engines = list(engines)
+        self.__queue = queue.Queue(maxsize = max_queue)
+        self.__max_queue = max_queue
+        self.__unix_path = unix_path
+        if unix_path is not None:
+            if os.path.exists(unix_path):
+                os.remove(unix_path)
+            self.__server = _UnixServer(unix_path, _Handler)
+        else:
+            self.__server = _TcpServer((host, port), _Handler)
+        self.__server.daemon = self
+        self.__thread = None
+        self.__workers = []
+        for vc in self.__engines:
+            for _ in range(vc.maxJobs):
+                worker = threading.Thread(target = self.__work, args = (vc,), daemon = True)
+                worker.start()
+                self.__workers.append(worker)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def address(self):
+        '''
+        Path of the Unix domain socket or (host, port) listened to : string or (string, int)
+        '''
+        if self.__unix_path is not None:
+            return self.__unix_path
+        return self.__server.server_address[0:2]
+
+    def serveForever(self):
+        '''
+        Serve the requests until close() is called
+        '''
+        self.__server.serve_forever()
+
+    def start(self):
+        '''
+        Serve the requests in a background thread
+        '''
+        self.__thread = threading.Thread(target = self.serveForever, daemon = True)
+        self.__thread.start()
+
+    def close(self):
+        '''
+        Stop serving, wait for the workers and close the engines
+        '''
+        if self.__server is None:
+            return
+        if self.__thread is not None:
+            self.__server.shutdown()
+            self.__thread.join()
+        self.__server.server_close()
+        self.__server = None
+        # Refuse the requests still waiting and stop the workers
+        while True:
+            try:
+                request = self.__queue.get_nowait()
+            except queue.Empty:
+                break
+            request.reply(("error", "daemon is closed"))
+        for _ in self.__workers:
+            self.__queue.put(None)
+        for worker in self.__workers:
+            worker.join()
+        for vc in self.__engines:
+            vc.__exit__(None, None, None)
+        if self.__unix_path is not None:
+            try:
+                os.remove(self.__unix_path)
+            except OSError:
+                pass
+
+    def submit(self, request):
+        # Returns False if the queue is full
+        try:
+            self.__queue.put_nowait(request)
+            return True
+        except queue.Full:
+            return False
+
+    def status(self):
+        return {
+            "queued": self.__queue.qsize(),
+            "max_queue": self.__max_queue,
+            "workers": len(self.__workers),
+            "voices": [vc.currentVoice for vc in self.__engines],
+        }
+
+    def listLanguages(self):
+        return self.__engines[0].listLanguages()
+
+    def listVoices(self):
+        return self.__engines[0].listVoices()
+
+    def __work(self, vc):
+        while True:
+            request = self.__queue.get()
+            if request is None:
+                break
+            if request.cancelled.is_set():
+                continue
+            try:
+                arguments = request.arguments
+                timeout = arguments.get("timeout")
+                if request.method == "textToKana":
+                    request.reply(("result", vc.textToKana(arguments["text"], timeout = timeout)))
+                    continue
+                preset = arguments.get("preset")
+                preset = None if preset is None else Preset(**preset)
+                raw = arguments.get("raw", True)
+                if request.method == "textToSpeech":
+                    stream = vc.textToSpeechStream(arguments["text"], timeout = timeout, raw = raw, chunk_length = arguments.get("chunk_length"), preset = preset)
+                else:
+                    stream = vc.kanaToSpeechStream(arguments["kana"], timeout = timeout, raw = raw, preset = preset)
+                try:
+                    for data, events in stream:
+                        if not request.reply(("audio", data, events)):
+                            break
+                finally:
+                    stream.close()
+                request.reply(("end",))
+            except Exception as e:
+                request.reply(("error", "{}: {}".format(type(e).__name__, e)))
+
+def main(argv = None):
+    '''
+    Entry point of python -m pyvcroid2.daemon
+    '''
+    parser = argparse.ArgumentParser(description = "Serve VcRoid2 over local HTTP or a Unix domain socket")
+    parser.add_argument("--unix", help = "path of the Unix domain socket to listen to instead of TCP")
+    parser.add_argument("--host", default = "127.0.0.1", help = "address to listen to")
+    parser.add_argument("--port", type = int, default = 50080, help = "port to listen to")
+    parser.add_argument("--engine", choices = ["dll", "simulated"], default = "dll", help = "engine backend")
+    parser.add_argument("--install-path", help = "install path of VOICEROID2")
+    parser.add_argument("--language", default = "standard", help = "language library to load")
+    parser.add_argument("--voice", help = "voice library to load, the first one installed if omitted")
+    parser.add_argument("--engines", type = int, default = 1, help = "number of VcRoid2 objects")
+    parser.add_argument("--max-jobs", type = int, default = 2, help = "max_jobs of each VcRoid2")
+    parser.add_argument("--max-queue", type = int, default = 16, help = "maximum number of waiting requests")
+    parser.add_argument("--verbose", action = "store_true", help = "log each request")
+    args = parser.parse_args(argv)
+
+    engines = []
+    try:
+        for _ in range(args.engines):
+            if args.engine == "simulated":
+                from .simulator import SimulatedEngine
+                vc = VcRoid2(engine = SimulatedEngine(max_jobs = args.max_jobs), max_jobs = args.max_jobs)
+            else:
+                vc = VcRoid2(install_path = args.install_path, max_jobs = args.max_jobs)
+            engines.append(vc)
+            vc.loadLanguage(args.language)
+            vc.loadVoice(args.voice if args.voice is not None else vc.listVoices()[0])
+        daemon = Daemon(engines, unix_path = args.unix, host = args.host, port = args.port, max_queue = args.max_queue, verbose = args.verbose)
+    except Exception:
+        for vc in engines:
+            vc.__exit__(None, None, None)
+        raise
+    print("listening on {}".format(daemon.address), flush = True)
+    try:
+        daemon.serveForever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.close()
+
+if __name__ == "__main__":
+    main()
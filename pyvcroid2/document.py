@@ -0,0 +1,240 @@
+import concurrent.futures
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+from .events import TtsEventType
+from .output import SinkOutput, SAMPLE_RATE
+from .segment import splitText
+
+# A line such as "# Title" or "第一章 Title" starts a chapter
+_HEADING = re.compile(r"^(?:#+[ \t]*(.+)|(第[0-9０-９一二三四五六七八九十百千]+章.*))$", re.MULTILINE)
+
+def splitChapters(text, pattern = _HEADING):
+    '''
+    Split text into chapters at the heading lines
+
+    Parameters
+    ----------
+    text : string
+        The text of the document.
+    pattern : re.Pattern
+        Pattern matching a heading line, whose first non-empty group is the title.
+        By default "# Title" and "第一章 Title" are headings.
+
+    Returns
+    -------
+    chapters : [(string, string)]
+        Title and body of each chapter. The text before the first heading becomes a chapter titled "".
+    '''
+    chapters = []
+    title = ""
+    start = 0
+    for match in pattern.finditer(text):
+        body = text[start:match.start()]
+        if (0 < len(chapters)) or (body.strip() != ""):
+            chapters.append((title, body))
+        title = next((group for group in match.groups() if group), match.group(0)).strip()
+        start = match.end()
+    chapters.append((title, text[start:]))
+    return chapters
+
+class DocumentRenderer(object):
+    '''
+    Render a long document segment by segment keeping every finished segment on disk.
+
+    The document is split into chapters and the chapters into sentences.
+    Each sentence is synthesized as one segment by the engines, at most parallelism of them at a time,
+    and stored in the directory under the hash of its text and the settings together with a line of the manifest.
+    When rendering again after a crash or a timeout, the segments found in the manifest are not synthesized again.
+    The segments are finally concatenated into one output.
+    '''
+
+    def __init__(self, engines, directory, *, parallelism = None, chunk_length = 200, preset = None, context = ""):
+        '''
+        Parameters
+        ----------
+        engines : VcRoid2 or VcRoid2Pool or list of them
+            Objects synthesizing the segments by textToSpeech(). The segments are assigned to them in turn.
+        directory : string
+            Directory of the store of the segments and the manifest.
+        parallelism : int
+            Maximum number of segments synthesized at the same time.
+            If None, the total of max_jobs of VcRoid2 and processes of VcRoid2Pool.
+        chunk_length : int
+            Maximum number of characters per segment.
+        preset : preset.Preset
+            Parameters the segments are synthesized with.
+        context : string
+            Identifier of the voice and the dictionaries the engines use, which is included in the keys of the segments.
+            Change it when the engines change so that the stored segments are not reused.
+        '''
+        if not isinstance(engines, (list, tuple)):
+            engines = [engines]
+        if len(engines) == 0:
+            raise ValueError("engines must not be empty")
+        if parallelism is None:
+            parallelism = sum(engine.processes if hasattr(engine, "processes") else engine.maxJobs for engine in engines)
+        if parallelism < 1:
+            raise ValueError("parallelism must be positive")
+        self.__engines = list(engines)
+        self.__directory = directory
+        self.__parallelism = parallelism
+        self.__chunk_length = chunk_length
+        self.__preset = preset
+        self.__context = context
+        self.__manifest_path = os.path.join(directory, "manifest.jsonl")
+        self.__manifest_lock = threading.Lock()
+        self.__synthesized = 0
+        self.__skipped = 0
+        os.makedirs(os.path.join(directory, "segments"), exist_ok = True)
+
+    @property
+    def synthesized(self):
+        '''
+        Number of distinct segments synthesized by the last render() : int
+        '''
+        return self.__synthesized
+
+    @property
+    def skipped(self):
+        '''
+        Number of distinct segments of the last render() found in the store : int
+        '''
+        return self.__skipped
+
+    def render(self, document, output, *, raw = False, timeout = None):
+        '''
+        Render the document into one output
+
+        Parameters
+        ----------
+        document : string or [(string, string)]
+            The text split by splitChapters(), or the title and the body of each chapter.
+        output : string or file object
+            Path of the file to write, or a file object or a socket passed to SinkOutput.
+        raw : boolean
+            If True, the output has no WAVE header.
+        timeout : float
+            Timeout of each segment in seconds.
+
+        Returns
+        -------
+        size : int
+            Number of bytes written including the WAVE header.
+        markers : [(string, int)]
+            Title of each chapter and the tick in msec where it starts,
+            which is that of the first POSITION event of the chapter.
+        '''
+        chapters = splitChapters(document) if isinstance(document, str) else list(document)
+        segments = []
+        for chapter, (_, body) in enumerate(chapters):
+            for _, text in splitText(body, self.__chunk_length):
+                if text.strip() != "":
+                    segments.append((chapter, self.__createKey(text), text))
+
+        finished = self.__loadManifest()
+        pending = {}
+        for _, key, text in segments:
+            if (key not in finished) and (key not in pending):
+                pending[key] = text
+        self.__skipped = len(set(key for _, key, _ in segments if key in finished))
+        self.__synthesized = 0
+        finished.update(self.__synthesize(pending, timeout))
+        self.__synthesized = len(pending)
+
+        if isinstance(output, str):
+            with open(output, "wb") as f:
+                return self.__concatenate(chapters, segments, finished, f, raw)
+        return self.__concatenate(chapters, segments, finished, output, raw)
+
+    def __createKey(self, text):
+        preset = None if self.__preset is None else self.__preset.toDict()
+        data = json.dumps([self.__context, preset, text], ensure_ascii = False, sort_keys = True)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def __segmentPath(self, key):
+        return os.path.join(self.__directory, "segments", key[0:2], key + ".pcm")
+
+    def __loadManifest(self):
+        # A line is appended after its segment is stored, so a torn last line or a missing file only means it is not finished
+        finished = {}
+        try:
+            with open(self.__manifest_path, "r", encoding = "utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        if os.path.getsize(self.__segmentPath(entry["key"])) == entry["size"]:
+                            finished[entry["key"]] = entry
+                    except (ValueError, OSError):
+                        continue
+        except FileNotFoundError:
+            pass
+        return finished
+
+    def __synthesize(self, pending, timeout):
+        finished = {}
+        if len(pending) == 0:
+            return finished
+        with concurrent.futures.ThreadPoolExecutor(max_workers = self.__parallelism) as executor:
+            futures = [executor.submit(self.__synthesizeSegment, self.__engines[index % len(self.__engines)], key, text, timeout)
+                for index, (key, text) in enumerate(pending.items())]
+            try:
+                for future in concurrent.futures.as_completed(futures):
+                    entry = future.result()
+                    finished[entry["key"]] = entry
+            except BaseException:
+                # The segments already running are still stored for the next render()
+                for future in futures:
+                    future.cancel()
+                raise
+        return finished
+
+    def __synthesizeSegment(self, engine, key, text, timeout):
+        speech, tts_events = engine.textToSpeech(text, raw = True, timeout = timeout, preset = self.__preset)
+        path = self.__segmentPath(key)
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        fd, temp_path = tempfile.mkstemp(dir = os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(speech)
+            os.replace(temp_path, path)
+        except Exception:
+            os.remove(temp_path)
+            raise
+        entry = {
+            "key": key,
+            "size": len(memoryview(speech).cast("B")),
+            "events": [[tick, event_type.value, value] for tick, event_type, value in tts_events],
+        }
+        line = json.dumps(entry, ensure_ascii = False) + "\n"
+        with self.__manifest_lock:
+            with open(self.__manifest_path, "a", encoding = "utf-8") as f:
+                f.write(line)
+        return entry
+
+    def __concatenate(self, chapters, segments, finished, sink, raw):
+        writer = SinkOutput(sink, header = not raw)
+        markers = [None] * len(chapters)
+        total_samples = 0
+        for chapter, key, _ in segments:
+            entry = finished[key]
+            if markers[chapter] is None:
+                start_tick = total_samples * 1000 // SAMPLE_RATE
+                ticks = [tick for tick, event_type, _ in entry["events"] if TtsEventType(event_type) == TtsEventType.POSITION]
+                markers[chapter] = start_tick + (ticks[0] if 0 < len(ticks) else 0)
+            with open(self.__segmentPath(key), "rb") as f:
+                while True:
+                    data = f.read(1024 * 1024)
+                    if len(data) == 0:
+                        break
+                    writer.write(data)
+            total_samples += entry["size"] // 2
+        # A chapter without any segment starts where the next one does
+        end_tick = total_samples * 1000 // SAMPLE_RATE
+        for chapter in reversed(range(len(chapters))):
+            if markers[chapter] is None:
+                markers[chapter] = markers[chapter + 1] if chapter + 1 < len(chapters) else end_tick
+        return writer.finish(), [(title, tick) for (title, _), tick in zip(chapters, markers)]
@@ -0,0 +1,160 @@
+import sys
+import os
+from ctypes import *
+from . import aitalk
+
+class DllEngine(object):
+    '''
+    Engine backend which calls aitalked.dll of VOICEROID2.
+
+    An engine backend provides the AITalkAPI_* functions with the same signatures as the DLL
+    and the following helpers which depend on where the engine is installed.
+    listLanguages(), listVoices(), createConfig() and langLoad()
+    The functions return aitalk.ResultCode except AITalkAPI_GetKana and AITalkAPI_GetData
+    which return the plain integer since they are called for every buffer in the callbacks.
+    '''
+    __PROTOTYPES = [
+        ("AITalkAPI_Init", aitalk.ResultCode, [POINTER(aitalk.TConfig)]),
+        ("AITalkAPI_End", aitalk.ResultCode, []),
+        ("AITalkAPI_LangClear", aitalk.ResultCode, []),
+        ("AITalkAPI_LangLoad", aitalk.ResultCode, [c_char_p]),
+        # NULL unloads the dictionary
+        ("AITalkAPI_ReloadPhraseDic", aitalk.ResultCode, [c_void_p]),
+        ("AITalkAPI_ReloadWordDic", aitalk.ResultCode, [c_void_p]),
+        ("AITalkAPI_ReloadSymbolDic", aitalk.ResultCode, [c_void_p]),
+        ("AITalkAPI_VoiceClear", aitalk.ResultCode, []),
+        ("AITalkAPI_VoiceLoad", aitalk.ResultCode, [c_char_p]),
+        # The parameter is a structure whose size depends on the voice
+        ("AITalkAPI_GetParam", aitalk.ResultCode, None),
+        ("AITalkAPI_SetParam", aitalk.ResultCode, None),
+        ("AITalkAPI_TextToKana", aitalk.ResultCode, [POINTER(c_int32), POINTER(aitalk.TJobParam), c_char_p]),
+        ("AITalkAPI_CloseKana", aitalk.ResultCode, [c_int32, c_int32]),
+        ("AITalkAPI_GetKana", c_int32, [c_int32, POINTER(c_char), c_uint32, POINTER(c_uint32), POINTER(c_uint32)]),
+        ("AITalkAPI_TextToSpeech", aitalk.ResultCode, [POINTER(c_int32), POINTER(aitalk.TJobParam), c_char_p]),
+        ("AITalkAPI_CloseSpeech", aitalk.ResultCode, [c_int32, c_int32]),
+        ("AITalkAPI_GetData", c_int32, [c_int32, POINTER(c_char), c_uint32, POINTER(c_uint32)]),
+    ]
+
+    def __init__(self, install_path = None, install_path_x86 = None):
+        '''
+        Load DLL
+
+        Parameters
+        ----------
+        install_path : string
+            Install path of VOICEROID2.
+            The default path is used if not specified.
+        install_path_x86 : string
+            Install path of VOICEROID2 (x86 version).
+            This is same as install_path when the python is running 32 bit mode.
+            The default path is used if not specified.
+        '''
+        # Acquire the install path
+        if install_path is None:
+            if 2**32 <= sys.maxsize:
+                # Find 64bit DLL
+                rfid = c_char_p(b"\x77\x93\x80\x6D\xF0\x6A\x4B\x44\x89\x57\xA3\x77\x3F\x02\x20\x0E")
+            else:
+                # Find 32bit DLL
+                rfid = c_char_p(b"\xEF\x40\x5A\x7C\xFB\xA0\xFC\x4B\x87\x4A\xC0\xF2\xE0\xB9\xFA\x8E")
+            self.__install_path = DllEngine.__GetKnownFolderPath(rfid) + "\\AHS\\VOICEROID2"
+        else:
+            self.__install_path = install_path
+
+        # Acquire the install path (x86 version)
+        if install_path_x86 is None:
+            rfid = c_char_p(b"\xEF\x40\x5A\x7C\xFB\xA0\xFC\x4B\x87\x4A\xC0\xF2\xE0\xB9\xFA\x8E")
+            self.__install_path_x86 = DllEngine.__GetKnownFolderPath(rfid) + "\\AHS\\VOICEROID2"
+        else:
+            self.__install_path_x86 = install_path_x86
+
+        # Open the DLL and bind the functions with their prototypes once
+        self.__dll = windll.LoadLibrary(self.__install_path + "\\aitalked.dll")
+        for name, restype, argtypes in DllEngine.__PROTOTYPES:
+            function = getattr(self.__dll, name)
+            function.restype = restype
+            if argtypes is not None:
+                function.argtypes = argtypes
+            setattr(self, name, function)
+
+    def __getattr__(self, name):
+        # Forward AITalkAPI_* to the DLL
+        if name.startswith("AITalkAPI_"):
+            return getattr(self.__dll, name)
+        raise AttributeError(name)
+
+    @property
+    def installPath(self):
+        return self.__install_path
+
+    @property
+    def installPathX86(self):
+        return self.__install_path_x86
+
+    def createConfig(self, sample_rate, msec_timeout):
+        '''
+        Create the configuration passed to AITalkAPI_Init
+
+        Returns
+        -------
+        config : aitalk.TConfig
+        '''
+        return aitalk.TConfig(
+            hzVoiceDB = sample_rate,
+            dirVoiceDBS = (self.__install_path_x86 + "\\Voice").encode("shift-jis"),
+            msecTimeout = msec_timeout,
+            pathLicense = (self.__install_path + "\\aitalk.lic").encode("shift-jis"),
+            codeAuthSeed = b"ORXJC6AIWAUKDpDbH2al",
+            __reserved__ = 0
+        )
+
+    def listLanguages(self):
+        '''
+        Acquire list of installed language library
+
+        Returns
+        -------
+        language_list : string[]
+        '''
+        return DllEngine.__ListDirectories(self.__install_path_x86 + "\\Lang")
+
+    def listVoices(self):
+        '''
+        Acquire list of installed voice library
+
+        Returns
+        -------
+        voice_list : string[]
+        '''
+        return DllEngine.__ListDirectories(self.__install_path_x86 + "\\Voice")
+
+    def langLoad(self, language_name):
+        '''
+        Call AITalkAPI_LangLoad with the path of the language library
+
+        Returns
+        -------
+        result : aitalk.ResultCode
+        '''
+        language_path = c_char_p((self.__install_path_x86 + "\\Lang\\" + language_name).encode("shift-jis"))
+        cd = os.getcwd()
+        try:
+            os.chdir(self.__install_path) # Change the current directory temporarily
+            return self.__dll.AITalkAPI_LangLoad(language_path)
+        finally:
+            os.chdir(cd)
+
+    def __GetKnownFolderPath(rfid):
+        pwstr = c_wchar_p()
+        windll.shell32.SHGetKnownFolderPath(rfid, c_uint32(0), c_void_p(), byref(pwstr))
+        path = wstring_at(pwstr)
+        windll.ole32.CoTaskMemFree(pwstr)
+        return path
+
+    def __ListDirectories(path):
+        result = []
+        with os.scandir(path) as it:
+            for entry in it:
+                if not entry.name.startswith(".") and entry.is_dir():
+                    result.append(entry.name)
+        return result
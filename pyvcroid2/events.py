@@ -0,0 +1,6 @@
+from enum import Enum
+
+class TtsEventType(Enum):
+    PHONETIC = 0
+    POSITION = 1
+    BOOKMARK = 2
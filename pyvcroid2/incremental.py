@@ -0,0 +1,238 @@
+import difflib
+from .events import TtsEventType
+from .output import SAMPLE_RATE, createWaveHeader
+from .segment import splitText
+
+class IncrementalRenderer(object):
+    '''
+    Render a text or a script again after edits synthesizing only the sentences which changed.
+
+    The AIKANA and the speech of each sentence of the last rendering are kept.
+    A sentence is identified by its text, its voice and the values of the parameters it is spoken with,
+    so changing a value of param of a voice synthesizes again only the lines of that voice which use param.
+    The speech is updated by splicing the new sentences into the last one,
+    and the event data is rebased from the sentences.
+    Everything kept is discarded when the language or a user dictionary of vc changes.
+    '''
+
+    def __init__(self, vc, *, chunk_length = 200, gap = 0.3):
+        '''
+        Parameters
+        ----------
+        vc : VcRoid2
+            The object synthesizing the sentences.
+        chunk_length : int
+            Maximum number of characters per sentence. See segment.splitText().
+        gap : float
+            Silence after each line of a script except the last one in seconds.
+        '''
+        self.__vc = vc
+        self.__chunk_length = chunk_length
+        self.__gap = gap
+        self.__kana = {}
+        self.__segments = []
+        self.__speech = bytearray()
+        self.__generation = None
+        self.__synthesized = 0
+        self.__reused = 0
+
+    @property
+    def synthesized(self):
+        '''
+        Number of sentences synthesized by the last rendering : int
+        '''
+        return self.__synthesized
+
+    @property
+    def reused(self):
+        '''
+        Number of sentences of the last rendering taken from the previous one : int
+        '''
+        return self.__reused
+
+    def invalidate(self):
+        '''
+        Discard the AIKANA and the speech kept so that everything is synthesized again
+        '''
+        self.__kana = {}
+        self.__segments = []
+        self.__speech = bytearray()
+
+    def render(self, text, *, timeout = None, raw = False, preset = None):
+        '''
+        Convert text to audio data with the current voice reusing the unchanged sentences.
+
+        Parameters
+        ----------
+        text : string
+            The text to convert.
+        timeout : float
+            Timeout of each conversion process in seconds.
+        raw : boolean
+            If True, speech is raw binary.
+            If False, speech is WAVE format.
+        preset : preset.Preset
+            Parameters of the voice used instead of the current values of param.
+
+        Returns
+        -------
+        speech : bytes
+            Result of conversion.
+        event : []
+            Event data. The ticks and the positions are relative to the whole text.
+        '''
+        speech, timeline = self.__render([(None, preset, text)], timeout, raw)
+        return speech, timeline[0][2]
+
+    def renderScript(self, lines, *, timeout = None, raw = False):
+        '''
+        Convert a script to audio data reusing the unchanged sentences. See VcRoid2.renderScript().
+
+        Parameters
+        ----------
+        lines : [(string, preset.Preset, string)]
+            Voice name, preset and text of each line in script order.
+            The preset may be None to use the current values of param of the voice.
+            A fourth element, if any, is the silence after the line in seconds overriding gap.
+        timeout : float
+            Timeout of each conversion process in seconds.
+        raw : boolean
+            If True, speech is raw binary.
+            If False, speech is WAVE format.
+
+        Returns
+        -------
+        speech : bytes
+            Result of conversion.
+        timeline : [(int, int, [])]
+            Start tick, end tick and event data of each line in script order.
+            The positions of the events are relative to the text of the line.
+        '''
+        return self.__render(lines, timeout, raw)
+
+    def __render(self, lines, timeout, raw):
+        vc = self.__vc
+        if self.__generation != vc.dictionaryGeneration:
+            # The AIKANA and the speech kept were converted with the old dictionaries
+            self.invalidate()
+            self.__generation = vc.dictionaryGeneration
+        current_voice = vc.currentVoice
+        try:
+            # Identify the sentences by the voice and the values they are spoken with
+            plan = []
+            defaults = {}
+            for index, line in enumerate(lines):
+                voice = current_voice if line[0] is None else line[0]
+                if voice is None:
+                    raise RuntimeError("no voice is loaded")
+                preset = line[1]
+                if preset is None:
+                    if voice not in defaults:
+                        defaults[voice] = self.__defaultPreset(voice)
+                    preset = defaults[voice]
+                for offset, sentence in splitText(line[2], self.__chunk_length):
+                    if not sentence.isspace():
+                        plan.append(((voice, preset, sentence), index, offset))
+                if index + 1 < len(lines):
+                    line_gap = line[3] if 3 < len(line) else self.__gap
+                    plan.append(((None, None, max(0, int(line_gap * SAMPLE_RATE))), index, 0))
+
+            # Synthesize the sentences not found in the last rendering grouped by voice
+            old_keys = [segment[0] for segment in self.__segments]
+            known = set(old_keys)
+            results = {}
+            for key, _, _ in plan:
+                if (key not in known) and (key not in results):
+                    results[key] = None
+            kana = {}
+            for voice in sorted(set(key[0] for key in results if key[0] is not None), key = lambda name: name != vc.currentVoice):
+                if vc.currentVoice != voice:
+                    vc.loadVoice(voice)
+                for key in results:
+                    if key[0] == voice:
+                        sentence = key[2]
+                        if sentence not in kana:
+                            kana[sentence] = self.__kana.get(sentence)
+                            if kana[sentence] is None:
+                                kana[sentence] = vc.textToKana(sentence, timeout = timeout)
+                        speech, tts_events = vc.kanaToSpeech(kana[sentence], timeout = timeout, raw = True, preset = key[1])
+                        results[key] = (bytes(speech), tts_events)
+        finally:
+            if (current_voice is not None) and (vc.currentVoice != current_voice):
+                vc.loadVoice(current_voice)
+        for key in results:
+            if key[0] is None:
+                results[key] = (bytes(key[2] * 2), [])
+
+        self.__splice(old_keys, [key for key, _, _ in plan], results)
+        for key, _, _ in plan:
+            if (key[0] is not None) and (key[2] not in kana):
+                kana[key[2]] = self.__kana.get(key[2])
+        self.__kana = kana
+        self.__synthesized = sum(1 for key in results if key[0] is not None)
+        self.__reused = sum(1 for key, _, _ in plan if (key[0] is not None) and (key not in results))
+
+        # Rebase the events of the sentences onto the speech
+        timeline = [[None, None, []] for _ in lines]
+        total_samples = 0
+        for (key, index, offset), (_, size, tts_events) in zip(plan, self.__segments):
+            start_tick = total_samples * 1000 // SAMPLE_RATE
+            entry = timeline[index]
+            if key[0] is not None:
+                if entry[0] is None:
+                    entry[0] = start_tick
+                for tick, event_type, value in tts_events:
+                    if event_type == TtsEventType.POSITION:
+                        value += offset
+                    entry[2].append((tick + start_tick, event_type, value))
+            total_samples += size // 2
+            if key[0] is not None:
+                entry[1] = total_samples * 1000 // SAMPLE_RATE
+        start_tick = 0
+        for entry in timeline:
+            if entry[0] is None:
+                entry[0] = entry[1] = start_tick
+            start_tick = entry[1]
+
+        if raw:
+            speech = bytes(self.__speech)
+        else:
+            speech = createWaveHeader(len(self.__speech), SAMPLE_RATE) + self.__speech
+        return speech, [tuple(entry) for entry in timeline]
+
+    def __defaultPreset(self, voice):
+        param = self.__vc.voiceParam(voice)
+        if param is None:
+            self.__vc.loadVoice(voice)
+            param = self.__vc.param
+        return param.createPreset()
+
+    def __splice(self, old_keys, new_keys, results):
+        # Collect the data of every changed range before modifying the speech since sentences may move
+        starts = [0]
+        for _, size, _ in self.__segments:
+            starts.append(starts[-1] + size)
+        old_segments = {}
+        for index, segment in enumerate(self.__segments):
+            old_segments[segment[0]] = (starts[index], segment)
+        matcher = difflib.SequenceMatcher(None, old_keys, new_keys, autojunk = False)
+        changes = []
+        segments = []
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == "equal":
+                segments.extend(self.__segments[i1:i2])
+                continue
+            parts = []
+            for key in new_keys[j1:j2]:
+                if key in results:
+                    speech, tts_events = results[key]
+                    segments.append((key, len(speech), tts_events))
+                    parts.append(speech)
+                else:
+                    start, segment = old_segments[key]
+                    segments.append(segment)
+                    parts.append(bytes(self.__speech[start:start + segment[1]]))
+            changes.append((starts[i1], starts[i2], b"".join(parts)))
+        for start, end, data in reversed(changes):
+            self.__speech[start:end] = data
+        self.__segments = segments
@@ -0,0 +1,222 @@
+import collections
+import threading
+
+class Job(object):
+    '''
+    State of a conversion job of the engine.
+
+    The callbacks registered to the engine look up the job by TJobParam.userData
+    and forward the events to the procedures of the job.
+    '''
+
+    def __init__(self, key, mode, *, voice = None, preset = None, buffers = None, proc_text_buf = None, proc_raw_buf = None, proc_event_tts = None, scratch = (), metrics = None):
+        '''
+        Parameters
+        ----------
+        key : int
+            Identifier passed to the engine as TJobParam.userData.
+        mode : aitalk.JobInOut
+            Type of the job.
+        voice : voice.Voice
+            Voice the engine is set to before the job is started.
+            None if the job does not depend on the voice.
+        preset : preset.Preset
+            Parameters of the voice set with it.
+        buffers : buffers.BufferSizes
+            Sizes of the buffers the engine is set to before the job is started.
+            The text buffer applies to a conversion to AIKANA and the raw buffer to a conversion to speech.
+        proc_text_buf, proc_raw_buf, proc_event_tts : callable
+            Procedures called with the arguments of ProcTextBuf, ProcRawBuf and ProcEventTts.
+        scratch : []
+            Scratch buffers used by the procedures, which are released when the job is closed.
+        metrics : metrics.JobMetrics
+            Timings and counts of the job, None if they are not measured.
+        '''
+        self.key = key
+        self.mode = mode
+        self.id = None
+        self.voice = voice
+        self.preset = preset
+        self.buffers = buffers
+        self.procTextBuf = proc_text_buf
+        self.procRawBuf = proc_raw_buf
+        self.procEventTts = proc_event_tts
+        self.scratch = list(scratch)
+        self.metrics = metrics
+        self.thread = None
+        self.task = None
+
+class JobSlots(object):
+    '''
+    Counting semaphore which both threads and coroutines can wait for.
+    '''
+
+    def __init__(self, count):
+        '''
+        Parameters
+        ----------
+        count : int
+            Number of slots.
+        '''
+        if count < 1:
+            raise ValueError("count must be positive")
+        self.__condition = threading.Condition()
+        self.__capacity = count
+        self.__count = count
+        self.__exclusive = 0
+        self.__waiters = collections.deque()
+
+    @property
+    def capacity(self):
+        '''
+        Number of slots : int
+        '''
+        return self.__capacity
+
+    def acquire(self, timeout = None):
+        '''
+        Wait for a free slot and take it
+
+        Returns
+        -------
+        acquired : boolean
+            False if timeout expired.
+        '''
+        with self.__condition:
+            if not self.__condition.wait_for(lambda: (0 < self.__count) and (self.__exclusive == 0), timeout):
+                return False
+            self.__count -= 1
+            return True
+
+    async def aacquire(self):
+        '''
+        Wait for a free slot and take it without blocking the event loop
+        '''
+        import asyncio
+        loop = asyncio.get_running_loop()
+        while True:
+            with self.__condition:
+                if (0 < self.__count) and (self.__exclusive == 0):
+                    self.__count -= 1
+                    return
+                waiter = (loop, loop.create_future())
+                self.__waiters.append(waiter)
+            try:
+                await waiter[1]
+            finally:
+                with self.__condition:
+                    if waiter in self.__waiters:
+                        self.__waiters.remove(waiter)
+
+    def release(self):
+        '''
+        Return a slot
+        '''
+        with self.__condition:
+            self.__count += 1
+            if self.__exclusive == 0:
+                self.__condition.notify()
+            else:
+                # Wake acquireAll() which waits with the others
+                self.__condition.notify_all()
+            # The coroutines race for the slot, the losers wait again
+            waiters = list(self.__waiters)
+            self.__waiters.clear()
+        JobSlots.__WakeAll(waiters)
+
+    def acquireAll(self, timeout = None):
+        '''
+        Wait until no slot is taken and take all of them.
+        New acquisitions wait from the call so that the running jobs drain.
+
+        Returns
+        -------
+        acquired : boolean
+            False if timeout expired.
+        '''
+        with self.__condition:
+            self.__exclusive += 1
+            if self.__condition.wait_for(lambda: self.__count == self.__capacity, timeout):
+                self.__count = 0
+                return True
+        self.__cancelExclusive()
+        return False
+
+    async def aacquireAll(self):
+        '''
+        Wait until no slot is taken and take all of them without blocking the event loop.
+        See acquireAll().
+        '''
+        import asyncio
+        loop = asyncio.get_running_loop()
+        with self.__condition:
+            self.__exclusive += 1
+        try:
+            while True:
+                with self.__condition:
+                    if self.__count == self.__capacity:
+                        self.__count = 0
+                        return
+                    waiter = (loop, loop.create_future())
+                    self.__waiters.append(waiter)
+                try:
+                    await waiter[1]
+                finally:
+                    with self.__condition:
+                        if waiter in self.__waiters:
+                            self.__waiters.remove(waiter)
+        except BaseException:
+            self.__cancelExclusive()
+            raise
+
+    def releaseAll(self, keep = 0):
+        '''
+        Return all slots taken by acquireAll()
+
+        Parameters
+        ----------
+        keep : int
+            Number of slots the caller keeps and returns with release() later.
+        '''
+        with self.__condition:
+            self.__count = self.__capacity - keep
+            self.__exclusive -= 1
+            self.__condition.notify_all()
+            waiters = list(self.__waiters)
+            self.__waiters.clear()
+        JobSlots.__WakeAll(waiters)
+
+    def __cancelExclusive(self):
+        # Let the acquisitions held off by a failed acquireAll() go
+        with self.__condition:
+            self.__exclusive -= 1
+            self.__condition.notify_all()
+            waiters = list(self.__waiters)
+            self.__waiters.clear()
+        JobSlots.__WakeAll(waiters)
+
+    def retire(self):
+        '''
+        Drop a slot taken by the caller instead of returning it, unless it is the last one
+
+        Returns
+        -------
+        retired : boolean
+        '''
+        with self.__condition:
+            if self.__capacity <= 1:
+                return False
+            self.__capacity -= 1
+            return True
+
+    def __WakeAll(waiters):
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(JobSlots.__Wake, future)
+            except RuntimeError:
+                # The event loop is already closed
+                pass
+
+    def __Wake(future):
+        if not future.done():
+            future.set_result(None)
@@ -0,0 +1,198 @@
+import bisect
+import threading
+import time
+from .output import SAMPLE_RATE
+
+# Bounds of the histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+REAL_TIME_FACTOR_BUCKETS = (0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0)
+
+class JobMetrics(object):
+    '''
+    Timings and counts of a conversion job, which are passed to the hook of VcRoid2 when the job is closed.
+    The times are seconds measured by time.perf_counter().
+    '''
+    __slots__ = ("kind", "voice", "start", "queueWait", "setParamTime", "firstDataTime", "totalTime", "callbacks", "loops", "bytes", "failed")
+
+    def __init__(self, kind, voice):
+        '''
+        Parameters
+        ----------
+        kind : string
+            "kana" for a conversion to AIKANA, "speech" for a conversion to speech.
+        voice : string
+            Name of the voice of the speech, None for AIKANA.
+        '''
+        self.kind = kind
+        self.voice = voice
+        self.start = time.perf_counter()
+        self.queueWait = 0.0       # Waiting for a free slot of the engine
+        self.setParamTime = 0.0    # AITalkAPI_SetParam, 0 if the engine already had the parameters
+        self.firstDataTime = None  # From the submission to the first TEXTBUF or RAWBUF callback
+        self.totalTime = None      # From the submission to the close
+        self.callbacks = 0         # TEXTBUF or RAWBUF callbacks
+        self.loops = 0             # Calls of AITalkAPI_GetKana or AITalkAPI_GetData
+        self.bytes = 0             # Bytes of AIKANA (Shift-JIS) or raw speech received
+        self.failed = False
+
+    @property
+    def realTimeFactor(self):
+        '''
+        Seconds spent per second of the speech, None for AIKANA or no speech : float
+        '''
+        if (self.kind != "speech") or (self.bytes == 0) or (self.totalTime is None):
+            return None
+        return self.totalTime / (self.bytes / 2 / SAMPLE_RATE)
+
+    def __repr__(self):
+        return "JobMetrics({})".format(", ".join("{} = {!r}".format(name, getattr(self, name)) for name in JobMetrics.__slots__))
+
+class _Histogram(object):
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class PrometheusExporter(object):
+    '''
+    Hook of VcRoid2 which aggregates the metrics of the jobs into histograms and counters
+    and renders them in the Prometheus text exposition format.
+
+        exporter = PrometheusExporter()
+        vc = VcRoid2(metrics = exporter)
+        exporter.startServer(9464)
+    '''
+    __HISTOGRAMS = (
+        ("queue_wait_seconds", "queueWait", LATENCY_BUCKETS, "Seconds waiting for a free slot of the engine"),
+        ("set_param_seconds", "setParamTime", LATENCY_BUCKETS, "Seconds spent in AITalkAPI_SetParam"),
+        ("first_data_seconds", "firstDataTime", LATENCY_BUCKETS, "Seconds from the submission to the first buffer callback"),
+        ("job_seconds", "totalTime", LATENCY_BUCKETS, "Seconds from the submission to the close of the job"),
+        ("real_time_factor", "realTimeFactor", REAL_TIME_FACTOR_BUCKETS, "Seconds spent per second of the speech"),
+    )
+    __COUNTERS = (
+        ("jobs_total", None, "Jobs closed"),
+        ("job_failures_total", "failed", "Jobs which failed or were aborted"),
+        ("callbacks_total", "callbacks", "Buffer callbacks"),
+        ("get_loops_total", "loops", "Calls of AITalkAPI_GetKana and AITalkAPI_GetData"),
+        ("bytes_total", "bytes", "Bytes of AIKANA and speech received"),
+    )
+
+    def __init__(self, *, prefix = "pyvcroid2_"):
+        '''
+        Parameters
+        ----------
+        prefix : string
+            Prefix of the names of the metrics.
+        '''
+        self.__prefix = prefix
+        self.__lock = threading.Lock()
+        self.__histograms = {}
+        self.__counters = {}
+        self.__server = None
+
+    def __call__(self, job_metrics):
+        '''
+        Aggregate the metrics of a job
+
+        Parameters
+        ----------
+        job_metrics : JobMetrics
+        '''
+        kind = job_metrics.kind
+        with self.__lock:
+            for name, attribute, bounds, _ in PrometheusExporter.__HISTOGRAMS:
+                value = getattr(job_metrics, attribute)
+                if value is not None:
+                    histogram = self.__histograms.get((name, kind))
+                    if histogram is None:
+                        histogram = self.__histograms[(name, kind)] = _Histogram(bounds)
+                    histogram.observe(value)
+            for name, attribute, _ in PrometheusExporter.__COUNTERS:
+                value = 1 if attribute is None else int(getattr(job_metrics, attribute))
+                self.__counters[(name, kind)] = self.__counters.get((name, kind), 0) + value
+
+    def render(self):
+        '''
+        Render the metrics in the Prometheus text exposition format
+
+        Returns
+        -------
+        text : string
+        '''
+        lines = []
+        with self.__lock:
+            for name, _, _, description in PrometheusExporter.__HISTOGRAMS:
+                full_name = self.__prefix + name
+                lines.append("# HELP {} {}".format(full_name, description))
+                lines.append("# TYPE {} histogram".format(full_name))
+                for (histogram_name, kind), histogram in sorted(self.__histograms.items()):
+                    if histogram_name != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(histogram.bounds + (float("inf"),), histogram.counts):
+                        cumulative += count
+                        lines.append('{}_bucket{{kind="{}",le="{}"}} {}'.format(full_name, kind, "+Inf" if bound == float("inf") else repr(bound), cumulative))
+                    lines.append('{}_sum{{kind="{}"}} {!r}'.format(full_name, kind, histogram.sum))
+                    lines.append('{}_count{{kind="{}"}} {}'.format(full_name, kind, histogram.count))
+            for name, _, description in PrometheusExporter.__COUNTERS:
+                full_name = self.__prefix + name
+                lines.append("# HELP {} {}".format(full_name, description))
+                lines.append("# TYPE {} counter".format(full_name))
+                for (counter_name, kind), value in sorted(self.__counters.items()):
+                    if counter_name == name:
+                        lines.append('{}{{kind="{}"}} {}'.format(full_name, kind, value))
+        return "\n".join(lines) + "\n"
+
+    def startServer(self, port, host = "127.0.0.1"):
+        '''
+        Serve the metrics at /metrics over HTTP in a background thread
+
+        Parameters
+        ----------
+        port : int
+            Port to listen to, 0 to choose a free one.
+        host : string
+            Address to listen to.
+
+        Returns
+        -------
+        address : (string, int)
+            Address listened to.
+        '''
+        import http.server
+        exporter = self
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = exporter.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.stopServer()
+        self.__server = http.server.ThreadingHTTPServer((host, port), Handler)
+        self.__server.daemon_threads = True
+        threading.Thread(target = self.__server.serve_forever, daemon = True).start()
+        return self.__server.server_address[0:2]
+
+    def stopServer(self):
+        '''
+        Stop serving the metrics
+        '''
+        if self.__server is not None:
+            self.__server.shutdown()
+            self.__server.server_close()
+            self.__server = None
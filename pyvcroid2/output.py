@@ -0,0 +1,249 @@
+from ctypes import c_char
+
+SAMPLE_RATE = 44100
+WAVE_HEADER_SIZE = 44
+
+def createWaveHeader(data_size, sample_rate = SAMPLE_RATE):
+    '''
+    Create the header of 16 bit mono WAVE data
+
+    Parameters
+    ----------
+    data_size : int
+        Size of the audio data in bytes.
+        If None, the sizes are filled with 0xFFFFFFFF for streaming.
+    sample_rate : int
+        Sampling rate in Hz.
+
+    Returns
+    -------
+    header : bytes
+        WAVE header (44 bytes)
+    '''
+    if data_size is None:
+        riff_size = 0xFFFFFFFF
+        data_size = 0xFFFFFFFF
+    else:
+        riff_size = data_size + WAVE_HEADER_SIZE
+    return b"".join((
+        b"RIFF",
+        riff_size.to_bytes(4, byteorder = "little"),
+        b"WAVEfmt \x10\x00\x00\x00\x01\x00\x01\x00",
+        sample_rate.to_bytes(4, byteorder = "little"),
+        (sample_rate * 2).to_bytes(4, byteorder = "little"),
+        b"\x02\x00\x10\x00data",
+        data_size.to_bytes(4, byteorder = "little")
+    ))
+
+class BufferOutput(object):
+    '''
+    Destination of the speech data which the engine writes into directly.
+    A bytearray grows as needed, other writable buffers have a fixed capacity.
+    '''
+
+    def __init__(self, buffer, *, header = True):
+        '''
+        Parameters
+        ----------
+        buffer : bytearray or writable buffer
+            The buffer to write the speech into from its beginning.
+        header : boolean
+            If True, WAVE header is reserved at the beginning of the buffer.
+        '''
+        if isinstance(buffer, bytearray):
+            self.__buffer = buffer
+            self.__growable = True
+        else:
+            self.__buffer = memoryview(buffer).cast("B")
+            self.__growable = False
+            if self.__buffer.readonly:
+                raise TypeError("output buffer must be writable")
+        self.__header = header
+        self.__size = WAVE_HEADER_SIZE if header else 0
+        if len(self.__buffer) < self.__size:
+            self.__grow(self.__size)
+            if len(self.__buffer) < self.__size:
+                raise BufferError("output buffer is too small")
+
+    @property
+    def size(self):
+        '''
+        Number of bytes written including the WAVE header : int
+        '''
+        return self.__size
+
+    def reserve(self, size):
+        '''
+        Acquire the free region following the written data.
+        The returned array must be released before the next call.
+
+        Parameters
+        ----------
+        size : int
+            Preferred size of the region in bytes.
+
+        Returns
+        -------
+        region : c_char array or None
+            View of the free region which may be shorter than size.
+            None if the buffer is full.
+        '''
+        room = len(self.__buffer) - self.__size
+        if room < size:
+            self.__grow(self.__size + size)
+            room = len(self.__buffer) - self.__size
+        size = min(size, room) & ~1 # Keep samples aligned
+        if size <= 0:
+            return None
+        return (c_char * size).from_buffer(self.__buffer, self.__size)
+
+    def commit(self, size):
+        '''
+        Mark the bytes written into the reserved region as data.
+
+        Parameters
+        ----------
+        size : int
+            Number of bytes written.
+        '''
+        self.__size += size
+
+    def write(self, data):
+        '''
+        Copy data after the written data.
+
+        Parameters
+        ----------
+        data : bytes-like object
+            Raw binary to append.
+        '''
+        data = memoryview(data).cast("B")
+        if len(data) == 0:
+            return
+        dest = self.reserve(len(data))
+        if (dest is None) or (len(dest) < len(data)):
+            raise BufferError("output buffer is too small")
+        memoryview(dest).cast("B")[0:len(data)] = data
+        del dest
+        self.commit(len(data))
+
+    def finish(self, sample_rate = SAMPLE_RATE):
+        '''
+        Complete the WAVE header and return the written data.
+
+        Returns
+        -------
+        speech : memoryview
+            View of the speech in the buffer.
+        '''
+        if self.__header:
+            self.__buffer[0:WAVE_HEADER_SIZE] = createWaveHeader(self.__size - WAVE_HEADER_SIZE, sample_rate)
+        return memoryview(self.__buffer)[0:self.__size]
+
+    def __grow(self, capacity):
+        if not self.__growable:
+            return
+        if len(self.__buffer) < capacity:
+            self.__buffer.extend(bytes(max(capacity, len(self.__buffer) * 2) - len(self.__buffer)))
+
+class SinkOutput(object):
+    '''
+    Destination of the speech data which writes each chunk to a file object or a socket as it arrives.
+    Only one chunk is held in memory however long the speech is.
+    '''
+
+    def __init__(self, sink, *, header = True, sample_rate = SAMPLE_RATE):
+        '''
+        Parameters
+        ----------
+        sink : file object or socket
+            Object having write() or sendall(), such as a file opened in binary mode or a pipe.
+        header : boolean
+            If True, WAVE header is written first. Its sizes are completed when finished if the sink is seekable,
+            otherwise they are filled with 0xFFFFFFFF for streaming.
+        sample_rate : int
+            Sampling rate in Hz written in the header.
+        '''
+        self.__sink = sink
+        self.__write = sink.sendall if hasattr(sink, "sendall") else sink.write
+        self.__seekable = callable(getattr(sink, "seekable", None)) and sink.seekable()
+        self.__start = sink.tell() if self.__seekable else None
+        self.__header = header
+        self.__buffer = bytearray()
+        self.__size = 0
+        if header:
+            self.write(createWaveHeader(None, sample_rate))
+
+    @property
+    def size(self):
+        '''
+        Number of bytes written including the WAVE header : int
+        '''
+        return self.__size
+
+    def reserve(self, size):
+        '''
+        Acquire the chunk buffer which the data is written into.
+        The returned array must be released before the next call.
+
+        Parameters
+        ----------
+        size : int
+            Size of the region in bytes.
+
+        Returns
+        -------
+        region : c_char array
+        '''
+        size &= ~1 # Keep samples aligned
+        if len(self.__buffer) < size:
+            self.__buffer = bytearray(size)
+        return (c_char * size).from_buffer(self.__buffer)
+
+    def commit(self, size):
+        '''
+        Write the bytes written into the reserved region to the sink.
+
+        Parameters
+        ----------
+        size : int
+            Number of bytes written.
+        '''
+        with memoryview(self.__buffer) as view:
+            self.write(view[0:size])
+
+    def write(self, data):
+        '''
+        Write data to the sink.
+
+        Parameters
+        ----------
+        data : bytes-like object
+            Raw binary to append.
+        '''
+        data = memoryview(data).cast("B")
+        self.__size += len(data)
+        while 0 < len(data):
+            written = self.__write(data)
+            # sendall() and buffered files write everything, raw files may write a part
+            if (written is None) or (len(data) <= written):
+                break
+            data = data[written:]
+
+    def finish(self, sample_rate = SAMPLE_RATE):
+        '''
+        Complete the WAVE header if the sink is seekable and flush the sink.
+
+        Returns
+        -------
+        size : int
+            Number of bytes written including the WAVE header.
+        '''
+        if self.__header and self.__seekable:
+            end = self.__sink.tell()
+            self.__sink.seek(self.__start)
+            self.__write(createWaveHeader(self.__size - WAVE_HEADER_SIZE, sample_rate))
+            self.__sink.seek(end)
+        if callable(getattr(self.__sink, "flush", None)):
+            self.__sink.flush()
+        return self.__size
@@ -0,0 +1,413 @@
+import collections
+import concurrent.futures
+import multiprocessing
+import multiprocessing.connection
+import os
+import threading
+from multiprocessing import shared_memory
+from .pyvcroid2 import VcRoid2
+
+class _Worker(object):
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+        self.ready = False
+        self.request = None
+        self.arena = None
+
+    def closeArena(self):
+        if self.arena is not None:
+            self.arena.close()
+            self.arena = None
+
+def _RunWorker(conn, options):
+    # Entry point of the worker process
+    vc = None
+    arena = None
+    try:
+        try:
+            engine_factory = options["engine_factory"]
+            vc = VcRoid2(
+                install_path = options["install_path"],
+                install_path_x86 = options["install_path_x86"],
+                engine = None if engine_factory is None else engine_factory()
+            )
+            vc.loadLanguage(options["language_name"])
+            vc.loadVoice(options["voice_name"])
+            for name, value in options["param"].items():
+                setattr(vc.param, name, value)
+        except Exception as e:
+            _SendError(conn, e)
+            return
+        conn.send(("ready", None))
+
+        # The engine writes straight into the arena shared with the pool
+        while True:
+            try:
+                request = conn.recv()
+            except EOFError:
+                break
+            if request is None:
+                break
+            method, args, kwargs = request
+            try:
+                if method == "textToKana":
+                    conn.send(("result", vc.textToKana(*args, **kwargs)))
+                    continue
+                if arena is None:
+                    arena = shared_memory.SharedMemory(create = True, size = options["arena_bytes"])
+                overflow = False
+                try:
+                    speech, tts_events = getattr(vc, method)(*args, output = arena.buf, **kwargs)
+                    with speech:
+                        size = len(speech)
+                except BufferError:
+                    overflow = True
+                if overflow:
+                    # The speech is longer than the arena, convert it again into a bytearray and replace the arena
+                    # with one large enough, which the pool attaches to by the new name
+                    speech, tts_events = getattr(vc, method)(*args, output = bytearray(), **kwargs)
+                    with speech:
+                        size = len(speech)
+                        new_arena = shared_memory.SharedMemory(create = True, size = max(size, arena.size * 2))
+                        arena.close()
+                        arena.unlink()
+                        arena = new_arena
+                        arena.buf[0:size] = speech
+                conn.send(("speech", (arena.name, size, tts_events)))
+            except Exception as e:
+                _SendError(conn, e)
+    finally:
+        if vc is not None:
+            vc.__exit__(None, None, None)
+        if arena is not None:
+            arena.close()
+            arena.unlink()
+
+def _JoinProcess(process, timeout):
+    # Wait for the process to exit, terminating and then killing it if it does not
+    process.join(timeout)
+    if process.is_alive():
+        process.terminate()
+        process.join(timeout)
+    if process.is_alive():
+        process.kill()
+        process.join()
+
+def _SendError(conn, e):
+    try:
+        conn.send(("error", e))
+    except Exception:
+        # The exception cannot be pickled
+        conn.send(("error", RuntimeError(repr(e))))
+
+class VcRoid2Pool(object):
+    '''
+    Pool of worker processes each of which drives its own VcRoid2.
+
+    The engine runs one conversion at a time per process, so the pool converts
+    as many requests at the same time as it has processes.
+    Requests are dispatched to idle workers in order and at most max_pending requests are accepted at a time.
+    The engine of each worker writes the speech into shared memory, which the pool copies once into the result,
+    and only AIKANA and event data are pickled.
+    A worker process which exits unexpectedly fails its request and is restarted.
+    '''
+    __METHODS = ("textToKana", "kanaToSpeech", "textToSpeech")
+
+    def __init__(self, language_name, voice_name, *, processes = None, install_path = None, install_path_x86 = None,
+            engine_factory = None, param = None, max_pending = None, arena_bytes = 16 * 1024 * 1024, context = None):
+        '''
+        Start the worker processes and load the language and voice in each of them
+
+        Parameters
+        ----------
+        language_name : string
+            Name of the language library to load.
+        voice_name : string
+            Name of the voice library to load.
+        processes : int
+            Number of worker processes. The number of CPUs is used if not specified.
+        install_path, install_path_x86 : string
+            See VcRoid2.
+        engine_factory : callable
+            Picklable callable which creates the engine backend in each worker, such as
+            functools.partial(simulator.SimulatedEngine, ...). aitalked.dll is used if None.
+        param : dict
+            Values set to the attributes of VcRoid2.param in each worker, such as {"speed": 1.2}.
+        max_pending : int
+            Number of requests accepted at a time, submit() blocks while it is reached.
+            4 times processes if not specified.
+        arena_bytes : int
+            Initial size of the shared memory each worker hands the speech back through.
+            A speech longer than it is converted again and the shared memory is enlarged.
+        context : multiprocessing context
+            Context used to start the workers. The spawn context is used if not specified.
+        '''
+        if processes is None:
+            processes = os.cpu_count() or 1
+        if processes < 1:
+            raise ValueError("processes must be positive")
+        if max_pending is None:
+            max_pending = processes * 4
+        self.__context = multiprocessing.get_context("spawn") if context is None else context
+        self.__options = {
+            "language_name": language_name,
+            "voice_name": voice_name,
+            "install_path": install_path,
+            "install_path_x86": install_path_x86,
+            "engine_factory": engine_factory,
+            "param": dict(param or {}),
+            "arena_bytes": arena_bytes,
+        }
+        self.__lock = threading.Lock()
+        self.__slots = threading.BoundedSemaphore(max_pending)
+        self.__pending = collections.deque()
+        self.__workers = []
+        self.__closed = False
+        self.__failure = None
+        self.__restarts = 0
+        self.__collector = None
+        self.__wake_reader, self.__wake_writer = multiprocessing.Pipe(duplex = False)
+
+        # Wait until every worker is ready so that a broken setup is reported here
+        try:
+            for _ in range(processes):
+                self.__workers.append(self.__startWorker())
+            for worker in self.__workers:
+                try:
+                    kind, value = worker.conn.recv()
+                except EOFError:
+                    raise RuntimeError("worker process exited during initialization")
+                if kind != "ready":
+                    raise value
+                worker.ready = True
+        except BaseException:
+            self.__closed = True
+            self.__stopWorkers()
+            raise
+        self.__collector = threading.Thread(target = self.__collect, name = "VcRoid2Pool", daemon = True)
+        self.__collector.start()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        '''
+        Stop the worker processes. Requests not dispatched yet fail with RuntimeError.
+        '''
+        with self.__lock:
+            if self.__closed:
+                return
+            self.__closed = True
+            pending = list(self.__pending)
+            self.__pending.clear()
+        for future, _, _, _ in pending:
+            if future.set_running_or_notify_cancel():
+                future.set_exception(RuntimeError("pool is closed"))
+        self.__wake_writer.send(None)
+        if (self.__collector is not None) and (self.__collector is not threading.current_thread()):
+            self.__collector.join()
+        self.__stopWorkers()
+
+    @property
+    def processes(self):
+        '''
+        Number of worker processes : int
+        '''
+        return len(self.__workers)
+
+    @property
+    def restarts(self):
+        '''
+        Number of worker processes restarted after exiting unexpectedly : int
+        '''
+        return self.__restarts
+
+    def submit(self, method, *args, **kwargs):
+        '''
+        Request a conversion to a worker
+
+        Parameters
+        ----------
+        method : string
+            "textToKana", "kanaToSpeech" or "textToSpeech".
+        args, kwargs
+            Arguments of the method of VcRoid2 except output.
+
+        Returns
+        -------
+        future : concurrent.futures.Future
+            Future of the result of the method.
+            The speech is bytes.
+        '''
+        if method not in VcRoid2Pool.__METHODS:
+            raise ValueError("unknown method: {}".format(method))
+        self.__slots.acquire()
+        future = concurrent.futures.Future()
+        future.add_done_callback(lambda _: self.__slots.release())
+        with self.__lock:
+            if self.__closed:
+                failure = RuntimeError("pool is closed")
+            else:
+                failure = self.__failure
+            if failure is None:
+                self.__pending.append((future, method, args, kwargs))
+                self.__dispatch()
+        if failure is not None:
+            future.set_exception(failure)
+        return future
+
+    def textToKana(self, text, *, timeout = None):
+        '''
+        Convert text to AIKANA in a worker. See VcRoid2.textToKana().
+        '''
+        return self.submit("textToKana", text, timeout = timeout).result()
+
+    def kanaToSpeech(self, kana, *, timeout = None, raw = False, preset = None, buffers = None):
+        '''
+        Convert AIKANA to audio data in a worker. See VcRoid2.kanaToSpeech().
+        '''
+        return self.submit("kanaToSpeech", kana, timeout = timeout, raw = raw, preset = preset, buffers = buffers).result()
+
+    def textToSpeech(self, text, *, timeout = None, raw = False, direct = False, chunk_length = None, preset = None, buffers = None):
+        '''
+        Convert text to audio data in a worker. See VcRoid2.textToSpeech().
+        '''
+        return self.submit("textToSpeech", text, timeout = timeout, raw = raw, direct = direct, chunk_length = chunk_length, preset = preset, buffers = buffers).result()
+
+    def __startWorker(self):
+        parent_conn, child_conn = self.__context.Pipe()
+        process = self.__context.Process(target = _RunWorker, args = (child_conn, self.__options), daemon = True)
+        process.start()
+        child_conn.close()
+        return _Worker(process, parent_conn)
+
+    def __stopWorkers(self):
+        for worker in self.__workers:
+            try:
+                worker.conn.send(None)
+            except OSError:
+                pass
+        for worker in self.__workers:
+            _JoinProcess(worker.process, 5.0)
+            worker.conn.close()
+            worker.closeArena()
+            if worker.request is not None:
+                worker.request[0].set_exception(RuntimeError("pool is closed"))
+                worker.request = None
+        self.__workers = []
+
+    def __dispatch(self):
+        # Hand the pending requests to idle workers, called with the lock held
+        for worker in self.__workers:
+            while (0 < len(self.__pending)) and worker.ready and (worker.request is None):
+                request = self.__pending.popleft()
+                if not request[0].set_running_or_notify_cancel():
+                    continue
+                worker.request = request
+                try:
+                    worker.conn.send(request[1:])
+                except OSError:
+                    # The collector fails the request when it notices the exit
+                    pass
+
+    def __collect(self):
+        # Receive the results and watch the workers until the pool is closed
+        while True:
+            with self.__lock:
+                workers = list(self.__workers)
+            objects = [self.__wake_reader] + [worker.conn for worker in workers] + [worker.process.sentinel for worker in workers]
+            ready = multiprocessing.connection.wait(objects)
+            if self.__wake_reader in ready:
+                return
+            for worker in workers:
+                if worker.conn in ready:
+                    try:
+                        message = worker.conn.recv()
+                    except (EOFError, OSError):
+                        self.__restart(worker)
+                        continue
+                    self.__receive(worker, message)
+                elif worker.process.sentinel in ready:
+                    self.__restart(worker)
+
+    def __receive(self, worker, message):
+        kind, value = message
+        if not worker.ready:
+            if kind == "ready":
+                with self.__lock:
+                    worker.ready = True
+                    self.__dispatch()
+            else:
+                # A restarted worker failed to initialize, give up on it
+                self.__remove(worker, value)
+            return
+
+        request = worker.request
+        if kind == "speech":
+            name, size, tts_events = value
+            try:
+                if (worker.arena is None) or (worker.arena.name != name):
+                    worker.closeArena()
+                    worker.arena = shared_memory.SharedMemory(name = name)
+                speech = bytes(worker.arena.buf[0:size])
+                kind, value = "result", (speech, tts_events)
+            except Exception as e:
+                kind, value = "error", e
+        with self.__lock:
+            worker.request = None
+            self.__dispatch()
+        if request is not None:
+            if kind == "result":
+                request[0].set_result(value)
+            else:
+                request[0].set_exception(value)
+
+    def __restart(self, worker):
+        # The pipe may break before the process exits
+        _JoinProcess(worker.process, 5.0)
+        if worker.arena is not None:
+            # The worker cannot release its arena any more
+            try:
+                worker.arena.unlink()
+            except OSError:
+                pass
+            worker.closeArena()
+        request = worker.request
+        worker.request = None
+        if request is not None:
+            request[0].set_exception(RuntimeError("worker process exited with code {}".format(worker.process.exitcode)))
+        if not worker.ready:
+            self.__remove(worker, RuntimeError("worker process exited during initialization"))
+            return
+        worker.conn.close()
+        with self.__lock:
+            if self.__closed or (worker not in self.__workers):
+                return
+            self.__workers[self.__workers.index(worker)] = self.__startWorker()
+            self.__restarts += 1
+
+    def __remove(self, worker, failure):
+        _JoinProcess(worker.process, 5.0)
+        worker.conn.close()
+        with self.__lock:
+            if worker in self.__workers:
+                self.__workers.remove(worker)
+            if 0 < len(self.__workers):
+                return
+            # No worker is left to convert the pending requests
+            self.__failure = failure
+            pending = list(self.__pending)
+            self.__pending.clear()
+        for future, _, _, _ in pending:
+            if future.set_running_or_notify_cancel():
+                future.set_exception(failure)
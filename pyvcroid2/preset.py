@@ -0,0 +1,148 @@
+from ctypes import c_float
+
+# Name of each parameter, its type and range which the values are clamped to
+RANGES = {
+    "masterVolume": (float, 0.0, 5.0),
+    "volume": (float, 0.0, 2.0),
+    "speed": (float, 0.5, 4.0),
+    "pitch": (float, 0.5, 2.0),
+    "emphasis": (float, 0.0, 2.0),
+    "pauseMiddle": (int, 80, 500),
+    "pauseLong": (int, 100, 2000),
+    "pauseSentence": (int, 200, 10000),
+}
+
+# Arguments of Preset() in the order of the values
+_ARGUMENTS = ("master_volume", "volume", "speed", "pitch", "emphasis", "pause_middle", "pause_long", "pause_sentence")
+
+class Preset(object):
+    '''
+    Immutable set of the voice parameters that Param exposes.
+
+    A preset can be passed to each conversion instead of changing Param,
+    and compares equal and hashes the same as another preset of the same values.
+    The values are clamped to their ranges and the floats are rounded to single precision
+    as the engine holds them, so that a preset equals the one read back from Param.
+    Usually created by Param.createPreset().
+    '''
+
+    def __init__(self, *, master_volume, volume, speed, pitch, emphasis, pause_middle, pause_long, pause_sentence):
+        '''
+        Parameters
+        ----------
+        master_volume, volume, speed, pitch, emphasis : float
+            See Param.masterVolume, Param.volume, Param.speed, Param.pitch and Param.emphasis.
+        pause_middle, pause_long, pause_sentence : int
+            See Param.pauseMiddle, Param.pauseLong and Param.pauseSentence.
+        '''
+        self.__values = (
+            Preset.__Clamp("masterVolume", master_volume),
+            Preset.__Clamp("volume", volume),
+            Preset.__Clamp("speed", speed),
+            Preset.__Clamp("pitch", pitch),
+            Preset.__Clamp("emphasis", emphasis),
+            Preset.__Clamp("pauseMiddle", pause_middle),
+            Preset.__Clamp("pauseLong", pause_long),
+            Preset.__Clamp("pauseSentence", pause_sentence),
+        )
+
+    def __eq__(self, other):
+        if not isinstance(other, Preset):
+            return NotImplemented
+        return self.__values == other.__values
+
+    def __hash__(self):
+        return hash(self.__values)
+
+    def __repr__(self):
+        return "Preset({})".format(", ".join("{} = {!r}".format(name, value) for name, value in zip(_ARGUMENTS, self.__values)))
+
+    @property
+    def masterVolume(self):
+        '''
+        Master volume (マスター音量) : float
+        '''
+        return self.__values[0]
+
+    @property
+    def volume(self):
+        '''
+        Volume (音量) : float
+        '''
+        return self.__values[1]
+
+    @property
+    def speed(self):
+        '''
+        Speed (話速) : float
+        '''
+        return self.__values[2]
+
+    @property
+    def pitch(self):
+        '''
+        Pitch (高さ) : float
+        '''
+        return self.__values[3]
+
+    @property
+    def emphasis(self):
+        '''
+        Emphasis (抑揚) : float
+        '''
+        return self.__values[4]
+
+    @property
+    def pauseMiddle(self):
+        '''
+        Middle pause (短ポーズ時間) [ms] : int
+        '''
+        return self.__values[5]
+
+    @property
+    def pauseLong(self):
+        '''
+        Long pause (長ポーズ時間) [ms] : int
+        '''
+        return self.__values[6]
+
+    @property
+    def pauseSentence(self):
+        '''
+        Sentence pause (文末ポーズ時間) [ms] : int
+        '''
+        return self.__values[7]
+
+    def replace(self, **kwargs):
+        '''
+        Create a preset whose values are replaced by the arguments
+
+        Parameters
+        ----------
+        kwargs
+            Arguments of Preset() to replace, such as speed = 1.2.
+
+        Returns
+        -------
+        preset : Preset
+        '''
+        values = self.toDict()
+        values.update(kwargs)
+        return Preset(**values)
+
+    def toDict(self):
+        '''
+        Values as the arguments of Preset()
+
+        Returns
+        -------
+        values : dict
+        '''
+        return dict(zip(_ARGUMENTS, self.__values))
+
+    def __Clamp(name, value):
+        value_type, minimum, maximum = RANGES[name]
+        value = max(minimum, min(value_type(value), maximum))
+        if value_type is float:
+            value = c_float(value).value
+        return value
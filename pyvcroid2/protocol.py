@@ -0,0 +1,69 @@
+import json
+import struct
+
+# The body of a speech response is a sequence of frames, each of which is
+# the kind (1 byte), the size of the payload (4 bytes, little endian) and the payload.
+FRAME_AUDIO = b"A"  # Chunk of the speech
+FRAME_EVENTS = b"E" # JSON array of [tick, event type, value] falling inside the previous chunk
+FRAME_ERROR = b"X"  # JSON object with "error", the conversion failed
+FRAME_END = b"Z"    # Empty, the conversion finished
+
+_HEADER = struct.Struct("<cI")
+
+def encodeFrame(kind, payload = b""):
+    '''
+    Encode a frame
+
+    Parameters
+    ----------
+    kind : bytes
+        One of FRAME_*.
+    payload : bytes-like object
+        The payload.
+
+    Returns
+    -------
+    frame : bytes
+    '''
+    return _HEADER.pack(kind, len(payload)) + bytes(payload)
+
+def encodeJson(value):
+    '''
+    Encode a value into the payload of JSON
+    '''
+    return json.dumps(value, ensure_ascii = False).encode("utf-8")
+
+def readFrame(stream):
+    '''
+    Read a frame
+
+    Parameters
+    ----------
+    stream : file object
+        Object having read().
+
+    Returns
+    -------
+    kind : bytes
+        One of FRAME_*, None at the end of the stream.
+    payload : bytes
+    '''
+    header = _ReadExactly(stream, _HEADER.size)
+    if header is None:
+        return None, b""
+    kind, size = _HEADER.unpack(header)
+    payload = _ReadExactly(stream, size)
+    if payload is None:
+        raise EOFError("frame is truncated")
+    return kind, payload
+
+def _ReadExactly(stream, size):
+    data = b""
+    while len(data) < size:
+        part = stream.read(size - len(data))
+        if not part:
+            if len(data) == 0:
+                return None
+            raise EOFError("frame is truncated")
+        data += part
+    return data
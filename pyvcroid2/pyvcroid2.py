@@ -1,23 +1,44 @@
-import sys
-import os
-import io
+# asyncio, concurrent.futures and the DLL binding are imported where they are used to keep importing the package cheap
+import collections
+import hashlib
+import itertools
+import queue
 import threading
+import time
 from ctypes import *
-from enum import Enum
 from . import aitalk
-
-class TtsEventType(Enum):
-    PHONETIC = 0
-    POSITION = 1
-    BOOKMARK = 2
+from .events import TtsEventType
+from .shiftjis import calculateShiftJisCharacterPositions, replaceIrqMark
+from .output import BufferOutput, SinkOutput, createWaveHeader, WAVE_HEADER_SIZE
+from .segment import splitText
+from .batch import joinTexts, splitKana, joinKana, splitSpeech
+from .script import planScript
+from .job import Job, JobSlots
+from .preset import Preset, RANGES
+from .voice import Voice
+from .metrics import JobMetrics
+from .buffers import resolveBufferSizes
+
+# Plain integers compared in the callbacks instead of the enumerations
+_SUCCESS = aitalk.ResultCode.SUCCESS.value
+_TEXTBUF_FULL = aitalk.EventReasonCode.TEXTBUF_FULL.value
+_TEXTBUF_FLUSH = aitalk.EventReasonCode.TEXTBUF_FLUSH.value
+_TEXTBUF_CLOSE = aitalk.EventReasonCode.TEXTBUF_CLOSE.value
+_RAWBUF_FULL = aitalk.EventReasonCode.RAWBUF_FULL.value
+_RAWBUF_FLUSH = aitalk.EventReasonCode.RAWBUF_FLUSH.value
+_RAWBUF_CLOSE = aitalk.EventReasonCode.RAWBUF_CLOSE.value
+_PH_LABEL = aitalk.EventReasonCode.PH_LABEL.value
+_BOOKMARK = aitalk.EventReasonCode.BOOKMARK.value
+_AUTO_BOOKMARK = aitalk.EventReasonCode.AUTO_BOOKMARK.value
 
 class VcRoid2(object):
     __SAMPLE_RATE = 44100 # Don't change this value
     __MSEC_TIMEOUT = 10000
     __LEN_TEXT_BUF_MAX = 65536
     __LEN_RAW_BUF_MAX = 1048576
+    __LEN_OUTPUT_BUF_KEEP = 16777216
 
-    def __init__(self, *, install_path = None, install_path_x86 = None):
+    def __init__(self, *, install_path = None, install_path_x86 = None, engine = None, kana_cache = None, audio_cache = None, max_jobs = 2, max_voices = None, metrics = None, buffers = "default"):
         '''
         Load DLL and initialize
 
@@ -30,74 +51,64 @@ class VcRoid2(object):
             Install path of VOICEROID2 (x86 version).
             This is same as install_path when the python is running 32 bit mode.
             The default path is used if not specified.
-        '''
-        self.__dll = None
+        engine : object
+            Engine backend to use instead of aitalked.dll, such as simulator.SimulatedEngine.
+            install_path and install_path_x86 are ignored if specified.
+        kana_cache : cache.KanaCache
+            Cache of the results of textToKana(). Nothing is cached if None.
+        audio_cache : cache.AudioCache
+            Cache of the results of kanaToSpeech(). Nothing is cached if None.
+        max_jobs : int
+            Number of jobs run by the engine at the same time.
+            Conversions requested beyond this wait for a running one to finish.
+        max_voices : int
+            Number of voice libraries kept loaded. See loadVoice().
+            Voices are never unloaded if None.
+        metrics : callable
+            Hook called with metrics.JobMetrics of each job when it is closed, such as metrics.PrometheusExporter.
+            Nothing is measured if None.
+        buffers : buffers.BufferSizes or string
+            Sizes of the text and raw buffers of the conversions which do not specify them,
+            "latency", "throughput", "default" for the defaults of the voice, or "adaptive"
+            for "latency" in the streaming conversions and "throughput" in the others.
+            See buffers.resolveBufferSizes().
+        '''
+        self.__engine = None
         self.__is_opened = False
-        self.__install_path = None
-        self.__install_path_x86 = None
-        self.__param = None
-        self.__default_parameter = None
-        self.__parameter = None
-        
-        # Acquire the install path
-        if install_path is None:
-            if 2**32 <= sys.maxsize:
-                # Find 64bit DLL
-                rfid = c_char_p(b"\x77\x93\x80\x6D\xF0\x6A\x4B\x44\x89\x57\xA3\x77\x3F\x02\x20\x0E")
-            else:
-                # Find 32bit DLL
-                rfid = c_char_p(b"\xEF\x40\x5A\x7C\xFB\xA0\xFC\x4B\x87\x4A\xC0\xF2\xE0\xB9\xFA\x8E")
-            pwstr = c_wchar_p()
-            windll.shell32.SHGetKnownFolderPath(rfid, c_uint32(0), c_void_p(), byref(pwstr))
-            program_files_path = wstring_at(pwstr)
-            windll.ole32.CoTaskMemFree(pwstr)
-            self.__install_path = program_files_path + "\\AHS\\VOICEROID2"
-        else:
-            self.__install_path = install_path
-
-        # Acquire the install path (x86 version)
-        if install_path_x86 is None:
-            rfid = c_char_p(b"\xEF\x40\x5A\x7C\xFB\xA0\xFC\x4B\x87\x4A\xC0\xF2\xE0\xB9\xFA\x8E")
-            pwstr = c_wchar_p()
-            windll.shell32.SHGetKnownFolderPath(rfid, c_uint32(0), c_void_p(), byref(pwstr))
-            program_files_x86_path = wstring_at(pwstr)
-            windll.ole32.CoTaskMemFree(pwstr)
-            self.__install_path_x86 = program_files_x86_path + "\\AHS\\VOICEROID2"
-        else:
-            self.__install_path_x86 = install_path_x86
-
-        # Open the DLL
-        self.__dll = windll.LoadLibrary(self.__install_path + "\\aitalked.dll")
-        self.__dll.AITalkAPI_Init.argtypes = [POINTER(aitalk.TConfig)]
-        self.__dll.AITalkAPI_Init.restype = aitalk.ResultCode
-        self.__dll.AITalkAPI_LangClear.restype = aitalk.ResultCode
-        self.__dll.AITalkAPI_LangLoad.restype = aitalk.ResultCode
-        self.__dll.AITalkAPI_ReloadPhraseDic.restype = aitalk.ResultCode
-        self.__dll.AITalkAPI_ReloadWordDic.restype = aitalk.ResultCode
-        self.__dll.AITalkAPI_ReloadSymbolDic.restype = aitalk.ResultCode
-        self.__dll.AITalkAPI_VoiceClear.restype = aitalk.ResultCode
-        self.__dll.AITalkAPI_VoiceLoad.restype = aitalk.ResultCode
-        self.__dll.AITalkAPI_GetParam.restype = aitalk.ResultCode
-        self.__dll.AITalkAPI_SetParam.restype = aitalk.ResultCode
-        self.__dll.AITalkAPI_TextToKana.argtypes = [POINTER(c_int32), POINTER(aitalk.TJobParam), c_char_p]
-        self.__dll.AITalkAPI_TextToKana.restype = aitalk.ResultCode
-        self.__dll.AITalkAPI_CloseKana.restype = aitalk.ResultCode
-        self.__dll.AITalkAPI_GetKana.restype = aitalk.ResultCode
-        self.__dll.AITalkAPI_TextToSpeech.argtypes = [POINTER(c_int32), POINTER(aitalk.TJobParam), c_char_p]
-        self.__dll.AITalkAPI_TextToSpeech.restype = aitalk.ResultCode
-        self.__dll.AITalkAPI_CloseSpeech.restype = aitalk.ResultCode
-        self.__dll.AITalkAPI_GetData.restype = aitalk.ResultCode
+        self.__voice = None
+        self.__voices = collections.OrderedDict()
+        self.__max_voices = max_voices
+        self.__voice_switch_time = None
+        self.__engine_voice = None
+        self.__engine_preset = None
+        self.__parameter_lock = threading.Lock()
+        self.__jobs = {}
+        self.__job_keys = itertools.count(1)
+        self.__job_slots = JobSlots(max_jobs)
+        self.__callbacks = VcRoid2.__CreateCallbacks(self.__jobs)
+        self.__scratch_lock = threading.Lock()
+        self.__scratch = {}
+        self.__output_bufs = []
+        self.__language = None
+        self.__dictionaries = {}
+        self.__kana_context = None
+        self.__dictionary_generation = 0
+        self.__kana_cache = kana_cache
+        self.__audio_cache = audio_cache
+        self.__metrics = metrics
+        resolveBufferSizes(buffers, False)
+        self.__buffers = buffers
+        self.__engine_buffers = None
+
+        # Open the engine
+        if engine is None:
+            from .engine import DllEngine
+            engine = DllEngine(install_path, install_path_x86)
+        self.__engine = engine
         
         # Initialize DLL
-        config = aitalk.TConfig(
-            hzVoiceDB = VcRoid2.__SAMPLE_RATE,
-            dirVoiceDBS = (self.__install_path_x86 + "\\Voice").encode("shift-jis"),
-            msecTimeout = VcRoid2.__MSEC_TIMEOUT,
-            pathLicense = (self.__install_path + "\\aitalk.lic").encode("shift-jis"),
-            codeAuthSeed = b"ORXJC6AIWAUKDpDbH2al",
-            __reserved__ = 0
-        )
-        result = self.__dll.AITalkAPI_Init(config)
+        config = self.__engine.createConfig(VcRoid2.__SAMPLE_RATE, VcRoid2.__MSEC_TIMEOUT)
+        result = self.__engine.AITalkAPI_Init(config)
         if result != aitalk.ResultCode.SUCCESS:
             raise Exception(result)
         self.__is_opened = True
@@ -113,9 +124,9 @@ class VcRoid2(object):
 
     def __close(self):
         if self.__is_opened:
-            self.__dll.AITalkAPI_End()
+            self.__engine.AITalkAPI_End()
             self.__is_opened = False
-        self.__dll = None
+        self.__engine = None
 
     def isOpened(self):
         '''
@@ -135,12 +146,7 @@ class VcRoid2(object):
         -------
         language_list : string[]
         '''
-        result = []
-        with os.scandir(self.__install_path_x86 + "\\Lang") as it:
-            for entry in it:
-                if not entry.name.startswith(".") and entry.is_dir():
-                    result.append(entry.name)
-        return result
+        return self.__engine.listLanguages()
 
     def loadLanguage(self, language_name):
         '''
@@ -156,20 +162,15 @@ class VcRoid2(object):
             raise RuntimeError()
 
         # Unload current voice library
-        result = self.__dll.AITalkAPI_LangClear()
+        result = self.__engine.AITalkAPI_LangClear()
         if (result != aitalk.ResultCode.SUCCESS) and (result != aitalk.ResultCode.NOT_LOADED):
             raise Exception(result)
 
         # Load new language library
-        language_path = c_char_p((self.__install_path_x86 + "\\Lang\\" + language_name).encode("shift-jis"))
-        cd = os.getcwd()
-        try:
-            os.chdir(self.__install_path) # Change the current directory temporarily
-            result = self.__dll.AITalkAPI_LangLoad(language_path)
-        except Exception as e:
-            raise e
-        finally:
-            os.chdir(cd)
+        result = self.__engine.langLoad(language_name)
+        self.__language = language_name if result == aitalk.ResultCode.SUCCESS else None
+        self.__dictionaries = {}
+        self.__updateKanaContext()
         if result != aitalk.ResultCode.SUCCESS:
             raise Exception(result)
     
@@ -183,16 +184,7 @@ class VcRoid2(object):
             File path of the phrase dictionary
             ex. <Home Directory>\\Documents\\VOICEROID2\\フレーズ辞書\\user.pdic
         '''
-        if not self.__is_opened:
-            raise RuntimeError()
-        self.__dll.AITalkAPI_ReloadPhraseDic(c_void_p())
-        if path is None:
-            return
-        result = self.__dll.AITalkAPI_ReloadPhraseDic(c_char_p(path.encode("shift-jis")))
-        if result == aitalk.ResultCode.USERDIC_NOENTRY:
-            self.__dll.AITalkAPI_ReloadPhraseDic(c_void_p())
-        elif result != aitalk.ResultCode.SUCCESS:
-            raise Exception(result)
+        self.__reloadDictionary("phrase", self.__engine.AITalkAPI_ReloadPhraseDic, path)
         
     def reloadWordDictionary(self, path):
         '''
@@ -204,16 +196,7 @@ class VcRoid2(object):
             File path of the word dictionary
             ex. <Home Directory>\\Documents\\VOICEROID2\\単語辞書\\user.wdic
         '''
-        if not self.__is_opened:
-            raise RuntimeError()
-        self.__dll.AITalkAPI_ReloadWordDic(c_void_p())
-        if path is None:
-            return
-        result = self.__dll.AITalkAPI_ReloadWordDic(c_char_p(path.encode("shift-jis")))
-        if result == aitalk.ResultCode.USERDIC_NOENTRY:
-            self.__dll.AITalkAPI_ReloadWordDic(c_void_p())
-        elif result != aitalk.ResultCode.SUCCESS:
-            raise Exception(result)
+        self.__reloadDictionary("word", self.__engine.AITalkAPI_ReloadWordDic, path)
 
     def reloadSymbolDictionary(self, path):
         '''
@@ -225,16 +208,122 @@ class VcRoid2(object):
             File path of the symbol dictionary
             ex. <Home Directory>\\Documents\\VOICEROID2\\記号ポーズ辞書\\user.sdic
         '''
+        self.__reloadDictionary("symbol", self.__engine.AITalkAPI_ReloadSymbolDic, path)
+
+    def __reloadDictionary(self, kind, reload_function, path):
         if not self.__is_opened:
             raise RuntimeError()
-        self.__dll.AITalkAPI_ReloadSymbolDic(c_void_p())
-        if path is None:
+        # Drain the running jobs and hold off new ones so that no conversion sees a partially loaded dictionary
+        self.__job_slots.acquireAll()
+        try:
+            fingerprint = None
+            try:
+                reload_function(c_void_p())
+                if path is None:
+                    return
+                result = reload_function(c_char_p(path.encode("shift-jis")))
+                if result == aitalk.ResultCode.USERDIC_NOENTRY:
+                    reload_function(c_void_p())
+                elif result != aitalk.ResultCode.SUCCESS:
+                    raise Exception(result)
+                else:
+                    with open(path, "rb") as f:
+                        fingerprint = hashlib.sha256(f.read()).hexdigest()
+            finally:
+                self.__setDictionaryFingerprint(kind, fingerprint)
+        finally:
+            self.__job_slots.releaseAll()
+
+    def dictionaryFingerprint(self, kind):
+        '''
+        Acquire the SHA-256 of the user dictionary the engine has loaded
+
+        Parameters
+        ----------
+        kind : string
+            "phrase", "word" or "symbol"
+
+        Returns
+        -------
+        fingerprint : string
+            Hexadecimal digest of the file, None if no user dictionary is loaded.
+        '''
+        return self.__dictionaries.get(kind)
+
+    @property
+    def dictionaryGeneration(self):
+        '''
+        Number incremented whenever the language or a user dictionary changes : int
+        The AIKANA of a text, and the speech converted from the text, are valid only within a generation.
+        '''
+        return self.__dictionary_generation
+
+    def __setDictionaryFingerprint(self, kind, fingerprint):
+        # The kana depends on the language and dictionaries, drop the cached kana of the old ones
+        if self.__dictionaries.get(kind) == fingerprint:
             return
-        result = self.__dll.AITalkAPI_ReloadSymbolDic(c_char_p(path.encode("shift-jis")))
-        if result == aitalk.ResultCode.USERDIC_NOENTRY:
-            self.__dll.AITalkAPI_ReloadSymbolDic(c_void_p())
-        elif result != aitalk.ResultCode.SUCCESS:
-            raise Exception(result)
+        self.__dictionaries[kind] = fingerprint
+        self.__updateKanaContext()
+
+    def __updateKanaContext(self):
+        old_context = self.__kana_context
+        self.__kana_context = "{}\0{}\0{}\0{}".format(self.__language, self.__dictionaries.get("phrase"), self.__dictionaries.get("word"), self.__dictionaries.get("symbol"))
+        if old_context != self.__kana_context:
+            self.__dictionary_generation += 1
+            if self.__kana_cache is not None:
+                self.__kana_cache.invalidate(old_context)
+
+    @property
+    def kanaCache(self):
+        '''
+        Cache of the results of textToKana() : cache.KanaCache or None
+        '''
+        return self.__kana_cache
+
+    @kanaCache.setter
+    def kanaCache(self, value):
+        self.__kana_cache = value
+
+    @property
+    def audioCache(self):
+        '''
+        Cache of the results of kanaToSpeech() : cache.AudioCache or None
+        '''
+        return self.__audio_cache
+
+    @audioCache.setter
+    def audioCache(self, value):
+        self.__audio_cache = value
+
+    @property
+    def metrics(self):
+        '''
+        Hook called with the metrics of each job : callable or None
+        '''
+        return self.__metrics
+
+    @metrics.setter
+    def metrics(self, value):
+        self.__metrics = value
+
+    @property
+    def buffers(self):
+        '''
+        Sizes of the buffers of the conversions which do not specify them : buffers.BufferSizes or string
+        '''
+        return self.__buffers
+
+    @buffers.setter
+    def buffers(self, value):
+        resolveBufferSizes(value, False)
+        self.__buffers = value
+
+    @property
+    def maxJobs(self):
+        '''
+        Number of jobs run by the engine at the same time : int
+        '''
+        return self.__job_slots.capacity
 
     def listVoices(self):
         '''
@@ -244,16 +333,16 @@ class VcRoid2(object):
         -------
         voice_list : string[]
         '''
-        result = []
-        with os.scandir(self.__install_path_x86 + "\\Voice") as it:
-            for entry in it:
-                if not entry.name.startswith(".") and entry.is_dir():
-                    result.append(entry.name)
-        return result
+        return self.__engine.listVoices()
 
     def loadVoice(self, voice_name):
         '''
-        Load the voice library
+        Load the voice library and make it the current voice
+
+        The voices loaded before are kept with their parameters,
+        so that switching back to one of them only selects its cached parameters.
+        The engine unloads voices only all at once, so loading a voice beyond max_voices
+        unloads all of them and loads the ones recently used again.
 
         Parameters
         ----------
@@ -263,26 +352,114 @@ class VcRoid2(object):
         '''
         if not self.__is_opened:
             raise RuntimeError()
-        
-        # Unload current voice library
-        #result = self.__dll.AITalkAPI_VoiceClear()
-        #if (result != aitalk.ResultCode.SUCCESS) and (result != aitalk.ResultCode.NOT_LOADED):
-        #    raise Exception(result)
+        start = time.perf_counter()
+        with self.__parameter_lock:
+            voice = self.__voices.get(voice_name)
+            if voice is None:
+                self.__addVoices([voice_name])
+                voice = self.__voices[voice_name]
+            else:
+                self.__voices.move_to_end(voice_name)
+            self.__voice = voice
+        self.__voice_switch_time = time.perf_counter() - start
 
-        # Clear parameters
-        self.__param = None
-        self.__parameter = None
-        self.__default_parameter = None
+    def preloadVoices(self, voice_names):
+        '''
+        Load the voice libraries without changing the current voice
 
-        # Load new voice library
-        result = self.__dll.AITalkAPI_VoiceLoad(c_char_p(voice_name.encode("shift-jis")))
-        if result != aitalk.ResultCode.SUCCESS:
-            raise Exception(result)
+        Parameters
+        ----------
+        voice_names : string[]
+            The names of the voice libraries to load.
+        '''
+        if not self.__is_opened:
+            raise RuntimeError()
+        with self.__parameter_lock:
+            names = []
+            for name in voice_names:
+                if name in self.__voices:
+                    self.__voices.move_to_end(name)
+                elif name not in names:
+                    names.append(name)
+            if 0 < len(names):
+                self.__addVoices(names)
+
+    @property
+    def residentVoices(self):
+        '''
+        Names of the loaded voice libraries, the least recently used first : string[]
+        '''
+        return list(self.__voices.keys())
+
+    @property
+    def currentVoice(self):
+        '''
+        Name of the current voice : string or None
+        '''
+        voice = self.__voice
+        return None if voice is None else voice.name
+
+    def voiceParam(self, voice_name):
+        '''
+        Acquire the parameters of a loaded voice without making it the current voice
+
+        Parameters
+        ----------
+        voice_name : string
+            The name of the voice library.
+
+        Returns
+        -------
+        param : Param
+            Parameters of the voice, None if it is not loaded.
+        '''
+        voice = self.__voices.get(voice_name)
+        return None if voice is None else voice.param
+
+    @property
+    def voiceSwitchTime(self):
+        '''
+        Seconds the last loadVoice() took : float or None
+        '''
+        return self.__voice_switch_time
+
+    def __addVoices(self, names):
+        # Called with the parameter lock held
+        resident = list(self.__voices.keys())
+        if (self.__max_voices is not None) and (self.__max_voices < len(resident) + len(names)):
+            if self.__max_voices < len(names):
+                raise ValueError("more voices than max_voices")
+            # Unload the least recently used voices by loading the rest again
+            resident = resident[len(resident) + len(names) - self.__max_voices:]
+            result = self.__engine.AITalkAPI_VoiceClear()
+            if (result != aitalk.ResultCode.SUCCESS) and (result != aitalk.ResultCode.NOT_LOADED):
+                raise Exception(result)
+            names = resident + names
+            resident = []
+
+        # Load new voice libraries, the structures are rebuilt with those loaded even if one fails
+        try:
+            for name in names:
+                result = self.__engine.AITalkAPI_VoiceLoad(c_char_p(name.encode("shift-jis")))
+                if result != aitalk.ResultCode.SUCCESS:
+                    raise Exception(result)
+                resident.append(name)
+        finally:
+            self.__rebuildVoices(resident)
+
+    def __rebuildVoices(self, names):
+        # The size of the parameter changes with the loaded voices, rebuild the structures of all of them
+        previous = self.__voices
+        self.__voices = collections.OrderedDict()
+        self.__engine_voice = None
+        current = self.__voice
+        self.__voice = None
+        if len(names) == 0:
+            return
 
         # Get parameter size
         param_size = c_uint32(0)
-        self.__dll.AITalkAPI_GetParam.argtypes = [c_void_p, POINTER(c_uint32)]
-        result = self.__dll.AITalkAPI_GetParam(c_void_p(), byref(param_size))
+        result = self.__engine.AITalkAPI_GetParam(c_void_p(), byref(param_size))
         if result != aitalk.ResultCode.INSUFFICIENT:
             raise Exception(result)
         speaker_count = (param_size.value - sizeof(aitalk.createTtsParam(0))) // sizeof(aitalk.TSpeakerParam)
@@ -292,23 +469,47 @@ class VcRoid2(object):
         # Get default parameter
         TTtsParam = aitalk.createTtsParam(speaker_count)
         param_size = c_uint32(sizeof(TTtsParam))
-        self.__default_parameter = TTtsParam()
-        self.__default_parameter.size = c_uint32(sizeof(TTtsParam))
-        self.__dll.AITalkAPI_SetParam.argtypes = [POINTER(TTtsParam)]
-        self.__dll.AITalkAPI_GetParam.argtypes = [POINTER(TTtsParam), POINTER(c_uint32)]
-        result = self.__dll.AITalkAPI_GetParam(self.__default_parameter, byref(param_size))
+        default_parameter = TTtsParam()
+        default_parameter.size = c_uint32(sizeof(TTtsParam))
+        result = self.__engine.AITalkAPI_GetParam(byref(default_parameter), byref(param_size))
         if result != aitalk.ResultCode.SUCCESS:
             raise Exception(result)
-        
+
+        for name in names:
+            self.__voices[name] = self.__createVoice(name, default_parameter, previous.get(name))
+        if current is not None:
+            self.__voice = self.__voices.get(current.name)
+
+    def __createVoice(self, name, default_parameter, previous):
+        TTtsParam = type(default_parameter)
+
+        # The voice name selects the speaker
+        voice_default_parameter = TTtsParam()
+        memmove(addressof(voice_default_parameter), addressof(default_parameter), sizeof(TTtsParam))
+        voice_default_parameter.voiceName = name.encode("shift-jis")
+        if previous is not None:
+            VcRoid2.__CopySpeakers(voice_default_parameter, previous.defaultParameter)
+
         # Copy
-        self.__parameter = TTtsParam()
-        memmove(addressof(self.__parameter), addressof(self.__default_parameter), sizeof(TTtsParam))
-        self.__param = Param(self.__default_parameter, self.__parameter)
+        parameter = TTtsParam()
+        memmove(addressof(parameter), addressof(voice_default_parameter), sizeof(TTtsParam))
+        if previous is not None:
+            parameter.volume = previous.parameter.volume
+            VcRoid2.__CopySpeakers(parameter, previous.parameter)
 
         # Set some parameters
-        self.__parameter.pauseBegin = 0
-        self.__parameter.pauseTerm = 0
-        self.__parameter.extendFormat = aitalk.ExtendFormat.JEITA_RUBY | aitalk.ExtendFormat.AUTO_BOOKMARK
+        parameter.pauseBegin = 0
+        parameter.pauseTerm = 0
+        parameter.extendFormat = aitalk.ExtendFormat.JEITA_RUBY | aitalk.ExtendFormat.AUTO_BOOKMARK
+
+        # Callbacks dispatching to the running jobs
+        parameter.procTextBuf, parameter.procRawBuf, parameter.procEventTts = self.__callbacks
+
+        # Copy set to the engine, which param does not write into while jobs are running
+        engine_parameter = TTtsParam()
+        memmove(addressof(engine_parameter), addressof(parameter), sizeof(TTtsParam))
+        return Voice(name, voice_default_parameter, parameter, engine_parameter,
+            Param(voice_default_parameter, parameter), Param(voice_default_parameter, engine_parameter))
 
     def listSpeakers(self):
         '''
@@ -318,18 +519,23 @@ class VcRoid2(object):
         -------
         speaker_list : string[]
         '''
-        if self.__parameter is None:
+        if self.__voice is None:
             raise RuntimeError()
-        speaker_count = min(self.__parameter.numSpeakers, len(self.__parameter.speaker))
+        parameter = self.__voice.parameter
+        speaker_count = min(parameter.numSpeakers, len(parameter.speaker))
         result = []
         for index in range(speaker_count):
-            speaker_param = self.__parameter.speaker[index]
+            speaker_param = parameter.speaker[index]
             result.append(speaker_param.voiceName.decode("shift-jis"))
         return result
 
     @property
     def param(self):
-        return self.__param
+        '''
+        Parameters of the current voice : Param
+        The object is replaced when the set of loaded voices changes.
+        '''
+        return None if self.__voice is None else self.__voice.param
 
     def textToKana(self, text, *, timeout = None):
         '''
@@ -350,64 +556,105 @@ class VcRoid2(object):
         if not self.__is_opened:
             raise RuntimeError()
 
-        # Create variables used by the callback
+        # Look up the cache
+        kana_cache = self.__kana_cache
+        kana_context, generation = self.__kana_context, self.__dictionary_generation
+        if kana_cache is not None:
+            kana = kana_cache.get(kana_context, text)
+            if kana is not None:
+                return kana
+
+        kana = self.__kana(text, timeout)
+        if (kana_cache is not None) and (generation == self.__dictionary_generation):
+            # Not stored if the dictionaries were reloaded during the conversion
+            kana_cache.put(kana_context, text, kana)
+        return kana
+
+    def __kana(self, text, timeout):
+        # Start the conversion and wait for it
         event = threading.Event()
+        shiftjis_string, shiftjis_positions = calculateShiftJisCharacterPositions(text)
+        job, output = self.__createKanaJob(event.set)
+        self.__startJob(job, shiftjis_string, timeout)
+        try:
+            event_flag = event.wait(timeout)
+        finally:
+            self.__closeJob(job)
+        if event_flag == False:
+            raise TimeoutError()
+        return replaceIrqMark(output.decode("shift-jis"), shiftjis_positions)
+
+    async def atextToKana(self, text, *, timeout = None):
+        '''
+        Convert text to AIKANA without blocking the event loop.
+        Cancelling the awaiting task closes the job. See textToKana().
+        '''
+        if not self.__is_opened:
+            raise RuntimeError()
+
+        # Look up the cache
+        kana_cache = self.__kana_cache
+        kana_context, generation = self.__kana_context, self.__dictionary_generation
+        if kana_cache is not None:
+            kana = kana_cache.get(kana_context, text)
+            if kana is not None:
+                return kana
+
+        # Start the conversion and wait for it
+        import asyncio
+        loop = asyncio.get_running_loop()
+        done = loop.create_future()
+        shiftjis_string, shiftjis_positions = calculateShiftJisCharacterPositions(text)
+        job, output = self.__createKanaJob(VcRoid2.__CreateNotifier(loop, lambda: VcRoid2.__Complete(done)))
+        await self.__astartJob(job, shiftjis_string, timeout)
+        try:
+            await VcRoid2.__WaitFor(done, timeout)
+        finally:
+            self.__closeJob(job)
+
+        kana = replaceIrqMark(output.decode("shift-jis"), shiftjis_positions)
+        if (kana_cache is not None) and (generation == self.__dictionary_generation):
+            # Not stored if the dictionaries were reloaded during the conversion
+            kana_cache.put(kana_context, text, kana)
+        return kana
+
+    def __createKanaJob(self, notify):
+        # Create variables used by the callback
         output = bytearray()
-        text_buf = (c_char * min(self.__parameter.lenTextBufBytes, VcRoid2.__LEN_TEXT_BUF_MAX))()
+        sizes = resolveBufferSizes(self.__buffers, False)
+        text_buf_bytes = sizes.textBufBytes or self.__voice.parameter.lenTextBufBytes
+        text_buf = self.__acquireScratch(min(text_buf_bytes, VcRoid2.__LEN_TEXT_BUF_MAX))
+        text_buf_size = sizeof(text_buf)
+        bytes_read = c_uint32()
+        bytes_read_ref = byref(bytes_read)
+        position_ref = byref(c_uint32())
+        get_kana = self.__engine.AITalkAPI_GetKana
+        metrics = None if self.__metrics is None else JobMetrics("kana", None)
 
         # Create callback function
         def callback(reason_code, job_id, user_data):
-            reason = aitalk.EventReasonCode(reason_code)
-            if (reason != aitalk.EventReasonCode.TEXTBUF_FULL) and (reason != aitalk.EventReasonCode.TEXTBUF_FLUSH) and (reason != aitalk.EventReasonCode.TEXTBUF_CLOSE):
+            if (reason_code != _TEXTBUF_FULL) and (reason_code != _TEXTBUF_FLUSH) and (reason_code != _TEXTBUF_CLOSE):
                 return 0
+            loops = 0
             while True:
-                bytes_read = c_uint32()
-                position = c_uint32()
-                result = self.__dll.AITalkAPI_GetKana(c_int32(job_id), text_buf, c_uint32(sizeof(text_buf)), byref(bytes_read), byref(position))
-                if result != aitalk.ResultCode.SUCCESS:
+                loops += 1
+                result = get_kana(job_id, text_buf, text_buf_size, bytes_read_ref, position_ref)
+                if result != _SUCCESS:
                     break
                 output.extend(text_buf.value)
-                if bytes_read.value < (sizeof(text_buf) - 1):
+                if bytes_read.value < (text_buf_size - 1):
                     break
-            if reason != aitalk.EventReasonCode.TEXTBUF_CLOSE:
+            if metrics is not None:
+                VcRoid2.__CountCallback(metrics, loops, len(output) - metrics.bytes)
+            if reason_code != _TEXTBUF_CLOSE:
                 return 0
-            event.set()
+            notify()
             return 0
 
-        try:
-            # Set callback function to parameter
-            self.__parameter.procTextBuf = aitalk.ProcTextBuf(callback)
-            result = self.__dll.AITalkAPI_SetParam(self.__parameter)
-            if result != aitalk.ResultCode.SUCCESS:
-                raise Exception(result)
-
-            # Start the conversion
-            job_id = c_int32()
-            job_param = aitalk.TJobParam(c_uint32(int(aitalk.JobInOut.PLAIN_TO_AIKANA)), c_void_p())
-            shiftjis_string, shiftjis_positions = VcRoid2.__CalculateShiftJisCharaterPositions(text)
-            result = self.__dll.AITalkAPI_TextToKana(byref(job_id), job_param, c_char_p(shiftjis_string))
-            if result != aitalk.ResultCode.SUCCESS:
-                raise Exception(result)
-            
-            # Wait for the conversion
-            event_flag = event.wait(timeout)
+        job = Job(next(self.__job_keys), aitalk.JobInOut.PLAIN_TO_AIKANA, proc_text_buf = callback, scratch = [text_buf], buffers = sizes, metrics = metrics)
+        return job, output
 
-            # Complete the conversion
-            result = self.__dll.AITalkAPI_CloseKana(job_id, c_int32())
-            if result != aitalk.ResultCode.SUCCESS:
-                raise Exception(result)
-
-            if event_flag == False:
-                raise TimeoutError()
-        except Exception as e:
-            raise e
-        finally:
-            # Remove callback function from parameter
-            self.__parameter.procTextBuf = aitalk.ProcTextBuf()
-
-        return VcRoid2.__ReplaceIrqMark(output.decode("shift-jis"), shiftjis_positions)
-
-    def kanaToSpeech(self, kana, *, timeout = None, raw = False):
+    def kanaToSpeech(self, kana, *, timeout = None, raw = False, output = None, preset = None, sink = None, buffers = None):
         '''
         Convert AIKANA to audio data.
 
@@ -420,104 +667,371 @@ class VcRoid2(object):
         raw : boolean
             If True, speech is raw binary.
             If False, speech is WAVE format.
+        output : bytearray or writable buffer
+            If specified, the engine writes the speech directly into this buffer from its beginning
+            and the speech is returned as memoryview of it.
+            A bytearray grows as needed, BufferError is raised if other buffers are too small.
+        preset : preset.Preset
+            Parameters of the voice used instead of the current values of param.
+            The engine is set to them only if they differ from those it holds.
+        sink : file object or socket
+            If specified, each chunk of the speech is written to it as soon as the engine produces it
+            and the number of bytes written is returned as speech. See output.SinkOutput.
+            The audio cache is looked up but not filled in this mode.
+        buffers : buffers.BufferSizes or string
+            Sizes of the buffers used instead of those given to the constructor. See buffers.resolveBufferSizes().
+            A conversion with sink counts as streaming.
         
         Returns
         -------
-        speech : bytes
+        speech : bytes, memoryview or int
             Result of conversion (WAVE or raw binary)
+            Without output and sink, speech found in the audio cache is copied into bytes like that of the engine,
+            so a memory-mapped entry is copied once. Use audioCache.get() to read it without copying.
         tts_events : []
             Event data
         '''
         if not self.__is_opened:
             raise RuntimeError()
-        
-        # Create variables used by the callback
+
+        # Look up the cache
+        output = VcRoid2.__OpenSink(sink, output, raw)
+        settings = self.__resolveSettings(preset, buffers, isinstance(output, SinkOutput))
+        audio_cache = self.__audio_cache
+        if audio_cache is not None:
+            audio_key = self.__createAudioKey(kana, settings)
+            item = audio_cache.get(audio_key)
+            if item is not None:
+                return VcRoid2.__AssembleSpeech(item[0], raw, output), item[1]
+
+        speech, tts_events = self.__speech(aitalk.JobInOut.AIKANA_TO_WAVE, kana.encode("shift-jis"), None, timeout, raw, output, settings)
+        if (audio_cache is not None) and not isinstance(output, SinkOutput):
+            audio_cache.put(audio_key, memoryview(speech)[0 if raw else WAVE_HEADER_SIZE:], tts_events)
+        return speech, tts_events
+
+    async def akanaToSpeech(self, kana, *, timeout = None, raw = False, output = None, preset = None, sink = None, buffers = None):
+        '''
+        Convert AIKANA to audio data without blocking the event loop.
+        Cancelling the awaiting task closes the job. See kanaToSpeech().
+        '''
+        if not self.__is_opened:
+            raise RuntimeError()
+
+        # Look up the cache
+        output = VcRoid2.__OpenSink(sink, output, raw)
+        settings = self.__resolveSettings(preset, buffers, isinstance(output, SinkOutput))
+        audio_cache = self.__audio_cache
+        if audio_cache is not None:
+            audio_key = self.__createAudioKey(kana, settings)
+            item = audio_cache.get(audio_key)
+            if item is not None:
+                return VcRoid2.__AssembleSpeech(item[0], raw, output), item[1]
+
+        speech, tts_events = await self.__aspeech(aitalk.JobInOut.AIKANA_TO_WAVE, kana.encode("shift-jis"), None, timeout, raw, output, settings)
+        if (audio_cache is not None) and not isinstance(output, SinkOutput):
+            audio_cache.put(audio_key, memoryview(speech)[0 if raw else WAVE_HEADER_SIZE:], tts_events)
+        return speech, tts_events
+
+    def __resolveSettings(self, preset, buffers = None, streaming = False):
+        # Conversions use the current voice, and the current values of its param without a preset
+        voice = self.__voice
+        if voice is None:
+            raise RuntimeError()
+        if preset is None:
+            preset = voice.param.createPreset()
+        return voice, preset, resolveBufferSizes(self.__buffers if buffers is None else buffers, streaming)
+
+    def __createAudioKey(self, kana, settings):
+        # The speech depends on the AIKANA, the speaker and all parameters of the preset
+        voice, preset = settings[0:2]
+        key = repr((
+            kana,
+            voice.name,
+            preset.volume, preset.speed, preset.pitch, preset.emphasis,
+            preset.pauseMiddle, preset.pauseLong, preset.pauseSentence,
+            preset.masterVolume
+        ))
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def __speech(self, mode, input_string, input_positions, timeout, raw, output, settings):
+        if not self.__is_opened:
+            raise RuntimeError()
+
+        # Start the conversion and wait for it
         event = threading.Event()
-        raw_buf = (c_char * min(self.__parameter.lenRawBufBytes * 2, VcRoid2.__LEN_RAW_BUF_MAX))()
-        output = io.BytesIO()
-        if not raw:
-            output.write(b"\x00" * 44) # 44 is WAVE header size
+        writer, output_buf = self.__createWriter(raw, output)
+        job, tts_events, errors = self.__createSpeechJob(mode, input_positions, writer, event.set, settings)
+        self.__startJob(job, input_string, timeout)
+        try:
+            event_flag = event.wait(timeout)
+        finally:
+            self.__closeJob(job)
+        if 0 < len(errors):
+            # Empty the list, which the frames in the traceback refer to, so that the error does not keep the output exported
+            del errors[1:]
+            raise errors.pop()
+        if event_flag == False:
+            raise TimeoutError()
+        return self.__finishWriter(writer, output_buf), tts_events
+
+    async def __aspeech(self, mode, input_string, input_positions, timeout, raw, output, settings):
+        if not self.__is_opened:
+            raise RuntimeError()
+
+        # Start the conversion and wait for it
+        import asyncio
+        loop = asyncio.get_running_loop()
+        done = loop.create_future()
+        writer, output_buf = self.__createWriter(raw, output)
+        job, tts_events, errors = self.__createSpeechJob(mode, input_positions, writer, VcRoid2.__CreateNotifier(loop, lambda: VcRoid2.__Complete(done)), settings)
+        await self.__astartJob(job, input_string, timeout)
+        try:
+            await VcRoid2.__WaitFor(done, timeout)
+        finally:
+            self.__closeJob(job)
+        if 0 < len(errors):
+            # Empty the list, which the frames in the traceback refer to, so that the error does not keep the output exported
+            del errors[1:]
+            raise errors.pop()
+        return self.__finishWriter(writer, output_buf), tts_events
+
+    def __createWriter(self, raw, output):
+        # Write into a reusable buffer unless the output is specified
+        if isinstance(output, SinkOutput):
+            return output, None
+        if output is not None:
+            return BufferOutput(output, header = not raw), None
+        output_buf = None
+        with self.__scratch_lock:
+            if 0 < len(self.__output_bufs):
+                output_buf = self.__output_bufs.pop()
+        if output_buf is None:
+            output_buf = bytearray(VcRoid2.__LEN_RAW_BUF_MAX)
+        return BufferOutput(output_buf, header = not raw), output_buf
+
+    def __finishWriter(self, writer, output_buf):
+        speech = writer.finish(VcRoid2.__SAMPLE_RATE)
+        if output_buf is None:
+            return speech
+        # Copy once out of the reusable buffer
+        with speech:
+            speech = speech.tobytes()
+        if len(output_buf) <= VcRoid2.__LEN_OUTPUT_BUF_KEEP:
+            with self.__scratch_lock:
+                self.__output_bufs.append(output_buf)
+        return speech
+
+    def __createSpeechJob(self, mode, input_positions, writer, notify, settings):
+        # Create variables used by the callback
+        errors = []
+        raw_buf_bytes = settings[2].rawBufBytes or settings[0].parameter.lenRawBufBytes
+        raw_buf = self.__acquireScratch(min(raw_buf_bytes * 2, VcRoid2.__LEN_RAW_BUF_MAX))
+        raw_buf_size = sizeof(raw_buf)
         tts_events = []
+        samples_read = c_uint32()
+        samples_read_ref = byref(samples_read)
+        get_data = self.__engine.AITalkAPI_GetData
+        metrics = None if self.__metrics is None else JobMetrics("speech", settings[0].name)
 
         # Create rawbuf callback function
         def rawbuf_callback(reason_code, job_id, tick, user_data):
-            reason = aitalk.EventReasonCode(reason_code)
-            if (reason != aitalk.EventReasonCode.RAWBUF_FULL) and (reason != aitalk.EventReasonCode.RAWBUF_FLUSH) and (reason != aitalk.EventReasonCode.RAWBUF_CLOSE):
+            if (reason_code != _RAWBUF_FULL) and (reason_code != _RAWBUF_FLUSH) and (reason_code != _RAWBUF_CLOSE):
                 return 0
-            while True:
-                samples_read = c_uint32()
-                result = self.__dll.AITalkAPI_GetData(c_int32(job_id), raw_buf, c_uint32(sizeof(raw_buf) // 2), byref(samples_read))
-                if result != aitalk.ResultCode.SUCCESS:
-                    break
-                output.write(raw_buf[0:samples_read.value * 2])
-                if (samples_read.value * 2) < len(raw_buf):
-                    break
-            if reason != aitalk.EventReasonCode.RAWBUF_CLOSE:
+            loops = 0
+            received = 0
+            try:
+                while True:
+                    loops += 1
+                    # Let the engine write into the output directly
+                    dest = writer.reserve(raw_buf_size)
+                    if dest is None:
+                        dest = raw_buf
+                    dest_size = sizeof(dest)
+                    result = get_data(job_id, dest, dest_size // 2, samples_read_ref)
+                    if result != _SUCCESS:
+                        break
+                    size = samples_read.value * 2
+                    if dest is raw_buf:
+                        if 0 < size:
+                            raise BufferError("output buffer is too small")
+                        break
+                    writer.commit(size)
+                    received += size
+                    if size < dest_size:
+                        break
+                    del dest
+            except Exception as e:
+                dest = None
+                errors.append(e)
+                if metrics is not None:
+                    metrics.failed = True
+                notify()
+                return 0
+            if metrics is not None:
+                VcRoid2.__CountCallback(metrics, loops, received)
+            if reason_code != _RAWBUF_CLOSE:
                 return 0
-            event.set()
+            notify()
             return 0
 
-        # Create TTS event callback function
-        def tts_event_callback(reason_code, job_id, tick, name, user_data):
-            reason = aitalk.EventReasonCode(reason_code)
-            value = name.decode("shift-jis")
-            if reason == aitalk.EventReasonCode.PH_LABEL:
-                tts_events.append((tick, TtsEventType.PHONETIC, value))
-            elif reason == aitalk.EventReasonCode.AUTO_BOOKMARK:
-                if value.isnumeric():
-                    tts_events.append((tick, TtsEventType.POSITION, int(value)))
-            elif reason == aitalk.EventReasonCode.BOOKMARK:
-                tts_events.append((tick, TtsEventType.BOOKMARK, value))
-            return 0
-        
-        try:
-            # Set callback function to parameter
-            self.__parameter.procRawBuf = aitalk.ProcRawBuf(rawbuf_callback)
-            self.__parameter.procEventTts = aitalk.ProcEventTts(tts_event_callback)
-            result = self.__dll.AITalkAPI_SetParam(self.__parameter)
-            if result != aitalk.ResultCode.SUCCESS:
-                raise Exception(result)
+        job = Job(next(self.__job_keys), mode, voice = settings[0], preset = settings[1], buffers = settings[2], proc_raw_buf = rawbuf_callback,
+            proc_event_tts = VcRoid2.__CreateTtsEventCallback(tts_events, input_positions), scratch = [raw_buf], metrics = metrics)
+        return job, tts_events, errors
 
-            # Start the conversion
-            job_id = c_int32()
-            job_param = aitalk.TJobParam(c_uint32(int(aitalk.JobInOut.AIKANA_TO_WAVE)), c_void_p())
-            result = self.__dll.AITalkAPI_TextToSpeech(byref(job_id), job_param, c_char_p(kana.encode("shift-jis")))
-            if result != aitalk.ResultCode.SUCCESS:
-                raise Exception(result)
-            
-            # Wait for the conversion
-            event_flag = event.wait(timeout)
-
-            # Complete the conversion
-            result = self.__dll.AITalkAPI_CloseSpeech(job_id, c_int32())
-            if result != aitalk.ResultCode.SUCCESS:
-                raise Exception(result)
-
-            if event_flag == False:
+    def __startJob(self, job, input_string, timeout):
+        # Wait for a free slot of the engine, or for all of them if the parameters of the engine must be set
+        deadline = None if timeout is None else time.monotonic() + timeout
+        exclusive = False
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if exclusive:
+                acquired = self.__job_slots.acquireAll(remaining)
+            else:
+                acquired = self.__job_slots.acquire(remaining)
+            if not acquired:
                 raise TimeoutError()
+            started = self.__startAcquiredJob(job, input_string, exclusive, None)
+            if exclusive:
+                self.__job_slots.releaseAll(1 if started else 0)
+            elif started is None:
+                self.__job_slots.release()
+            if started:
+                return
+            exclusive = started is None
+
+    async def __astartJob(self, job, input_string, timeout):
+        # Wait for a free slot of the engine, or for all of them if the parameters of the engine must be set
+        import asyncio
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        exclusive = False
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - loop.time())
+            if exclusive:
+                await VcRoid2.__WaitFor(self.__job_slots.aacquireAll(), remaining)
+            else:
+                await VcRoid2.__WaitFor(self.__job_slots.aacquire(), remaining)
+            started = self.__startAcquiredJob(job, input_string, exclusive, asyncio.current_task())
+            if exclusive:
+                self.__job_slots.releaseAll(1 if started else 0)
+            elif started is None:
+                self.__job_slots.release()
+            if started:
+                return
+            exclusive = started is None
+
+    def __startAcquiredJob(self, job, input_string, exclusive, task):
+        # Returns True if the job started.
+        # Returns False if the engine runs fewer jobs than max_jobs, the slot is dropped to wait for another one.
+        # Returns None if the parameters of the engine must be set while other jobs are running,
+        # the caller returns the slot and waits for all slots since the running jobs may read the parameters.
+        # Register the job before starting it since the callbacks may be called before the engine returns
+        job.thread, job.task = threading.get_ident(), task
+        self.__jobs[job.key] = job
+        metrics = job.metrics
+        if metrics is not None:
+            metrics.queueWait = time.perf_counter() - metrics.start
+        try:
+            with self.__parameter_lock:
+                # Set the parameters only if they differ from those the engine holds
+                voice, preset = job.voice, job.preset
+                if voice is None:
+                    if self.__engine_voice is not None:
+                        voice, preset = self.__engine_voice, self.__engine_preset
+                    else:
+                        voice, preset, _ = self.__resolveSettings(None)
+                elif self.__voices.get(voice.name) is not voice:
+                    # The structures were rebuilt since the conversion was requested
+                    voice = self.__voices.get(voice.name)
+                    if voice is None:
+                        raise RuntimeError("voice is unloaded")
+                # Kana jobs use only the text buffer and speech jobs only the raw buffer, keep the other as it is
+                engine_buffers = self.__engine_buffers or (voice.defaultParameter.lenTextBufBytes, voice.defaultParameter.lenRawBufBytes)
+                buffers = engine_buffers
+                if job.buffers is not None:
+                    if job.mode == aitalk.JobInOut.PLAIN_TO_AIKANA:
+                        buffers = (job.buffers.textBufBytes or voice.defaultParameter.lenTextBufBytes, engine_buffers[1])
+                    else:
+                        buffers = (engine_buffers[0], job.buffers.rawBufBytes or voice.defaultParameter.lenRawBufBytes)
+                if (voice is not self.__engine_voice) or (preset != self.__engine_preset) or (buffers != self.__engine_buffers):
+                    if not exclusive:
+                        running = [other for other in self.__jobs.values() if (other is not job) and (other.id is not None)]
+                        if 0 < len(running):
+                            if any(VcRoid2.__IsOwner(other, job) for other in running):
+                                # Waiting for all slots would wait for the job of the caller itself
+                                raise RuntimeError("the parameters cannot be changed while the caller has a conversion in progress")
+                            del self.__jobs[job.key]
+                            return None
+                    self.__engine_voice = None
+                    voice.engineParam.applyPreset(preset)
+                    voice.engineParameter.lenTextBufBytes, voice.engineParameter.lenRawBufBytes = buffers
+                    set_param_start = time.perf_counter()
+                    result = self.__engine.AITalkAPI_SetParam(byref(voice.engineParameter))
+                    if metrics is not None:
+                        metrics.setParamTime = time.perf_counter() - set_param_start
+                    if result != aitalk.ResultCode.SUCCESS:
+                        raise Exception(result)
+                    self.__engine_voice, self.__engine_preset, self.__engine_buffers = voice, preset, buffers
+
+                # Start the conversion
+                job_id = c_int32()
+                job_param = aitalk.TJobParam(c_uint32(int(job.mode)), c_void_p(job.key))
+                if job.mode == aitalk.JobInOut.PLAIN_TO_AIKANA:
+                    result = self.__engine.AITalkAPI_TextToKana(byref(job_id), job_param, c_char_p(input_string))
+                else:
+                    result = self.__engine.AITalkAPI_TextToSpeech(byref(job_id), job_param, c_char_p(input_string))
+                if (result == aitalk.ResultCode.TOO_MANY_JOBS) and self.__job_slots.retire():
+                    del self.__jobs[job.key]
+                    return False
+                if result != aitalk.ResultCode.SUCCESS:
+                    raise Exception(result)
+                # Set under the lock so that a job started later sees this one running
+                job.id = job_id
         except Exception as e:
+            if metrics is not None:
+                metrics.failed = True
+            if exclusive:
+                # Keep the slot of the job, which __releaseJob() returns
+                self.__job_slots.releaseAll(1)
+            self.__releaseJob(job)
             raise e
+        return True
+
+    def __closeJob(self, job, check = True):
+        try:
+            # Complete the conversion
+            if job.mode == aitalk.JobInOut.PLAIN_TO_AIKANA:
+                result = self.__engine.AITalkAPI_CloseKana(job.id, c_int32())
+            else:
+                result = self.__engine.AITalkAPI_CloseSpeech(job.id, c_int32())
+            if (job.metrics is not None) and (not check or (result != aitalk.ResultCode.SUCCESS)):
+                job.metrics.failed = True
+            if check and (result != aitalk.ResultCode.SUCCESS):
+                raise Exception(result)
         finally:
-            # Remove callback function from parameter
-            self.__parameter.procRawBuf = aitalk.ProcRawBuf()
-            self.__parameter.procEventTts = aitalk.ProcEventTts()
-        
-        if not raw:
-            # Add WAVE header information
-            output_size = output.seek(0, io.SEEK_END)
-            output.seek(0)
-            output.write(b"RIFF")
-            output.write(output_size.to_bytes(4, byteorder = "little"))
-            output.write(b"WAVEfmt \x10\x00\x00\x00\x01\x00\x01\x00")
-            output.write((VcRoid2.__SAMPLE_RATE).to_bytes(4, byteorder = "little"))
-            output.write((VcRoid2.__SAMPLE_RATE * 2).to_bytes(4, byteorder = "little"))
-            output.write(b"\x02\x00\x10\x00data")
-            output.write((output_size - 44).to_bytes(4, byteorder = "little"))
-
-        output.seek(0)
-        return output.read(), tts_events
-
-    def textToSpeech(self, text, *, timeout = None, raw = False):
+            self.__releaseJob(job)
+
+    def __releaseJob(self, job):
+        del self.__jobs[job.key]
+        with self.__scratch_lock:
+            for buf in job.scratch:
+                self.__scratch.setdefault(sizeof(buf), []).append(buf)
+        self.__job_slots.release()
+        metrics = job.metrics
+        hook = self.__metrics
+        if (metrics is not None) and (hook is not None):
+            metrics.totalTime = time.perf_counter() - metrics.start
+            hook(metrics)
+
+    def __acquireScratch(self, size):
+        # Reuse the scratch buffers of the closed jobs
+        with self.__scratch_lock:
+            bufs = self.__scratch.get(size)
+            if bufs:
+                return bufs.pop()
+        return (c_char * size)()
+
+    def textToSpeech(self, text, *, timeout = None, raw = False, direct = False, output = None, chunk_length = None, preset = None, sink = None, buffers = None):
         '''
         Convert text to audio data.
 
@@ -530,55 +1044,646 @@ class VcRoid2(object):
         raw : boolean
             If True, speech is raw binary.
             If False, speech is WAVE format.
+        direct : boolean
+            If True, the text is converted in a single job without going through AIKANA.
+            If False, the text is converted by textToKana() and kanaToSpeech().
+        output : bytearray or writable buffer
+            If specified, the speech is written into this buffer and returned as memoryview.
+            See kanaToSpeech().
+        chunk_length : int
+            If specified, the text is split into sentences of at most this many characters
+            and the next sentence is converted to AIKANA while the current one is synthesized.
+            The ticks and the positions of the events are relative to the whole text.
+            direct is ignored in this mode.
+        preset : preset.Preset
+            Parameters of the voice used instead of the current values of param.
+            See kanaToSpeech().
+        sink : file object or socket
+            If specified, each chunk of the speech is written to it as soon as the engine produces it
+            and the number of bytes written is returned as speech. See kanaToSpeech().
+        buffers : buffers.BufferSizes or string
+            Sizes of the buffers used instead of those given to the constructor. See kanaToSpeech().
         
         Returns
         -------
-        speech : bytes
+        speech : bytes, memoryview or int
             Result of conversion (WAVE format).
         event : []
             Event data.
         '''
+        output = VcRoid2.__OpenSink(sink, output, raw)
+        if chunk_length is not None:
+            writer, output_buf = self.__createWriter(raw, output)
+            tts_events = []
+            for data, events in self.__longSpeechStream(text, timeout, chunk_length, self.__resolveSettings(preset, buffers, isinstance(output, SinkOutput))):
+                writer.write(data)
+                tts_events.extend(events)
+            return self.__finishWriter(writer, output_buf), tts_events
+        if direct:
+            shiftjis_string, shiftjis_positions = calculateShiftJisCharacterPositions(text)
+            return self.__speech(aitalk.JobInOut.PLAIN_TO_WAVE, shiftjis_string, shiftjis_positions, timeout, raw, output, self.__resolveSettings(preset, buffers, isinstance(output, SinkOutput)))
         kana = self.textToKana(text, timeout = timeout)
-        return self.kanaToSpeech(kana, timeout = timeout, raw = raw)
-
-    def __CalculateShiftJisCharaterPositions(input_string):
-        shiftjis_string = bytearray()
-        shiftjis_positions = []
-        encode = "shift-jis"
-        for input_index in range(len(input_string)):
-            input_char = input_string[input_index]
-            shiftjis_char = input_char.encode(encode)
-            for offset in range(len(shiftjis_char)):
-                shiftjis_positions.append(input_index)
-            shiftjis_string.extend(shiftjis_char)
-        shiftjis_positions.append(len(input_string))
-        return bytes(shiftjis_string), shiftjis_positions
-
-    def __ReplaceIrqMark(input_string, input_positions):
-        output = io.StringIO()
-        shiftjis_length = len(input_positions)
-        index = 0
-        start_of_irq = "(Irq MARK=_AI@"
-        end_of_irq = ")"
-        while True:
-            start_pos = input_string.find(start_of_irq, index)
-            if start_pos < 0:
-                output.write(input_string[index:])
-                break
-            start_pos += len(start_of_irq)
-            output.write(input_string[index:start_pos])
-            end_pos = input_string.find(end_of_irq, start_pos)
-            if end_pos < 0:
-                raise RuntimeError()
-            if not input_string[start_pos:end_pos].isnumeric():
-                raise RuntimeError()
-            shiftjis_index = int(input_string[start_pos:end_pos])
-            if (shiftjis_index < 0) or (shiftjis_length <= shiftjis_index):
-                raise RuntimeError()
-            output.write(str(input_positions[shiftjis_index]))
-            index = end_pos
-        output.seek(0)
-        return output.read()
+        return self.kanaToSpeech(kana, timeout = timeout, raw = raw, output = output, preset = preset, buffers = buffers)
+
+    async def atextToSpeech(self, text, *, timeout = None, raw = False, direct = False, output = None, preset = None, sink = None, buffers = None):
+        '''
+        Convert text to audio data without blocking the event loop.
+        Cancelling the awaiting task closes the job. See textToSpeech().
+        '''
+        output = VcRoid2.__OpenSink(sink, output, raw)
+        if direct:
+            shiftjis_string, shiftjis_positions = calculateShiftJisCharacterPositions(text)
+            return await self.__aspeech(aitalk.JobInOut.PLAIN_TO_WAVE, shiftjis_string, shiftjis_positions, timeout, raw, output, self.__resolveSettings(preset, buffers, isinstance(output, SinkOutput)))
+        kana = await self.atextToKana(text, timeout = timeout)
+        return await self.akanaToSpeech(kana, timeout = timeout, raw = raw, output = output, preset = preset, buffers = buffers)
+
+    def kanaToSpeechStream(self, kana, *, timeout = None, raw = True, preset = None, buffers = None):
+        '''
+        Convert AIKANA to audio data, yielding each chunk as soon as the engine produces it.
+        The conversion starts when the first chunk is requested and
+        the job is closed when the iteration finishes or the generator is closed.
+
+        Parameters
+        ----------
+        kana : string
+            The AIKANA string that was converted textToKana().
+        timeout : float
+            Timeout of the whole conversion process in seconds.
+        raw : boolean
+            If True, only raw binary chunks are yielded.
+            If False, a WAVE header with streaming sizes is yielded first.
+        preset : preset.Preset
+            Parameters of the voice used instead of the current values of param.
+            See kanaToSpeech().
+        buffers : buffers.BufferSizes or string
+            Sizes of the buffers used instead of those given to the constructor. See kanaToSpeech().
+
+        Yields
+        ------
+        chunk : bytes
+            Part of the speech (WAVE header or raw binary).
+        tts_events : []
+            Event data whose tick falls inside the chunk.
+        '''
+        return self.__speechStream(aitalk.JobInOut.AIKANA_TO_WAVE, kana.encode("shift-jis"), None, timeout, raw, self.__resolveSettings(preset, buffers, True))
+
+    def __speechStream(self, mode, input_string, input_positions, timeout, raw, settings):
+        if not self.__is_opened:
+            raise RuntimeError()
+
+        chunks = queue.Queue()
+        job = self.__createStreamJob(mode, input_positions, chunks.put, settings)
+        started = False
+        try:
+            # Start the conversion
+            deadline = None if timeout is None else time.monotonic() + timeout
+            self.__startJob(job, input_string, timeout)
+            started = True
+
+            if not raw:
+                # The total size is unknown while streaming
+                yield createWaveHeader(None, VcRoid2.__SAMPLE_RATE), []
+
+            # Hand out chunks until the conversion finishes
+            while True:
+                remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+                try:
+                    item = chunks.get(timeout = remaining)
+                except queue.Empty:
+                    raise TimeoutError()
+                if item is None:
+                    break
+                yield item
+
+            # Complete the conversion
+            started = False
+            self.__closeJob(job)
+        finally:
+            # Abort the conversion if the iteration did not finish
+            if started:
+                self.__closeJob(job, check = False)
+
+    async def __aspeechStream(self, mode, input_string, input_positions, timeout, raw, settings):
+        if not self.__is_opened:
+            raise RuntimeError()
+
+        import asyncio
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue()
+        job = self.__createStreamJob(mode, input_positions, VcRoid2.__CreateNotifier(loop, chunks.put_nowait), settings)
+        started = False
+        try:
+            # Start the conversion
+            deadline = None if timeout is None else loop.time() + timeout
+            await self.__astartJob(job, input_string, timeout)
+            started = True
+
+            if not raw:
+                # The total size is unknown while streaming
+                yield createWaveHeader(None, VcRoid2.__SAMPLE_RATE), []
+
+            # Hand out chunks until the conversion finishes
+            while True:
+                remaining = None if deadline is None else max(0.0, deadline - loop.time())
+                item = await VcRoid2.__WaitFor(chunks.get(), remaining)
+                if item is None:
+                    break
+                yield item
+
+            # Complete the conversion
+            started = False
+            self.__closeJob(job)
+        finally:
+            # Abort the conversion if the iteration did not finish
+            if started:
+                self.__closeJob(job, check = False)
+
+    def __createStreamJob(self, mode, input_positions, put, settings):
+        # Create variables used by the callback
+        raw_buf_bytes = settings[2].rawBufBytes or settings[0].parameter.lenRawBufBytes
+        raw_buf = self.__acquireScratch(min(raw_buf_bytes * 2, VcRoid2.__LEN_RAW_BUF_MAX))
+        raw_buf_size = sizeof(raw_buf)
+        raw_buf_view = memoryview(raw_buf).cast("B")
+        pending_events = []
+        total_samples = 0
+        samples_read = c_uint32()
+        samples_read_ref = byref(samples_read)
+        get_data = self.__engine.AITalkAPI_GetData
+        metrics = None if self.__metrics is None else JobMetrics("speech", settings[0].name)
+
+        # Create rawbuf callback function
+        def rawbuf_callback(reason_code, job_id, tick, user_data):
+            nonlocal total_samples
+            if (reason_code != _RAWBUF_FULL) and (reason_code != _RAWBUF_FLUSH) and (reason_code != _RAWBUF_CLOSE):
+                return 0
+            data = bytearray()
+            loops = 0
+            while True:
+                loops += 1
+                result = get_data(job_id, raw_buf, raw_buf_size // 2, samples_read_ref)
+                if result != _SUCCESS:
+                    break
+                size = samples_read.value * 2
+                data += raw_buf_view[0:size]
+                if size < raw_buf_size:
+                    break
+            total_samples += len(data) // 2
+            if metrics is not None:
+                VcRoid2.__CountCallback(metrics, loops, len(data))
+
+            # Hand out the events that fall inside the data read so far
+            if reason_code == _RAWBUF_CLOSE:
+                count = len(pending_events)
+            else:
+                end_tick = total_samples * 1000 // VcRoid2.__SAMPLE_RATE
+                count = 0
+                while (count < len(pending_events)) and (pending_events[count][0] < end_tick):
+                    count += 1
+            events = pending_events[0:count]
+            del pending_events[0:count]
+            if (0 < len(data)) or (0 < len(events)):
+                put((bytes(data), events))
+            if reason_code == _RAWBUF_CLOSE:
+                put(None)
+            return 0
+
+        return Job(next(self.__job_keys), mode, voice = settings[0], preset = settings[1], buffers = settings[2], proc_raw_buf = rawbuf_callback,
+            proc_event_tts = VcRoid2.__CreateTtsEventCallback(pending_events, input_positions), scratch = [raw_buf], metrics = metrics)
+
+    def textToSpeechStream(self, text, *, timeout = None, raw = True, direct = False, chunk_length = None, preset = None, buffers = None):
+        '''
+        Convert text to audio data, yielding each chunk as soon as the engine produces it.
+        Unless direct is True, the text is converted to AIKANA before this method returns.
+
+        Parameters
+        ----------
+        text : string
+            The text to convert.
+        timeout : float
+            Timeout of each conversion process in seconds.
+        raw : boolean
+            If True, only raw binary chunks are yielded.
+            If False, a WAVE header with streaming sizes is yielded first.
+        direct : boolean
+            If True, the text is converted in a single job without going through AIKANA.
+            If False, the text is converted by textToKana() and kanaToSpeechStream().
+        chunk_length : int
+            If specified, the text is split into sentences of at most this many characters
+            so that the first chunk is yielded after the first sentence is converted to AIKANA.
+            See textToSpeech().
+        preset : preset.Preset
+            Parameters of the voice used instead of the current values of param.
+            See kanaToSpeech().
+        buffers : buffers.BufferSizes or string
+            Sizes of the buffers used instead of those given to the constructor. See kanaToSpeech().
+
+        Returns
+        -------
+        stream : iterator of (bytes, [])
+            Chunks of the speech and the event data whose tick falls inside each chunk.
+        '''
+        if chunk_length is not None:
+            return self.__longSpeechStreamWithHeader(text, timeout, raw, chunk_length, self.__resolveSettings(preset, buffers, True))
+        if direct:
+            shiftjis_string, shiftjis_positions = calculateShiftJisCharacterPositions(text)
+            return self.__speechStream(aitalk.JobInOut.PLAIN_TO_WAVE, shiftjis_string, shiftjis_positions, timeout, raw, self.__resolveSettings(preset, buffers, True))
+        kana = self.textToKana(text, timeout = timeout)
+        return self.kanaToSpeechStream(kana, timeout = timeout, raw = raw, preset = preset, buffers = buffers)
+
+    def akanaToSpeechStream(self, kana, *, timeout = None, raw = True, preset = None, buffers = None):
+        '''
+        Convert AIKANA to audio data, yielding each chunk as soon as the engine produces it without blocking the event loop.
+        The job is closed when the iteration finishes, the generator is closed or the iterating task is cancelled.
+        See kanaToSpeechStream().
+
+        Returns
+        -------
+        stream : async iterator of (bytes, [])
+            Chunks of the speech and the event data whose tick falls inside each chunk.
+        '''
+        return self.__aspeechStream(aitalk.JobInOut.AIKANA_TO_WAVE, kana.encode("shift-jis"), None, timeout, raw, self.__resolveSettings(preset, buffers, True))
+
+    async def atextToSpeechStream(self, text, *, timeout = None, raw = True, direct = False, preset = None, buffers = None):
+        '''
+        Convert text to audio data, yielding each chunk as soon as the engine produces it without blocking the event loop.
+        See textToSpeechStream() and akanaToSpeechStream().
+        '''
+        if direct:
+            shiftjis_string, shiftjis_positions = calculateShiftJisCharacterPositions(text)
+            stream = self.__aspeechStream(aitalk.JobInOut.PLAIN_TO_WAVE, shiftjis_string, shiftjis_positions, timeout, raw, self.__resolveSettings(preset, buffers, True))
+        else:
+            kana = await self.atextToKana(text, timeout = timeout)
+            stream = self.akanaToSpeechStream(kana, timeout = timeout, raw = raw, preset = preset, buffers = buffers)
+        try:
+            async for item in stream:
+                yield item
+        finally:
+            await stream.aclose()
+
+    def textToKanaBatch(self, texts, *, timeout = None, batch_size = 64):
+        '''
+        Convert many short texts to AIKANA in a few jobs.
+
+        Up to batch_size texts are joined line by line and converted in one job,
+        then the AIKANA is split at the AUTO_BOOKMARK mark at the start of each line.
+        A text whose AIKANA cannot be told apart, such as a blank one, is converted by itself.
+
+        Parameters
+        ----------
+        texts : string[]
+            The texts to convert.
+        timeout : float
+            Timeout of each conversion process in seconds.
+        batch_size : int
+            Maximum number of texts converted in one job.
+
+        Returns
+        -------
+        kana_list : string[]
+            Result of conversion of each text.
+        '''
+        if not self.__is_opened:
+            raise RuntimeError()
+        if batch_size < 1:
+            raise ValueError("batch_size must be positive")
+
+        # Look up the cache
+        kana_list = [None] * len(texts)
+        kana_cache = self.__kana_cache
+        kana_context, generation = self.__kana_context, self.__dictionary_generation
+        misses = []
+        for index, text in enumerate(texts):
+            if kana_cache is not None:
+                kana_list[index] = kana_cache.get(kana_context, text)
+            if kana_list[index] is None:
+                misses.append(index)
+
+        for start in range(0, len(misses), batch_size):
+            indices = misses[start:start + batch_size]
+            joined_text, offsets = joinTexts([texts[index] for index in indices])
+            if len(indices) == 1:
+                items = [self.__kana(joined_text, timeout)]
+            else:
+                items = splitKana(self.__kana(joined_text, timeout), offsets)
+            for index, kana in zip(indices, items):
+                if kana is None:
+                    kana = self.__kana(texts[index], timeout)
+                kana_list[index] = kana
+                if (kana_cache is not None) and (generation == self.__dictionary_generation):
+                    kana_cache.put(kana_context, texts[index], kana)
+        return kana_list
+
+    def kanaToSpeechBatch(self, kana_list, *, timeout = None, raw = False, preset = None, batch_size = 64):
+        '''
+        Convert many short AIKANA to audio data in a few jobs.
+
+        Up to batch_size AIKANA are joined with a bookmark before each of them and converted in one job,
+        then the speech is split at the tick of each bookmark.
+        The speech is cut at millisecond resolution, and the prosody at the boundaries
+        may differ slightly from converting each AIKANA by itself.
+
+        Parameters
+        ----------
+        kana_list : string[]
+            The AIKANA strings that were converted textToKana().
+        timeout : float
+            Timeout of each conversion process in seconds.
+        raw : boolean
+            If True, each speech is raw binary.
+            If False, each speech is WAVE format.
+        preset : preset.Preset
+            Parameters of the voice used instead of the current values of param.
+            See kanaToSpeech().
+        batch_size : int
+            Maximum number of AIKANA converted in one job.
+
+        Returns
+        -------
+        results : [(bytes, [])]
+            Speech and event data of each AIKANA. The ticks are relative to each speech.
+        '''
+        if not self.__is_opened:
+            raise RuntimeError()
+        if batch_size < 1:
+            raise ValueError("batch_size must be positive")
+        settings = self.__resolveSettings(preset)
+
+        # Look up the cache
+        results = [None] * len(kana_list)
+        audio_cache = self.__audio_cache
+        audio_keys = [None] * len(kana_list)
+        misses = []
+        for index, kana in enumerate(kana_list):
+            if audio_cache is not None:
+                audio_keys[index] = self.__createAudioKey(kana, settings)
+                item = audio_cache.get(audio_keys[index])
+                if item is not None:
+                    results[index] = (VcRoid2.__AssembleSpeech(item[0], raw, None), item[1])
+                    continue
+            misses.append(index)
+
+        for start in range(0, len(misses), batch_size):
+            indices = misses[start:start + batch_size]
+            joined_kana = joinKana([kana_list[index] for index in indices])
+            speech, tts_events = self.__speech(aitalk.JobInOut.AIKANA_TO_WAVE, joined_kana.encode("shift-jis"), None, timeout, True, None, settings)
+            items = splitSpeech(speech, tts_events, len(indices), VcRoid2.__SAMPLE_RATE)
+            if items is None:
+                # The engine did not report the bookmarks, convert one by one
+                items = []
+                for index in indices:
+                    speech, tts_events = self.__speech(aitalk.JobInOut.AIKANA_TO_WAVE, kana_list[index].encode("shift-jis"), None, timeout, True, None, settings)
+                    items.append((memoryview(speech), tts_events))
+            for index, (speech, tts_events) in zip(indices, items):
+                results[index] = (VcRoid2.__AssembleSpeech(speech, raw, None), tts_events)
+                if audio_cache is not None:
+                    # Copy out of the speech of the batch so that the cache does not keep all of it
+                    audio_cache.put(audio_keys[index], speech.tobytes(), tts_events)
+        return results
+
+    def textToSpeechBatch(self, texts, *, timeout = None, raw = False, preset = None, batch_size = 64):
+        '''
+        Convert many short texts to audio data in a few jobs.
+        See textToKanaBatch() and kanaToSpeechBatch().
+
+        Returns
+        -------
+        results : [(bytes, [])]
+            Speech and event data of each text. The ticks are relative to each speech.
+        '''
+        kana_list = self.textToKanaBatch(texts, timeout = timeout, batch_size = batch_size)
+        return self.kanaToSpeechBatch(kana_list, timeout = timeout, raw = raw, preset = preset, batch_size = batch_size)
+
+    def renderScript(self, lines, *, gap = 0.3, timeout = None, raw = False, output = None):
+        '''
+        Convert a script whose lines are spoken by several voices to one audio data.
+
+        The lines are synthesized grouped by voice and preset so that the voice is switched as few times as possible,
+        then the speech is assembled in script order with silence between the lines.
+        The voice selected before is selected again when finished.
+        Other conversions should not be requested meanwhile since the current voice changes.
+
+        Parameters
+        ----------
+        lines : [(string, preset.Preset, string)]
+            Voice name, preset and text of each line in script order.
+            The preset may be None to use the current values of param of the voice.
+            A fourth element, if any, is the silence after the line in seconds overriding gap.
+        gap : float
+            Silence after each line except the last one in seconds.
+        timeout : float
+            Timeout of each conversion process in seconds.
+        raw : boolean
+            If True, speech is raw binary.
+            If False, speech is WAVE format.
+        output : bytearray or writable buffer
+            If specified, the speech is written into this buffer and returned as memoryview.
+            See kanaToSpeech().
+
+        Returns
+        -------
+        speech : bytes or memoryview
+            Result of conversion (WAVE or raw binary).
+        timeline : [(int, int, [])]
+            Start tick, end tick and event data of each line in script order.
+            The ticks are milliseconds from the beginning of the speech.
+        switches_avoided : int
+            Number of voice switches saved compared to synthesizing the lines in script order.
+        '''
+        if not self.__is_opened:
+            raise RuntimeError()
+        script = [(line[0], line[1], line[2]) for line in lines]
+        current_voice = None if self.__voice is None else self.__voice.name
+        order, script_switches, planned_switches = planScript(script, current_voice)
+
+        # Synthesize the lines grouped by voice
+        results = [None] * len(script)
+        try:
+            for index in order:
+                voice_name, preset, text = script[index]
+                if (self.__voice is None) or (self.__voice.name != voice_name):
+                    self.loadVoice(voice_name)
+                results[index] = self.textToSpeech(text, timeout = timeout, raw = True, preset = preset)
+        finally:
+            if (current_voice is not None) and ((self.__voice is None) or (self.__voice.name != current_voice)):
+                self.loadVoice(current_voice)
+
+        # Assemble the speech in script order
+        writer, output_buf = self.__createWriter(raw, output)
+        timeline = []
+        total_samples = 0
+        for index, (speech, tts_events) in enumerate(results):
+            start_tick = total_samples * 1000 // VcRoid2.__SAMPLE_RATE
+            writer.write(speech)
+            total_samples += len(speech) // 2
+            end_tick = total_samples * 1000 // VcRoid2.__SAMPLE_RATE
+            timeline.append((start_tick, end_tick, [(tick + start_tick, event_type, value) for tick, event_type, value in tts_events]))
+            if index + 1 < len(results):
+                line_gap = lines[index][3] if 3 < len(lines[index]) else gap
+                silence = max(0, int(line_gap * VcRoid2.__SAMPLE_RATE))
+                writer.write(bytes(silence * 2))
+                total_samples += silence
+        return self.__finishWriter(writer, output_buf), timeline, script_switches - planned_switches
+
+    def __longSpeechStreamWithHeader(self, text, timeout, raw, chunk_length, settings):
+        if not raw:
+            # The total size is unknown while streaming
+            yield createWaveHeader(None, VcRoid2.__SAMPLE_RATE), []
+        yield from self.__longSpeechStream(text, timeout, chunk_length, settings)
+
+    def __longSpeechStream(self, text, timeout, chunk_length, settings):
+        if not self.__is_opened:
+            raise RuntimeError()
+        import concurrent.futures
+        chunks = splitText(text, chunk_length)
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers = 1)
+        future = None
+        pipelined = True
+        total_samples = 0
+        try:
+            for index, (offset, chunk) in enumerate(chunks):
+                # Take the AIKANA converted while the previous sentence was synthesized
+                kana = None
+                if future is not None:
+                    try:
+                        kana = future.result()
+                    except Exception as e:
+                        if (type(e) is not Exception) or (e.args != (aitalk.ResultCode.TOO_MANY_JOBS,)):
+                            raise e
+                        # The engine runs one job at a time, convert the rest one by one
+                        pipelined = False
+                    future = None
+                if kana is None:
+                    kana = self.textToKana(chunk, timeout = timeout)
+
+                # The ticks of the events are relative to the beginning of the sentence
+                tick_offset = total_samples * 1000 // VcRoid2.__SAMPLE_RATE
+                # Every sentence is synthesized with the same voice and parameters
+                stream = self.__speechStream(aitalk.JobInOut.AIKANA_TO_WAVE, kana.encode("shift-jis"), None, timeout, True, settings)
+                try:
+                    for data, events in stream:
+                        # Start converting the next sentence once the speech job is running
+                        if pipelined and (future is None) and (index + 1 < len(chunks)):
+                            future = executor.submit(self.textToKana, chunks[index + 1][1], timeout = timeout)
+
+                        # Rebase the events onto the whole text
+                        events = [
+                            (tick + tick_offset, event_type, value + offset if event_type == TtsEventType.POSITION else value)
+                            for tick, event_type, value in events
+                        ]
+                        total_samples += len(data) // 2
+                        yield data, events
+                finally:
+                    stream.close()
+        finally:
+            if future is not None:
+                future.cancel()
+            executor.shutdown(wait = True)
+
+    def __CreateCallbacks(jobs):
+        # The callbacks stay registered to the engine and forward each event to the job given by userData.
+        # They refer to the table of the jobs rather than VcRoid2 so that they do not keep it alive.
+        get = jobs.get
+        def text_buf_callback(reason_code, job_id, user_data):
+            job = get(user_data)
+            if (job is None) or (job.procTextBuf is None):
+                return 0
+            return job.procTextBuf(reason_code, job_id, user_data)
+        def raw_buf_callback(reason_code, job_id, tick, user_data):
+            job = get(user_data)
+            if (job is None) or (job.procRawBuf is None):
+                return 0
+            return job.procRawBuf(reason_code, job_id, tick, user_data)
+        def event_tts_callback(reason_code, job_id, tick, name, user_data):
+            job = get(user_data)
+            if (job is None) or (job.procEventTts is None):
+                return 0
+            return job.procEventTts(reason_code, job_id, tick, name, user_data)
+        return aitalk.ProcTextBuf(text_buf_callback), aitalk.ProcRawBuf(raw_buf_callback), aitalk.ProcEventTts(event_tts_callback)
+
+    def __CreateNotifier(loop, function):
+        # Call function on the event loop from the callback thread of the engine
+        def notify(*args):
+            try:
+                loop.call_soon_threadsafe(function, *args)
+            except RuntimeError:
+                # The event loop is already closed
+                pass
+        return notify
+
+    def __Complete(future):
+        # The future is already cancelled if the awaiting task was
+        if not future.done():
+            future.set_result(None)
+
+    def __IsOwner(job, caller):
+        # A synchronous caller blocks all jobs started in its thread,
+        # a coroutine those started by its task and the synchronous ones of the thread running it
+        return (job.thread == caller.thread) and ((job.task is None) or (caller.task is None) or (job.task is caller.task))
+
+    async def __WaitFor(awaitable, timeout):
+        import asyncio
+        try:
+            return await asyncio.wait_for(awaitable, timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError()
+
+    def __CreateTtsEventCallback(tts_events, input_positions):
+        # input_positions maps the Shift-JIS offsets reported by AUTO_BOOKMARK to character positions.
+        # It is None when the input was AIKANA whose marks are already character positions.
+        append = tts_events.append
+        phonetic = TtsEventType.PHONETIC
+        def tts_event_callback(reason_code, job_id, tick, name, user_data):
+            if reason_code == _PH_LABEL:
+                append((tick, phonetic, name.decode("shift-jis")))
+            elif reason_code == _AUTO_BOOKMARK:
+                value = name.decode("shift-jis")
+                if value.isnumeric():
+                    position = int(value)
+                    if input_positions is None:
+                        append((tick, TtsEventType.POSITION, position))
+                    elif position < len(input_positions):
+                        append((tick, TtsEventType.POSITION, input_positions[position]))
+            elif reason_code == _BOOKMARK:
+                append((tick, TtsEventType.BOOKMARK, name.decode("shift-jis")))
+            return 0
+        return tts_event_callback
+
+    def __CountCallback(metrics, loops, size):
+        # Called from the buffer callbacks of the jobs measured
+        if metrics.firstDataTime is None:
+            metrics.firstDataTime = time.perf_counter() - metrics.start
+        metrics.callbacks += 1
+        metrics.loops += loops
+        metrics.bytes += size
+
+    def __CopySpeakers(parameter, source):
+        # Copy the values of the speakers that both parameters have
+        speakers = {}
+        for index in range(min(source.numSpeakers, len(source.speaker))):
+            speakers[source.speaker[index].voiceName] = source.speaker[index]
+        for index in range(min(parameter.numSpeakers, len(parameter.speaker))):
+            speaker = speakers.get(parameter.speaker[index].voiceName)
+            if speaker is not None:
+                memmove(addressof(parameter.speaker[index]), addressof(speaker), sizeof(aitalk.TSpeakerParam))
+
+    def __AssembleSpeech(speech, raw, output):
+        # Build the result of kanaToSpeech() from raw binary.
+        # Without output the speech is copied into bytes, so that the type does not depend on whether the cache was hit.
+        if output is None:
+            if raw:
+                return speech.tobytes()
+            return b"".join((createWaveHeader(len(speech), VcRoid2.__SAMPLE_RATE), speech))
+        writer = output if isinstance(output, SinkOutput) else BufferOutput(output, header = not raw)
+        writer.write(speech)
+        return writer.finish(VcRoid2.__SAMPLE_RATE)
+
+    def __OpenSink(sink, output, raw):
+        # The sink is passed down as the output
+        if sink is None:
+            return output
+        if output is not None:
+            raise ValueError("output and sink cannot be specified together")
+        return SinkOutput(sink, header = not raw)
 
 class Param(object):
     def __init__(self, default_parameter, parameter):
@@ -594,20 +1699,64 @@ class Param(object):
                 self.__default_speaker_parameter = self.__default_parameter.speaker[index]
                 self.__speaker_parameter = self.__parameter.speaker[index]
                 break
+        self.__preset = None
+
+    def createPreset(self, **kwargs):
+        '''
+        Create a preset of the current values
+
+        Parameters
+        ----------
+        kwargs
+            Arguments of preset.Preset() replacing the current values, such as speed = 1.2.
+
+        Returns
+        -------
+        preset : preset.Preset
+        '''
+        preset = self.__preset
+        if preset is None:
+            preset = Preset(
+                master_volume = self.masterVolume, volume = self.volume, speed = self.speed,
+                pitch = self.pitch, emphasis = self.emphasis,
+                pause_middle = self.pauseMiddle, pause_long = self.pauseLong, pause_sentence = self.pauseSentence
+            )
+            self.__preset = preset
+        if 0 < len(kwargs):
+            preset = preset.replace(**kwargs)
+        return preset
+
+    def applyPreset(self, preset):
+        '''
+        Set the values of the preset
+
+        Parameters
+        ----------
+        preset : preset.Preset
+        '''
+        self.masterVolume = preset.masterVolume
+        self.volume = preset.volume
+        self.speed = preset.speed
+        self.pitch = preset.pitch
+        self.emphasis = preset.emphasis
+        self.pauseMiddle = preset.pauseMiddle
+        self.pauseLong = preset.pauseLong
+        self.pauseSentence = preset.pauseSentence
+        self.__preset = preset
 
     @property
     def minMasterVolume(self):
         '''
         Minimum master volume (マスター音量) : float
         '''
-        return 0.0
+        return RANGES["masterVolume"][1]
 
     @property
     def maxMasterVolume(self):
         '''
         Maximum master volume (マスター音量) : float
         '''
-        return 5.0
+        return RANGES["masterVolume"][2]
 
     @property
     def defaultMasterVolume(self):
@@ -629,20 +1778,21 @@ class Param(object):
         Current master volume (マスター音量) : float
         '''
         self.__parameter.volume = max(self.minMasterVolume, min(float(value), self.maxMasterVolume))
+        self.__preset = None
 
     @property
     def minVolume(self):
         '''
         Minimum volume (音量) : float
         '''
-        return 0.0
+        return RANGES["volume"][1]
 
     @property
     def maxVolume(self):
         '''
         Maximum volume (音量) : float
         '''
-        return 2.0
+        return RANGES["volume"][2]
 
     @property
     def defaultVolume(self):
@@ -664,20 +1814,21 @@ class Param(object):
         Current volume (音量) : float
         '''
         self.__speaker_parameter.volume = max(self.minVolume, min(float(value), self.maxVolume))
+        self.__preset = None
 
     @property
     def minSpeed(self):
         '''
         Minimum speed (話速) : float
         '''
-        return 0.5
+        return RANGES["speed"][1]
 
     @property
     def maxSpeed(self):
         '''
         Maximum speed (話速) : float
         '''
-        return 4.0
+        return RANGES["speed"][2]
 
     @property
     def defaultSpeed(self):
@@ -699,20 +1850,21 @@ class Param(object):
         Current speed (話速) : float
         '''
         self.__speaker_parameter.speed = max(self.minSpeed, min(float(value), self.maxSpeed))
+        self.__preset = None
 
     @property
     def minPitch(self):
         '''
         Minimum pitch (高さ) : float
         '''
-        return 0.5
+        return RANGES["pitch"][1]
 
     @property
     def maxPitch(self):
         '''
         Maximum pitch (高さ) : float
         '''
-        return 2.0
+        return RANGES["pitch"][2]
 
     @property
     def defaultPitch(self):
@@ -734,20 +1886,21 @@ class Param(object):
         Current pitch (高さ) : float
         '''
         self.__speaker_parameter.pitch = max(self.minPitch, min(float(value), self.maxPitch))
+        self.__preset = None
 
     @property
     def minEmphasis(self):
         '''
         Minimum emphasis (抑揚) : float
         '''
-        return 0.0
+        return RANGES["emphasis"][1]
 
     @property
     def maxEmphasis(self):
         '''
         Maximum emphasis (抑揚) : float
         '''
-        return 2.0
+        return RANGES["emphasis"][2]
 
     @property
     def defaultEmphasis(self):
@@ -769,20 +1922,21 @@ class Param(object):
         Current emphasis (抑揚) : float
         '''
         self.__speaker_parameter.range = max(self.minEmphasis, min(float(value), self.maxEmphasis))
+        self.__preset = None
 
     @property
     def minPauseMiddle(self):
         '''
         Minimum middle pause (短ポーズ時間) [ms] : int
         '''
-        return 80
+        return RANGES["pauseMiddle"][1]
 
     @property
     def maxPauseMiddle(self):
         '''
         Maximum middle pause (短ポーズ時間) [ms] : int
         '''
-        return 500
+        return RANGES["pauseMiddle"][2]
 
     @property
     def defaultPauseMiddle(self):
@@ -804,20 +1958,21 @@ class Param(object):
         Current middle pause (短ポーズ時間) [ms] : int
         '''
         self.__speaker_parameter.pauseMiddle = max(self.minPauseMiddle, min(int(value), self.maxPauseMiddle))
+        self.__preset = None
 
     @property
     def minPauseLong(self):
         '''
         Minimum long pause (長ポーズ時間) [ms] : int
         '''
-        return 100
+        return RANGES["pauseLong"][1]
 
     @property
     def maxPauseLong(self):
         '''
         Maximum long pause (長ポーズ時間) [ms] : int
         '''
-        return 2000
+        return RANGES["pauseLong"][2]
 
     @property
     def defaultPauseLong(self):
@@ -841,20 +1996,21 @@ class Param(object):
         pauseLong must be longer than or equal to pauseMiddle
         '''
         self.__speaker_parameter.pauseLong = max(self.minPauseLong, min(int(value), self.maxPauseLong))
+        self.__preset = None
 
     @property
     def minPauseSentence(self):
         '''
         Minimum sentence pause (文末ポーズ時間) [ms] : int
         '''
-        return 200
+        return RANGES["pauseSentence"][1]
 
     @property
     def maxPauseSentence(self):
         '''
         Maximum sentence pause (文末ポーズ時間) [ms] : int
         '''
-        return 10000
+        return RANGES["pauseSentence"][2]
 
     @property
     def defaultPauseSentence(self):
@@ -878,3 +2034,4 @@ class Param(object):
         pauseSentence must be longer than or equal to pauseLong
         '''
         self.__speaker_parameter.pauseSentence = max(self.minPauseSentence, min(int(value), self.maxPauseSentence))
+        self.__preset = None
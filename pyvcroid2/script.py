@@ -0,0 +1,46 @@
+def planScript(lines, current_voice = None):
+    '''
+    Order the lines of a script to synthesize them with as few switches of the voice as possible
+
+    The lines are grouped by the voice and then by the preset, each group in the order of its first line.
+    The group of current_voice comes first.
+
+    Parameters
+    ----------
+    lines : [(string, preset.Preset, string)]
+        Voice name, preset and text of each line in script order.
+    current_voice : string
+        Name of the voice selected before the script.
+
+    Returns
+    -------
+    order : [int]
+        Indices of the lines in the order to synthesize them.
+    script_switches : int
+        Number of voice switches when the lines are synthesized in script order.
+    planned_switches : int
+        Number of voice switches when the lines are synthesized in the returned order.
+    '''
+    groups = {}
+    for index, (voice, preset, _) in enumerate(lines):
+        groups.setdefault(voice, {}).setdefault(preset, []).append(index)
+    voices = list(groups.keys())
+    if current_voice in groups:
+        voices.remove(current_voice)
+        voices.insert(0, current_voice)
+
+    order = []
+    for voice in voices:
+        for indices in groups[voice].values():
+            order.extend(indices)
+    script_switches = _CountSwitches([line[0] for line in lines], current_voice)
+    planned_switches = _CountSwitches([lines[index][0] for index in order], current_voice)
+    return order, script_switches, planned_switches
+
+def _CountSwitches(voices, current_voice):
+    count = 0
+    for voice in voices:
+        if voice != current_voice:
+            count += 1
+            current_voice = voice
+    return count
@@ -0,0 +1,51 @@
+import re
+
+# A sentence ends with its terminators followed by closing brackets
+_SENTENCE = re.compile(r"[^。．！？!?\n]*(?:[。．！？!?\n]+[」』）)】〕\"']*|$)")
+_CLAUSE = re.compile(r"[^、，,；;：:]*(?:[、，,；;：:]+|$)")
+
+def splitText(text, max_length):
+    '''
+    Split text into chunks at sentence boundaries
+
+    Each sentence becomes a chunk. A sentence longer than max_length is split at punctuation,
+    and a clause still longer than max_length is split every max_length characters.
+    Chunks consisting of white spaces only are joined to the previous chunk.
+
+    Parameters
+    ----------
+    text : string
+        The text to split.
+    max_length : int
+        Maximum number of characters per chunk.
+
+    Returns
+    -------
+    chunks : [(int, string)]
+        Offset of each chunk in text and the chunk. Joining the chunks gives text.
+    '''
+    if max_length < 1:
+        raise ValueError("max_length must be positive")
+    chunks = []
+    for sentence in _Split(_SENTENCE, text, 0):
+        if len(sentence[1]) <= max_length:
+            _Append(chunks, sentence)
+            continue
+        for clause in _Split(_CLAUSE, sentence[1], sentence[0]):
+            for start in range(0, len(clause[1]), max_length):
+                _Append(chunks, (clause[0] + start, clause[1][start:start + max_length]))
+    return chunks
+
+def _Split(pattern, text, offset):
+    result = []
+    for match in pattern.finditer(text):
+        if match.start() < match.end():
+            result.append((offset + match.start(), match.group(0)))
+    return result
+
+def _Append(chunks, chunk):
+    if (0 < len(chunks)) and chunk[1].isspace():
+        offset, previous = chunks[-1]
+        chunks[-1] = (offset, previous + chunk[1])
+    else:
+        chunks.append(chunk)
@@ -0,0 +1,106 @@
+import re
+from array import array
+
+# Characters encoded into a single byte by the shift-jis codec
+_SINGLE_BYTE_RUN = re.compile("[\x00-\x7F¥‾｡-ﾟ]+")
+_IRQ_MARK = re.compile(r"\(Irq MARK=_AI@([^)]*)(\))?")
+
+def calculateShiftJisCharacterPositions(input_string):
+    '''
+    Encode the text into Shift-JIS and map each byte to the character it belongs to
+
+    Parameters
+    ----------
+    input_string : string
+        The text to encode.
+
+    Returns
+    -------
+    shiftjis_string : bytes
+        The encoded text.
+    shiftjis_positions : array of int
+        Index of the character for each byte of shiftjis_string,
+        followed by the length of input_string.
+    '''
+    shiftjis_string = input_string.encode("shift-jis")
+    length = len(input_string)
+    shiftjis_positions = array("I")
+    if len(shiftjis_string) == length:
+        # Every character is a single byte
+        shiftjis_positions.extend(range(length + 1))
+        return shiftjis_string, shiftjis_positions
+
+    # Single byte runs map byte by byte, the characters between them take two bytes each
+    index = 0
+    for match in _SINGLE_BYTE_RUN.finditer(input_string):
+        _AppendDoubleByteRun(shiftjis_positions, index, match.start())
+        shiftjis_positions.extend(range(match.start(), match.end()))
+        index = match.end()
+    _AppendDoubleByteRun(shiftjis_positions, index, length)
+    shiftjis_positions.append(length)
+    if len(shiftjis_positions) != len(shiftjis_string) + 1:
+        # The codec disagrees with the table of single byte characters, map character by character
+        shiftjis_positions = array("I")
+        for input_index in range(length):
+            shiftjis_positions.extend([input_index] * len(input_string[input_index].encode("shift-jis")))
+        shiftjis_positions.append(length)
+    return shiftjis_string, shiftjis_positions
+
+def replaceIrqMark(input_string, input_positions):
+    '''
+    Rewrite the Shift-JIS offsets of the AUTO_BOOKMARK marks in AIKANA into character positions
+
+    Parameters
+    ----------
+    input_string : string
+        AIKANA containing (Irq MARK=_AI@<offset>).
+    input_positions : array of int
+        shiftjis_positions returned by calculateShiftJisCharacterPositions().
+
+    Returns
+    -------
+    kana : string
+        AIKANA containing (Irq MARK=_AI@<position>).
+        RuntimeError is raised if a mark is malformed or out of range.
+    '''
+    parts = _IRQ_MARK.split(input_string)
+    if len(parts) == 1:
+        return input_string
+
+    # Rewrite all marks at once when every mark is well-formed
+    values = parts[1::3]
+    if (None not in parts[2::3]) and all(map(str.isnumeric, values)):
+        try:
+            indices = list(map(int, values))
+        except ValueError:
+            indices = None
+        if (indices is not None) and (0 <= min(indices)) and (max(indices) < len(input_positions)):
+            parts[1::3] = ["(Irq MARK=_AI@" + str(position) + ")" for position in map(input_positions.__getitem__, indices)]
+            parts[2::3] = [""] * len(values)
+            return "".join(parts)
+
+    # Otherwise rewrite one by one to report the first malformed mark
+    shiftjis_length = len(input_positions)
+    def replace(match):
+        value = match.group(1)
+        if match.group(2) is None:
+            raise RuntimeError()
+        if not value.isnumeric():
+            raise RuntimeError()
+        shiftjis_index = int(value)
+        if (shiftjis_index < 0) or (shiftjis_length <= shiftjis_index):
+            raise RuntimeError()
+        return "(Irq MARK=_AI@{})".format(input_positions[shiftjis_index])
+    return _IRQ_MARK.sub(replace, input_string)
+
+def _AppendDoubleByteRun(positions, start, end):
+    count = end - start
+    if count <= 0:
+        return
+    indices = array("I", range(start, end))
+    offset = len(positions)
+    positions.extend(indices)
+    positions.extend(indices)
+    view = memoryview(positions)[offset:]
+    view[0::2] = memoryview(indices)
+    view[1::2] = memoryview(indices)
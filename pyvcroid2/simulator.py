@@ -0,0 +1,524 @@
+import math
+import os
+import re
+import sys
+import threading
+import time
+from array import array
+from ctypes import *
+from . import aitalk
+
+_SENTENCE = re.compile(r"[^。．！？!?\n]*[。．！？!?\n]*")
+_KANA_TOKEN = re.compile(r"\(Irq MARK=([^)]*)\)|<[^>]*>|\([^)]*\)|(.)", re.DOTALL)
+_KATAKANA = {code: code + 0x60 for code in range(0x3041, 0x3097)}
+_PAUSE_MIDDLE = "、，,"
+_PAUSE_SENTENCE = "。．！？!?\n"
+
+def _deref(arg):
+    # byref() keeps the referenced object in _obj
+    obj = getattr(arg, "_obj", None)
+    return arg if obj is None else obj
+
+def _value(arg):
+    return getattr(_deref(arg), "value", arg)
+
+class _Job(object):
+    def __init__(self, job_id, mode, input_string, param, user_data):
+        self.id = job_id
+        self.mode = mode
+        self.input = input_string
+        self.param = param
+        self.user_data = user_data
+        self.procTextBuf = param.procTextBuf
+        self.procRawBuf = param.procRawBuf
+        self.procEventTts = param.procEventTts
+        self.lock = threading.Lock()
+        self.data = bytearray()
+        self.position = 0
+        self.closed = threading.Event()
+        self.thread = None
+
+class SimulatedEngine(object):
+    '''
+    Pure Python stand-in of aitalked.dll.
+
+    It implements the AITalkAPI_* functions used by VcRoid2 and drives the registered callbacks
+    from a worker thread per job, so that VcRoid2 runs without VOICEROID2.
+    The AIKANA and speech it produces are not realistic, only their shape and timing are.
+    AIKANA is the katakana of the text with an AUTO_BOOKMARK mark at the start of each sentence,
+    and speech is a tone of msec_per_char per character with pauses at punctuation.
+    '''
+    SAMPLE_RATE = 44100
+
+    def __init__(self, *, languages = ("standard",), voices = ("akari_44",), speakers = 1,
+            kana_cost = 0.0, real_time_factor = 0.0, msec_per_char = 100,
+            text_buf_bytes = 1024, raw_buf_bytes = 88200, chunk_samples = None,
+            phonetic_events = True, max_jobs = 1, busy = False,
+            init_cost = 0.0, lang_load_cost = 0.0, voice_load_cost = 0.0, set_param_cost = 0.0, job_cost = 0.0):
+        '''
+        Parameters
+        ----------
+        languages : string[]
+            Names of the installed language libraries.
+        voices : string[]
+            Names of the installed voice libraries.
+        speakers : int
+            Number of speakers in each voice library.
+        kana_cost : float
+            Seconds spent per character to convert text to AIKANA.
+        real_time_factor : float
+            Seconds spent per second of generated speech.
+        msec_per_char : int
+            Duration of the speech per character at speed 1.0 in milliseconds.
+        text_buf_bytes : int
+            Default lenTextBufBytes which is also the interval of TEXTBUF_FULL.
+        raw_buf_bytes : int
+            Default lenRawBufBytes which is also the interval of RAWBUF_FULL.
+        chunk_samples : int
+            Interval of RAWBUF_FULL in samples overriding lenRawBufBytes.
+        phonetic_events : boolean
+            If True, PH_LABEL event is raised for each character.
+        max_jobs : int
+            Number of jobs that can exist at the same time.
+        busy : boolean
+            If True, kana_cost and real_time_factor are spent spinning on the CPU instead of sleeping,
+            so that a job occupies a core like the real engine does.
+        init_cost, lang_load_cost, voice_load_cost, set_param_cost : float
+            Seconds spent in AITalkAPI_Init, AITalkAPI_LangLoad, AITalkAPI_VoiceLoad and AITalkAPI_SetParam.
+        job_cost : float
+            Seconds spent in AITalkAPI_TextToKana and AITalkAPI_TextToSpeech to start a job.
+        '''
+        self.__languages = list(languages)
+        self.__voices = list(voices)
+        self.__speakers = speakers
+        self.__kana_cost = kana_cost
+        self.__real_time_factor = real_time_factor
+        self.__msec_per_char = msec_per_char
+        self.__text_buf_bytes = text_buf_bytes
+        self.__raw_buf_bytes = raw_buf_bytes
+        self.__chunk_samples = chunk_samples
+        self.__phonetic_events = phonetic_events
+        self.__max_jobs = max_jobs
+        self.__busy = busy
+        self.__init_cost = init_cost
+        self.__lang_load_cost = lang_load_cost
+        self.__voice_load_cost = voice_load_cost
+        self.__set_param_cost = set_param_cost
+        self.__job_cost = job_cost
+        self.__lock = threading.Lock()
+        self.__initialized = False
+        self.__language = None
+        self.__loaded_voices = []
+        self.__param = None
+        self.__dictionaries = {}
+        self.__jobs = {}
+        self.__next_job_id = 1
+        self.__tones = {}
+
+    def createConfig(self, sample_rate, msec_timeout):
+        return aitalk.TConfig(
+            hzVoiceDB = sample_rate,
+            dirVoiceDBS = b"Voice",
+            msecTimeout = msec_timeout,
+            pathLicense = b"aitalk.lic",
+            codeAuthSeed = b"",
+            __reserved__ = 0
+        )
+
+    def listLanguages(self):
+        return list(self.__languages)
+
+    def listVoices(self):
+        return list(self.__voices)
+
+    def langLoad(self, language_name):
+        return self.AITalkAPI_LangLoad(c_char_p(("Lang\\" + language_name).encode("shift-jis")))
+
+    def AITalkAPI_Init(self, config):
+        config = _deref(config)
+        if self.__initialized:
+            return aitalk.ResultCode.ALREADY_INITIALIZED
+        if config.hzVoiceDB != SimulatedEngine.SAMPLE_RATE:
+            return aitalk.ResultCode.INVALID_ARGUMENT
+        time.sleep(self.__init_cost)
+        self.__initialized = True
+        return aitalk.ResultCode.SUCCESS
+
+    def AITalkAPI_End(self):
+        if not self.__initialized:
+            return aitalk.ResultCode.NOT_INITIALIZED
+        for job_id in list(self.__jobs.keys()):
+            self.__closeJob(job_id, None)
+        self.__initialized = False
+        self.__language = None
+        self.__loaded_voices = []
+        self.__param = None
+        self.__dictionaries = {}
+        return aitalk.ResultCode.SUCCESS
+
+    def AITalkAPI_LangClear(self):
+        if not self.__initialized:
+            return aitalk.ResultCode.NOT_INITIALIZED
+        if self.__language is None:
+            return aitalk.ResultCode.NOT_LOADED
+        self.__language = None
+        self.__dictionaries = {}
+        return aitalk.ResultCode.SUCCESS
+
+    def AITalkAPI_LangLoad(self, path):
+        if not self.__initialized:
+            return aitalk.ResultCode.NOT_INITIALIZED
+        name = re.split(r"[\\/]", _value(path).decode("shift-jis"))[-1]
+        if name not in self.__languages:
+            return aitalk.ResultCode.PATH_NOT_FOUND
+        time.sleep(self.__lang_load_cost)
+        self.__language = name
+        return aitalk.ResultCode.SUCCESS
+
+    def AITalkAPI_ReloadPhraseDic(self, path):
+        return self.__reloadDictionary("phrase", path)
+
+    def AITalkAPI_ReloadWordDic(self, path):
+        return self.__reloadDictionary("word", path)
+
+    def AITalkAPI_ReloadSymbolDic(self, path):
+        return self.__reloadDictionary("symbol", path)
+
+    def AITalkAPI_VoiceClear(self):
+        if not self.__initialized:
+            return aitalk.ResultCode.NOT_INITIALIZED
+        if len(self.__loaded_voices) == 0:
+            return aitalk.ResultCode.NOT_LOADED
+        self.__loaded_voices = []
+        self.__param = None
+        return aitalk.ResultCode.SUCCESS
+
+    def AITalkAPI_VoiceLoad(self, voice_name):
+        if not self.__initialized:
+            return aitalk.ResultCode.NOT_INITIALIZED
+        name = _value(voice_name).decode("shift-jis")
+        if name not in self.__voices:
+            return aitalk.ResultCode.FILE_NOT_FOUND
+        time.sleep(self.__voice_load_cost)
+        if name not in self.__loaded_voices:
+            self.__loaded_voices.append(name)
+        self.__param = self.__createParam(name)
+        return aitalk.ResultCode.SUCCESS
+
+    def AITalkAPI_GetParam(self, param, size):
+        if not self.__initialized:
+            return aitalk.ResultCode.NOT_INITIALIZED
+        if self.__param is None:
+            return aitalk.ResultCode.NOT_LOADED
+        param = _deref(param)
+        size = _deref(size)
+        required = sizeof(self.__param)
+        if isinstance(param, c_void_p) or (size.value < required):
+            size.value = required
+            return aitalk.ResultCode.INSUFFICIENT
+        memmove(addressof(param), addressof(self.__param), required)
+        size.value = required
+        return aitalk.ResultCode.SUCCESS
+
+    def AITalkAPI_SetParam(self, param):
+        if not self.__initialized:
+            return aitalk.ResultCode.NOT_INITIALIZED
+        if self.__param is None:
+            return aitalk.ResultCode.NOT_LOADED
+        param = _deref(param)
+        if param.size != sizeof(self.__param):
+            return aitalk.ResultCode.INVALID_ARGUMENT
+        time.sleep(self.__set_param_cost)
+        with self.__lock:
+            memmove(addressof(self.__param), addressof(param), sizeof(self.__param))
+        return aitalk.ResultCode.SUCCESS
+
+    def AITalkAPI_TextToKana(self, job_id, job_param, text):
+        if not self.__initialized:
+            return aitalk.ResultCode.NOT_INITIALIZED
+        if self.__language is None:
+            return aitalk.ResultCode.NOT_LOADED
+        job_param = _deref(job_param)
+        if job_param.modeInOut != aitalk.JobInOut.PLAIN_TO_AIKANA:
+            return aitalk.ResultCode.INVALID_ARGUMENT
+        return self.__startJob(job_id, job_param, _value(text), self.__runKana)
+
+    def AITalkAPI_CloseKana(self, job_id, use_event):
+        return self.__closeJob(_value(job_id), aitalk.JobInOut.PLAIN_TO_AIKANA)
+
+    def AITalkAPI_GetKana(self, job_id, text_buf, len_buf, bytes_read, position):
+        job = self.__jobs.get(_value(job_id))
+        if (job is None) or (job.mode != aitalk.JobInOut.PLAIN_TO_AIKANA):
+            return aitalk.ResultCode.INVALID_JOBID.value
+        bytes_read = _deref(bytes_read)
+        with job.lock:
+            count = min(len(job.data), _value(len_buf) - 1)
+            if count <= 0:
+                bytes_read.value = 0
+                return aitalk.ResultCode.NOMORE_DATA.value
+            memmove(text_buf, bytes(job.data[0:count]) + b"\x00", count + 1)
+            del job.data[0:count]
+            _deref(position).value = job.position
+        bytes_read.value = count
+        return aitalk.ResultCode.SUCCESS.value
+
+    def AITalkAPI_TextToSpeech(self, job_id, job_param, text):
+        if not self.__initialized:
+            return aitalk.ResultCode.NOT_INITIALIZED
+        job_param = _deref(job_param)
+        mode = job_param.modeInOut
+        if (mode != aitalk.JobInOut.AIKANA_TO_WAVE) and (mode != aitalk.JobInOut.PLAIN_TO_WAVE):
+            return aitalk.ResultCode.UNSUPPORTED
+        if (mode == aitalk.JobInOut.PLAIN_TO_WAVE) and (self.__language is None):
+            return aitalk.ResultCode.NOT_LOADED
+        return self.__startJob(job_id, job_param, _value(text), self.__runSpeech)
+
+    def AITalkAPI_CloseSpeech(self, job_id, use_event):
+        return self.__closeJob(_value(job_id), None)
+
+    def AITalkAPI_GetData(self, job_id, raw_buf, len_buf, samples_read):
+        job = self.__jobs.get(_value(job_id))
+        if (job is None) or (job.mode == aitalk.JobInOut.PLAIN_TO_AIKANA):
+            return aitalk.ResultCode.INVALID_JOBID.value
+        samples_read = _deref(samples_read)
+        with job.lock:
+            count = min(len(job.data) // 2, _value(len_buf))
+            if count <= 0:
+                samples_read.value = 0
+                return aitalk.ResultCode.NOMORE_DATA.value
+            source = (c_char * (count * 2)).from_buffer(job.data)
+            memmove(raw_buf, source, count * 2)
+            del source
+            del job.data[0:count * 2]
+        samples_read.value = count
+        return aitalk.ResultCode.SUCCESS.value
+
+    def __reloadDictionary(self, kind, path):
+        if not self.__initialized:
+            return aitalk.ResultCode.NOT_INITIALIZED
+        if self.__language is None:
+            return aitalk.ResultCode.NOT_LOADED
+        path = _value(path)
+        if path is None:
+            self.__dictionaries.pop(kind, None)
+            return aitalk.ResultCode.SUCCESS
+        path = path.decode("shift-jis")
+        if not os.path.isfile(path):
+            return aitalk.ResultCode.FILE_NOT_FOUND
+        if os.path.getsize(path) == 0:
+            return aitalk.ResultCode.USERDIC_NOENTRY
+        self.__dictionaries[kind] = path
+        return aitalk.ResultCode.SUCCESS
+
+    def __createParam(self, voice_name):
+        # Every loaded voice contributes its speakers, the current values of them are kept
+        speaker_names = []
+        for name in self.__loaded_voices:
+            speaker_names.append(name)
+            for index in range(1, self.__speakers):
+                speaker_names.append("{}_{}".format(name, index))
+        TTtsParam = aitalk.createTtsParam(len(speaker_names))
+        param = TTtsParam()
+        param.size = sizeof(TTtsParam)
+        param.lenTextBufBytes = self.__text_buf_bytes
+        param.lenRawBufBytes = self.__raw_buf_bytes
+        param.volume = 1.0
+        param.pauseBegin = 150
+        param.pauseTerm = 150
+        param.voiceName = voice_name.encode("shift-jis")
+        param.numSpeakers = len(speaker_names)
+        previous = {}
+        if self.__param is not None:
+            param.volume = self.__param.volume
+            for index in range(self.__param.numSpeakers):
+                previous[self.__param.speaker[index].voiceName] = self.__param.speaker[index]
+        for index, name in enumerate(speaker_names):
+            speaker = param.speaker[index]
+            source = previous.get(name.encode("shift-jis"))
+            if source is not None:
+                memmove(addressof(speaker), addressof(source), sizeof(aitalk.TSpeakerParam))
+                continue
+            speaker.voiceName = name.encode("shift-jis")
+            speaker.volume = 1.0
+            speaker.speed = 1.0
+            speaker.pitch = 1.0
+            speaker.range = 1.0
+            speaker.pauseMiddle = 150
+            speaker.pauseLong = 370
+            speaker.pauseSentence = 800
+        return param
+
+    def __startJob(self, job_id, job_param, input_string, target):
+        with self.__lock:
+            if self.__max_jobs <= len(self.__jobs):
+                return aitalk.ResultCode.TOO_MANY_JOBS
+            if self.__param is None:
+                return aitalk.ResultCode.NOT_LOADED
+            param = type(self.__param).from_buffer_copy(self.__param)
+            job = _Job(self.__next_job_id, job_param.modeInOut, input_string, param, job_param.userData)
+            self.__next_job_id += 1
+            self.__jobs[job.id] = job
+        _deref(job_id).value = job.id
+        time.sleep(self.__job_cost)
+        job.thread = threading.Thread(target = target, args = (job,), daemon = True)
+        job.thread.start()
+        return aitalk.ResultCode.SUCCESS
+
+    def __closeJob(self, job_id, mode):
+        with self.__lock:
+            job = self.__jobs.get(job_id)
+            if job is None:
+                return aitalk.ResultCode.INVALID_JOBID
+            if (mode is not None) and (job.mode != mode):
+                return aitalk.ResultCode.INVALID_JOBID
+            if (mode is None) and (job.mode == aitalk.JobInOut.PLAIN_TO_AIKANA):
+                return aitalk.ResultCode.INVALID_JOBID
+            del self.__jobs[job_id]
+        job.closed.set()
+        if threading.current_thread() is not job.thread:
+            job.thread.join()
+        return aitalk.ResultCode.SUCCESS
+
+    def __now(self):
+        return time.thread_time() if self.__busy else time.perf_counter()
+
+    def __wait(self, job, deadline):
+        # Sleep until the deadline, returns False if the job was closed
+        if self.__busy:
+            # The deadline is measured in CPU time of the job thread
+            while time.thread_time() < deadline:
+                if job.closed.is_set():
+                    return False
+            return not job.closed.is_set()
+        remaining = deadline - time.perf_counter()
+        if 0 < remaining:
+            return not job.closed.wait(remaining)
+        return not job.closed.is_set()
+
+    def __convertToKana(self, input_string):
+        # Mark the start of each sentence with its Shift-JIS offset like the real engine does
+        text = input_string.decode("shift-jis")
+        kana = []
+        offset = 0
+        for match in _SENTENCE.finditer(text):
+            sentence = match.group(0)
+            if len(sentence) == 0:
+                continue
+            if not sentence.isspace():
+                kana.append("(Irq MARK=_AI@{})".format(offset))
+                kana.append("".join(sentence.split()).translate(_KATAKANA))
+            offset += len(sentence.encode("shift-jis"))
+        return "".join(kana), len(text)
+
+    def __runKana(self, job):
+        start = self.__now()
+        kana, length = self.__convertToKana(job.input)
+        data = kana.encode("shift-jis")
+        cost = self.__kana_cost * length
+        chunk = max(1, job.param.lenTextBufBytes - 1)
+        for offset in range(0, len(data) - chunk + 1, chunk):
+            if not self.__wait(job, start + cost * (offset + chunk) / len(data)):
+                return
+            with job.lock:
+                job.data.extend(data[offset:offset + chunk])
+                job.position = len(job.input) * (offset + chunk) // len(data)
+            SimulatedEngine.__Call(job.procTextBuf, aitalk.EventReasonCode.TEXTBUF_FULL.value, job.id, job.user_data)
+        if not self.__wait(job, start + cost):
+            return
+        with job.lock:
+            job.data.extend(data[len(data) - len(data) % chunk:])
+            job.position = len(job.input)
+        SimulatedEngine.__Call(job.procTextBuf, aitalk.EventReasonCode.TEXTBUF_CLOSE.value, job.id, job.user_data)
+
+    def __runSpeech(self, job):
+        start = self.__now()
+        if job.mode == aitalk.JobInOut.PLAIN_TO_WAVE:
+            kana, length = self.__convertToKana(job.input)
+            start += self.__kana_cost * length
+            if not self.__wait(job, start):
+                return
+        else:
+            kana = job.input.decode("shift-jis")
+
+        # Find the speaker selected by voiceName
+        param = job.param
+        speaker = param.speaker[0]
+        for index in range(param.numSpeakers):
+            if param.speaker[index].voiceName == param.voiceName:
+                speaker = param.speaker[index]
+                break
+        volume = speaker.volume * param.volume
+        msec_per_char = self.__msec_per_char / max(speaker.speed, 0.1)
+        if self.__chunk_samples is None:
+            chunk_bytes = max(2, param.lenRawBufBytes)
+        else:
+            chunk_bytes = self.__chunk_samples * 2
+
+        samples = 0
+        unsignaled = 0
+        def output(pcm):
+            nonlocal samples, unsignaled
+            with job.lock:
+                job.data.extend(pcm)
+            samples += len(pcm) // 2
+            unsignaled += len(pcm)
+            while chunk_bytes <= unsignaled:
+                unsignaled -= chunk_bytes
+                SimulatedEngine.__Call(job.procRawBuf, aitalk.EventReasonCode.RAWBUF_FULL.value, job.id, samples * 1000 // SimulatedEngine.SAMPLE_RATE, job.user_data)
+            return self.__wait(job, start + self.__real_time_factor * samples / SimulatedEngine.SAMPLE_RATE)
+
+        def event(reason, name):
+            tick = samples * 1000 // SimulatedEngine.SAMPLE_RATE
+            SimulatedEngine.__Call(job.procEventTts, reason.value, job.id, tick, name.encode("shift-jis"), job.user_data)
+
+        if not output(SimulatedEngine.__Silence(param.pauseBegin)):
+            return
+        for token in _KANA_TOKEN.finditer(kana):
+            mark = token.group(1)
+            char = token.group(2)
+            if mark is not None:
+                if mark.startswith("_AI@"):
+                    event(aitalk.EventReasonCode.AUTO_BOOKMARK, mark[4:])
+                else:
+                    event(aitalk.EventReasonCode.BOOKMARK, mark)
+                continue
+            if (char is None) or ((char not in _PAUSE_SENTENCE) and char.isspace()):
+                continue
+            if char in _PAUSE_MIDDLE:
+                pcm = SimulatedEngine.__Silence(speaker.pauseMiddle)
+            elif char in _PAUSE_SENTENCE:
+                pcm = SimulatedEngine.__Silence(speaker.pauseSentence)
+            else:
+                if self.__phonetic_events:
+                    event(aitalk.EventReasonCode.PH_LABEL, char)
+                pcm = self.__tone(char, msec_per_char, speaker.pitch, volume)
+            if not output(pcm):
+                return
+        if not output(SimulatedEngine.__Silence(param.pauseTerm)):
+            return
+        if 0 < unsignaled:
+            SimulatedEngine.__Call(job.procRawBuf, aitalk.EventReasonCode.RAWBUF_FLUSH.value, job.id, samples * 1000 // SimulatedEngine.SAMPLE_RATE, job.user_data)
+        SimulatedEngine.__Call(job.procRawBuf, aitalk.EventReasonCode.RAWBUF_CLOSE.value, job.id, samples * 1000 // SimulatedEngine.SAMPLE_RATE, job.user_data)
+
+    def __tone(self, char, msec, pitch, volume):
+        count = int(SimulatedEngine.SAMPLE_RATE * msec) // 1000
+        period = max(2, int(SimulatedEngine.SAMPLE_RATE / ((200 + (ord(char) % 64) * 5) * max(pitch, 0.1))))
+        amplitude = max(0, min(32767, int(8000 * volume)))
+        key = (period, amplitude)
+        wave = self.__tones.get(key)
+        if wave is None:
+            samples = array("h", (int(amplitude * math.sin(2 * math.pi * index / period)) for index in range(period)))
+            if sys.byteorder != "little":
+                samples.byteswap()
+            wave = samples.tobytes()
+            if 4096 <= len(self.__tones):
+                self.__tones.clear()
+            self.__tones[key] = wave
+        return (wave * (count // period + 1))[0:count * 2]
+
+    def __Silence(msec):
+        return bytes(SimulatedEngine.SAMPLE_RATE * max(0, msec) // 1000 * 2)
+
+    def __Call(proc, *args):
+        if proc:
+            proc(*args)
@@ -0,0 +1,30 @@
+class Voice(object):
+    '''
+    Parameter structures of a voice library loaded into the engine.
+
+    The structures of all resident voices have the same size since the engine
+    holds the speakers of every loaded voice in a single TTtsParam.
+    They differ in voiceName, which selects the speaker the engine uses.
+    '''
+
+    def __init__(self, name, default_parameter, parameter, engine_parameter, param, engine_param):
+        '''
+        Parameters
+        ----------
+        name : string
+            Name of the voice library.
+        default_parameter : TTtsParam
+            Default values read from the engine.
+        parameter : TTtsParam
+            Values that param writes into.
+        engine_parameter : TTtsParam
+            Values set to the engine when a job of this voice starts.
+        param, engine_param : Param
+            Accessors of parameter and engine_parameter.
+        '''
+        self.name = name
+        self.defaultParameter = default_parameter
+        self.parameter = parameter
+        self.engineParameter = engine_parameter
+        self.param = param
+        self.engineParam = engine_param
@@ -0,0 +1,148 @@
+import hashlib
+import os
+import threading
+import time
+
+class DictionaryWatcher(object):
+    '''
+    Reload the user dictionaries of VcRoid2 when their files change.
+
+    The files are polled by their modification time and size, and only a file whose SHA-256
+    differs from that of the dictionary an engine has loaded is reloaded into it,
+    so saving a file without changing it or touching it does not stall the conversions.
+    A reload waits for the running jobs of the engine and holds off new ones until it completes,
+    and drops from the KanaCache only the AIKANA of the old dictionaries.
+
+        watcher = DictionaryWatcher(vc, word = "user.wdic")
+        watcher.check()   # Load the dictionary if the engine does not have it yet
+        watcher.start()   # Poll it in a background thread
+    '''
+    __KINDS = (
+        ("phrase", "reloadPhraseDictionary"),
+        ("word", "reloadWordDictionary"),
+        ("symbol", "reloadSymbolDictionary"),
+    )
+
+    def __init__(self, engines, *, phrase = None, word = None, symbol = None, interval = 1.0, settle = 0.5):
+        '''
+        Parameters
+        ----------
+        engines : VcRoid2 or list of VcRoid2
+            Objects the dictionaries are reloaded into.
+        phrase, word, symbol : string
+            File paths of the phrase dictionary (.pdic), the word dictionary (.wdic) and the symbol dictionary (.sdic).
+            None if the dictionary is not watched.
+        interval : float
+            Interval of the polling of start() in seconds.
+        settle : float
+            Seconds a file must stay unmodified before it is reloaded, so that a file being written is not loaded.
+        '''
+        if not isinstance(engines, (list, tuple)):
+            engines = [engines]
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        self.__engines = list(engines)
+        self.__paths = {"phrase": phrase, "word": word, "symbol": symbol}
+        self.__interval = interval
+        self.__settle = settle
+        self.__stats = {}
+        self.__lock = threading.Lock()
+        self.__reloads = 0
+        self.__last_error = None
+        self.__thread = None
+        self.__stopping = threading.Event()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    @property
+    def reloads(self):
+        '''
+        Number of dictionaries reloaded into an engine : int
+        '''
+        return self.__reloads
+
+    @property
+    def lastError(self):
+        '''
+        Exception raised by the last failed polling of start(), None if none failed : Exception
+        '''
+        return self.__last_error
+
+    def check(self):
+        '''
+        Reload the dictionaries which changed since the last check
+
+        Returns
+        -------
+        kinds : string[]
+            Kinds of the dictionaries reloaded into any engine, "phrase", "word" or "symbol".
+        '''
+        reloaded = []
+        # Checks are serialized so that a file is not reloaded twice
+        with self.__lock:
+            for kind, method in DictionaryWatcher.__KINDS:
+                path = self.__paths[kind]
+                if path is None:
+                    continue
+                stat = DictionaryWatcher.__Stat(path)
+                if (stat is not None) and (stat == self.__stats.get(kind)):
+                    continue
+                if (stat is not None) and (time.time() - stat[0] / 1e9 < self.__settle):
+                    # Still being written, check it again next time
+                    continue
+                try:
+                    fingerprint = None if stat is None else DictionaryWatcher.__Hash(path)
+                except OSError:
+                    continue
+                for engine in self.__engines:
+                    if engine.dictionaryFingerprint(kind) != fingerprint:
+                        # The stat is not recorded if this fails, so the reload is retried next time
+                        getattr(engine, method)(None if stat is None else path)
+                        self.__reloads += 1
+                        if kind not in reloaded:
+                            reloaded.append(kind)
+                self.__stats[kind] = stat
+        return reloaded
+
+    def start(self):
+        '''
+        Poll the files in a background thread
+        '''
+        if self.__thread is not None:
+            return
+        self.__stopping.clear()
+        self.__thread = threading.Thread(target = self.__run, daemon = True)
+        self.__thread.start()
+
+    def stop(self):
+        '''
+        Stop polling the files
+        '''
+        if self.__thread is None:
+            return
+        self.__stopping.set()
+        self.__thread.join()
+        self.__thread = None
+
+    def __run(self):
+        while not self.__stopping.wait(self.__interval):
+            try:
+                self.check()
+            except Exception as e:
+                self.__last_error = e
+
+    def __Stat(path):
+        # None if the file does not exist, which unloads the user dictionary
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def __Hash(path):
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
@@ -0,0 +1,29 @@
+import pytest
+from pyvcroid2 import VcRoid2
+from pyvcroid2.simulator import SimulatedEngine
+
+# Sentences mixing kanji, kana, ASCII and punctuation so that the Shift-JIS offsets differ from the positions
+TEXT = "吾輩は猫である。名前はまだ無い。どこで生れたかとんと見当がつかぬ。ABC、123です！最後の文です。"
+
+@pytest.fixture
+def openVcRoid2():
+    '''
+    Factory opening VcRoid2 on SimulatedEngine with the language and a voice loaded.
+    engine_options are passed to SimulatedEngine and options to VcRoid2.
+    '''
+    opened = []
+    def open_vcroid2(engine_options = None, voices = ("akari_44",), **options):
+        engine_options = dict({"msec_per_char": 20, "raw_buf_bytes": 4410, "voices": ("akari_44", "yukari_44", "kiritan_44")}, **(engine_options or {}))
+        vc = VcRoid2(engine = SimulatedEngine(**engine_options), **options)
+        opened.append(vc)
+        vc.loadLanguage("standard")
+        for voice in reversed(voices):
+            vc.loadVoice(voice)
+        return vc
+    yield open_vcroid2
+    for vc in opened:
+        vc.__exit__(None, None, None)
+
+@pytest.fixture
+def vc(openVcRoid2):
+    return openVcRoid2()
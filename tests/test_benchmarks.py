@@ -0,0 +1,9 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+def test_direct_to_wave_runs_on_simulated_engine():
+    import direct_to_wave
+    results = direct_to_wave.main(["--engine", "simulated", "--repeat", "1", "--lengths", "10", "40"])
+    assert [result["length"] for result in results] == [10, 40]
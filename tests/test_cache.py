@@ -0,0 +1,53 @@
+import threading
+from pyvcroid2 import TtsEventType
+from pyvcroid2.cache import AudioCache, KanaCache
+
+def test_kana_cache_survives_restart(tmp_path):
+    cache = KanaCache(directory = str(tmp_path))
+    cache.put("standard", "猫", "ネコ")
+    assert cache.get("standard", "猫") == "ネコ"
+    restarted = KanaCache(directory = str(tmp_path))
+    assert restarted.get("standard", "猫") == "ネコ"
+    assert restarted.diskHits == 1
+    assert restarted.get("other", "猫") is None
+
+def test_kana_cache_concurrent_puts_write_each_file_once(tmp_path):
+    cache = KanaCache(directory = str(tmp_path))
+    def put():
+        for i in range(50):
+            cache.put("standard", str(i), "カナ{}".format(i))
+    threads = [threading.Thread(target = put) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    files = [path for path in tmp_path.rglob("*") if path.is_file()]
+    assert len(files) == 50
+    restarted = KanaCache(directory = str(tmp_path))
+    assert all(restarted.get("standard", str(i)) == "カナ{}".format(i) for i in range(50))
+
+def test_audio_cache_maps_entries_from_disk(tmp_path):
+    events = [(0, TtsEventType.POSITION, 0), (10, TtsEventType.PHONETIC, "a")]
+    cache = AudioCache(directory = str(tmp_path))
+    cache.put("key", b"\x01\x02\x03\x04", events)
+    # Putting the same key again keeps the file, which may be mapped
+    cache.put("key", b"\x01\x02\x03\x04", events)
+    restarted = AudioCache(directory = str(tmp_path))
+    speech, tts_events = restarted.get("key")
+    assert speech == b"\x01\x02\x03\x04"
+    assert speech.readonly
+    assert tts_events == events
+
+def test_audio_cache_hit_matches_engine(vc, tmp_path):
+    vc.audioCache = AudioCache(directory = str(tmp_path))
+    kana = vc.textToKana("吾輩は猫である。")
+    speech, events = vc.kanaToSpeech(kana)
+    vc.audioCache = AudioCache(directory = str(tmp_path))
+    cached_speech, cached_events = vc.kanaToSpeech(kana)
+    assert vc.audioCache.diskHits == 1
+    # The mapped entry is copied into bytes like the speech of the engine
+    assert isinstance(cached_speech, bytes)
+    assert (cached_speech, cached_events) == (speech, events)
+    output = bytearray()
+    with vc.kanaToSpeech(kana, raw = True, output = output)[0] as view:
+        assert view == speech[44:]
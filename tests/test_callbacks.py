@@ -0,0 +1,202 @@
+# Compare the job callbacks and the Shift-JIS mapping with a reference run
+# which drives the engine the way the callbacks of the first release did, one closure per job.
+import io
+import threading
+from ctypes import *
+import pytest
+from pyvcroid2 import TtsEventType, aitalk
+from pyvcroid2.output import createWaveHeader
+from pyvcroid2.shiftjis import calculateShiftJisCharacterPositions, replaceIrqMark
+from pyvcroid2.simulator import SimulatedEngine
+from conftest import TEXT
+
+ENGINE_OPTIONS = {"msec_per_char": 20, "raw_buf_bytes": 4410, "text_buf_bytes": 16}
+
+TEXTS = [
+    TEXT,
+    "こんにちは",
+    "ABC. 123! ｱｲｳｴｵ。¥100です？",
+    "一文目。\n\n二文目、三文目！",
+]
+
+def referenceShiftJisPositions(input_string):
+    shiftjis_string = bytearray()
+    shiftjis_positions = []
+    for input_index in range(len(input_string)):
+        shiftjis_char = input_string[input_index].encode("shift-jis")
+        shiftjis_positions.extend([input_index] * len(shiftjis_char))
+        shiftjis_string.extend(shiftjis_char)
+    shiftjis_positions.append(len(input_string))
+    return bytes(shiftjis_string), shiftjis_positions
+
+def referenceReplaceIrqMark(input_string, input_positions):
+    output = io.StringIO()
+    index = 0
+    start_of_irq = "(Irq MARK=_AI@"
+    while True:
+        start_pos = input_string.find(start_of_irq, index)
+        if start_pos < 0:
+            output.write(input_string[index:])
+            break
+        start_pos += len(start_of_irq)
+        output.write(input_string[index:start_pos])
+        end_pos = input_string.find(")", start_pos)
+        if end_pos < 0:
+            raise RuntimeError()
+        if not input_string[start_pos:end_pos].isnumeric():
+            raise RuntimeError()
+        shiftjis_index = int(input_string[start_pos:end_pos])
+        if (shiftjis_index < 0) or (len(input_positions) <= shiftjis_index):
+            raise RuntimeError()
+        output.write(str(input_positions[shiftjis_index]))
+        index = end_pos
+    return output.getvalue()
+
+class ReferenceRun(object):
+    # Runs each job with its own callbacks set by SetParam, collecting the data inside them
+    def __init__(self):
+        self.engine = SimulatedEngine(**ENGINE_OPTIONS)
+        assert self.engine.AITalkAPI_Init(self.engine.createConfig(44100, 1000)) == aitalk.ResultCode.SUCCESS
+        assert self.engine.langLoad("standard") == aitalk.ResultCode.SUCCESS
+        assert self.engine.AITalkAPI_VoiceLoad(c_char_p(b"akari_44")) == aitalk.ResultCode.SUCCESS
+        param_size = c_uint32(0)
+        self.engine.AITalkAPI_GetParam(c_void_p(), byref(param_size))
+        speaker_count = (param_size.value - sizeof(aitalk.createTtsParam(0))) // sizeof(aitalk.TSpeakerParam)
+        self.parameter = aitalk.createTtsParam(speaker_count)()
+        self.parameter.size = sizeof(self.parameter)
+        assert self.engine.AITalkAPI_GetParam(byref(self.parameter), byref(param_size)) == aitalk.ResultCode.SUCCESS
+        self.parameter.voiceName = b"akari_44"
+        self.parameter.pauseBegin = 0
+        self.parameter.pauseTerm = 0
+        self.parameter.extendFormat = aitalk.ExtendFormat.JEITA_RUBY | aitalk.ExtendFormat.AUTO_BOOKMARK
+
+    def close(self):
+        self.engine.AITalkAPI_End()
+
+    def textToKana(self, text):
+        event = threading.Event()
+        output = bytearray()
+        text_buf = (c_char * self.parameter.lenTextBufBytes)()
+        def callback(reason_code, job_id, user_data):
+            reason = aitalk.EventReasonCode(reason_code)
+            while True:
+                bytes_read = c_uint32()
+                position = c_uint32()
+                result = self.engine.AITalkAPI_GetKana(c_int32(job_id), text_buf, c_uint32(sizeof(text_buf)), byref(bytes_read), byref(position))
+                if aitalk.ResultCode(result) != aitalk.ResultCode.SUCCESS:
+                    break
+                output.extend(text_buf.value)
+                if bytes_read.value < (sizeof(text_buf) - 1):
+                    break
+            if reason == aitalk.EventReasonCode.TEXTBUF_CLOSE:
+                event.set()
+            return 0
+        self.parameter.procTextBuf = aitalk.ProcTextBuf(callback)
+        assert self.engine.AITalkAPI_SetParam(self.parameter) == aitalk.ResultCode.SUCCESS
+        job_id = c_int32()
+        job_param = aitalk.TJobParam(c_uint32(int(aitalk.JobInOut.PLAIN_TO_AIKANA)), c_void_p())
+        shiftjis_string, shiftjis_positions = referenceShiftJisPositions(text)
+        assert self.engine.AITalkAPI_TextToKana(byref(job_id), job_param, c_char_p(shiftjis_string)) == aitalk.ResultCode.SUCCESS
+        assert event.wait(10)
+        self.engine.AITalkAPI_CloseKana(job_id, c_int32())
+        self.parameter.procTextBuf = aitalk.ProcTextBuf()
+        return referenceReplaceIrqMark(output.decode("shift-jis"), shiftjis_positions)
+
+    def kanaToSpeech(self, kana):
+        event = threading.Event()
+        raw_buf = (c_char * (self.parameter.lenRawBufBytes * 2))()
+        output = bytearray()
+        tts_events = []
+        def rawbuf_callback(reason_code, job_id, tick, user_data):
+            reason = aitalk.EventReasonCode(reason_code)
+            while True:
+                samples_read = c_uint32()
+                result = self.engine.AITalkAPI_GetData(c_int32(job_id), raw_buf, c_uint32(sizeof(raw_buf) // 2), byref(samples_read))
+                if aitalk.ResultCode(result) != aitalk.ResultCode.SUCCESS:
+                    break
+                output.extend(raw_buf[0:samples_read.value * 2])
+                if (samples_read.value * 2) < len(raw_buf):
+                    break
+            if reason == aitalk.EventReasonCode.RAWBUF_CLOSE:
+                event.set()
+            return 0
+        def tts_event_callback(reason_code, job_id, tick, name, user_data):
+            reason = aitalk.EventReasonCode(reason_code)
+            value = name.decode("shift-jis")
+            if reason == aitalk.EventReasonCode.PH_LABEL:
+                tts_events.append((tick, TtsEventType.PHONETIC, value))
+            elif reason == aitalk.EventReasonCode.AUTO_BOOKMARK:
+                if value.isnumeric():
+                    tts_events.append((tick, TtsEventType.POSITION, int(value)))
+            elif reason == aitalk.EventReasonCode.BOOKMARK:
+                tts_events.append((tick, TtsEventType.BOOKMARK, value))
+            return 0
+        self.parameter.procRawBuf = aitalk.ProcRawBuf(rawbuf_callback)
+        self.parameter.procEventTts = aitalk.ProcEventTts(tts_event_callback)
+        assert self.engine.AITalkAPI_SetParam(self.parameter) == aitalk.ResultCode.SUCCESS
+        job_id = c_int32()
+        job_param = aitalk.TJobParam(c_uint32(int(aitalk.JobInOut.AIKANA_TO_WAVE)), c_void_p())
+        assert self.engine.AITalkAPI_TextToSpeech(byref(job_id), job_param, c_char_p(kana.encode("shift-jis"))) == aitalk.ResultCode.SUCCESS
+        assert event.wait(10)
+        self.engine.AITalkAPI_CloseSpeech(job_id, c_int32())
+        self.parameter.procRawBuf = aitalk.ProcRawBuf()
+        self.parameter.procEventTts = aitalk.ProcEventTts()
+        return bytes(output), tts_events
+
+@pytest.fixture(scope = "module")
+def reference():
+    run = ReferenceRun()
+    yield run
+    run.close()
+
+@pytest.mark.parametrize("text", TEXTS)
+def test_shiftjis_positions_match_reference(text):
+    shiftjis_string, shiftjis_positions = calculateShiftJisCharacterPositions(text)
+    assert (shiftjis_string, list(shiftjis_positions)) == referenceShiftJisPositions(text)
+
+@pytest.mark.parametrize("kana", [
+    "",
+    "(Irq MARK=_AI@0)ア(Irq MARK=_AI@3)イ",
+    "(Irq MARK=_AI@5)",
+    "(Irq MARK=other)ア",
+])
+def test_replace_irq_mark_matches_reference(kana):
+    positions = referenceShiftJisPositions("あいう")[1]
+    assert replaceIrqMark(kana, positions) == referenceReplaceIrqMark(kana, positions)
+
+@pytest.mark.parametrize("kana", [
+    "(Irq MARK=_AI@1",
+    "(Irq MARK=_AI@x)",
+    "(Irq MARK=_AI@-1)",
+    "(Irq MARK=_AI@7)",
+])
+def test_replace_irq_mark_rejects_malformed_marks(kana):
+    positions = referenceShiftJisPositions("あいう")[1]
+    with pytest.raises(RuntimeError):
+        referenceReplaceIrqMark(kana, positions)
+    with pytest.raises(RuntimeError):
+        replaceIrqMark(kana, positions)
+
+@pytest.mark.parametrize("text", TEXTS)
+def test_callbacks_match_reference_run(openVcRoid2, reference, text):
+    vc = openVcRoid2(ENGINE_OPTIONS)
+    kana = vc.textToKana(text)
+    assert kana == reference.textToKana(text)
+    speech, tts_events = reference.kanaToSpeech(kana)
+    assert len(speech) > 4410 * 2 or len(text) < 20
+    assert vc.kanaToSpeech(kana, raw = True) == (speech, tts_events)
+    assert vc.kanaToSpeech(kana) == (createWaveHeader(len(speech), 44100) + speech, tts_events)
+    assert vc.textToSpeech(text, raw = True, direct = True) == (speech, tts_events)
+
+def test_callbacks_match_reference_run_concurrently(openVcRoid2, reference):
+    vc = openVcRoid2(dict(ENGINE_OPTIONS, max_jobs = 4), max_jobs = 4)
+    expected = {text: reference.kanaToSpeech(reference.textToKana(text)) for text in TEXTS}
+    results = {}
+    def convert(text):
+        results[text] = vc.textToSpeech(text, raw = True)
+    threads = [threading.Thread(target = convert, args = (text,)) for text in TEXTS]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == expected
@@ -0,0 +1,121 @@
+import asyncio
+import threading
+import time
+import pytest
+from pyvcroid2.job import JobSlots
+from conftest import TEXT
+
+def test_slots_are_exhausted():
+    slots = JobSlots(2)
+    assert slots.acquire(0)
+    assert slots.acquire(0)
+    assert not slots.acquire(0.01)
+    slots.release()
+    assert slots.acquire(0)
+
+def test_release_wakes_waiting_thread():
+    slots = JobSlots(1)
+    slots.acquire()
+    acquired = []
+    thread = threading.Thread(target = lambda: acquired.append(slots.acquire(5)))
+    thread.start()
+    time.sleep(0.05)
+    assert acquired == []
+    slots.release()
+    thread.join()
+    assert acquired == [True]
+
+def test_retire_keeps_the_last_slot():
+    slots = JobSlots(2)
+    slots.acquire()
+    assert slots.retire()
+    assert slots.capacity == 1
+    # The retired slot is not returned, the other one is still free
+    assert slots.acquire(0)
+    assert not slots.retire()
+    assert slots.capacity == 1
+
+def test_acquire_all_waits_for_running_jobs():
+    slots = JobSlots(2)
+    slots.acquire()
+    taken = threading.Event()
+    thread = threading.Thread(target = lambda: (slots.acquireAll(), taken.set()))
+    thread.start()
+    time.sleep(0.05)
+    assert not taken.is_set()
+    # New acquisitions wait from the call so that the running jobs drain
+    assert not slots.acquire(0.01)
+    slots.release()
+    assert taken.wait(5)
+    thread.join()
+    assert not slots.acquire(0)
+    slots.releaseAll()
+    assert slots.acquire(0)
+    assert slots.acquire(0)
+
+def test_release_all_wakes_coroutines():
+    slots = JobSlots(2)
+    async def main():
+        slots.acquireAll()
+        tasks = [asyncio.ensure_future(slots.aacquire()) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        assert not any(task.done() for task in tasks)
+        slots.releaseAll()
+        await asyncio.wait_for(asyncio.gather(*tasks), 5)
+    asyncio.run(main())
+    assert not slots.acquire(0)
+
+def test_cancelled_aacquire_keeps_the_count():
+    slots = JobSlots(1)
+    async def main():
+        await slots.aacquire()
+        task = asyncio.ensure_future(slots.aacquire())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        slots.release()
+        # The slot is not lost to the cancelled waiter
+        await asyncio.wait_for(slots.aacquire(), 5)
+        slots.release()
+    asyncio.run(main())
+    assert slots.acquire(0)
+
+def test_aacquire_cancelled_after_wakeup_keeps_the_count():
+    slots = JobSlots(1)
+    async def main():
+        await slots.aacquire()
+        first = asyncio.ensure_future(slots.aacquire())
+        second = asyncio.ensure_future(slots.aacquire())
+        await asyncio.sleep(0.01)
+        slots.release()
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        # The other waiter was woken too and takes the slot
+        await asyncio.wait_for(second, 5)
+        slots.release()
+    asyncio.run(main())
+    assert slots.acquire(0)
+
+def test_too_many_jobs_retires_slot(openVcRoid2):
+    # The engine runs one job while VcRoid2 expects two, the second start is retried with a slot less
+    vc = openVcRoid2({"max_jobs": 1, "real_time_factor": 0.05}, max_jobs = 2)
+    expected = vc.textToSpeech(TEXT, raw = True)
+    results = []
+    threads = [threading.Thread(target = lambda: results.append(vc.textToSpeech(TEXT, raw = True))) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [expected] * 3
+    assert vc.maxJobs == 1
+
+def test_timeout_waiting_for_slot(openVcRoid2):
+    vc = openVcRoid2({"real_time_factor": 0.2}, max_jobs = 1)
+    stream = vc.textToSpeechStream(TEXT)
+    next(stream)
+    with pytest.raises(TimeoutError):
+        vc.textToKana(TEXT, timeout = 0.05)
+    stream.close()
+    assert vc.textToKana(TEXT, timeout = 5) is not None
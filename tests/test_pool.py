@@ -0,0 +1,43 @@
+import functools
+import os
+import signal
+import pytest
+from pyvcroid2.pool import VcRoid2Pool
+from pyvcroid2.simulator import SimulatedEngine
+from conftest import TEXT
+
+ENGINE_OPTIONS = {"msec_per_char": 20, "raw_buf_bytes": 4410}
+
+@pytest.fixture(scope = "module")
+def pool():
+    with VcRoid2Pool("standard", "akari_44", processes = 2, arena_bytes = 65536,
+            engine_factory = functools.partial(SimulatedEngine, **ENGINE_OPTIONS)) as pool:
+        yield pool
+
+def test_pool_matches_vcroid2(pool, openVcRoid2):
+    vc = openVcRoid2(ENGINE_OPTIONS)
+    assert pool.textToKana(TEXT) == vc.textToKana(TEXT)
+    assert pool.textToSpeech(TEXT) == vc.textToSpeech(TEXT)
+    kana = vc.textToKana("吾輩は猫である。")
+    assert pool.kanaToSpeech(kana, raw = True) == vc.kanaToSpeech(kana, raw = True)
+
+def test_pool_grows_arena(pool, openVcRoid2):
+    vc = openVcRoid2(ENGINE_OPTIONS)
+    # Longer than the initial arena, then short again
+    texts = [TEXT * 4, "短い文。", TEXT * 8, TEXT]
+    futures = [pool.submit("textToSpeech", text, raw = True) for text in texts]
+    for text, future in zip(texts, futures):
+        assert future.result() == vc.textToSpeech(text, raw = True)
+
+@pytest.mark.skipif(not hasattr(signal, "SIGKILL"), reason = "requires SIGKILL")
+def test_pool_restarts_killed_worker(openVcRoid2):
+    vc = openVcRoid2(ENGINE_OPTIONS)
+    with VcRoid2Pool("standard", "akari_44", processes = 1,
+            engine_factory = functools.partial(SimulatedEngine, real_time_factor = 1.0, **ENGINE_OPTIONS)) as pool:
+        future = pool.submit("textToSpeech", TEXT * 10)
+        pid = pool._VcRoid2Pool__workers[0].process.pid
+        os.kill(pid, signal.SIGKILL)
+        with pytest.raises(RuntimeError):
+            future.result(30)
+        assert pool.textToSpeech("猫。") == vc.textToSpeech("猫。")
+        assert pool.restarts == 1
@@ -0,0 +1,148 @@
+import io
+import pytest
+from pyvcroid2 import TtsEventType
+from pyvcroid2.output import WAVE_HEADER_SIZE, createWaveHeader
+from conftest import TEXT
+
+def collect(stream):
+    chunks = []
+    events = []
+    for data, chunk_events in stream:
+        chunks.append(data)
+        events.extend(chunk_events)
+    return chunks, events
+
+def positions(events):
+    return [value for _, event_type, value in events if event_type == TtsEventType.POSITION]
+
+def test_kana_stream_matches_two_stage(vc):
+    speech, events = vc.textToSpeech(TEXT, raw = True)
+    chunks, stream_events = collect(vc.kanaToSpeechStream(vc.textToKana(TEXT)))
+    assert 1 < len(chunks)
+    assert b"".join(chunks) == speech
+    assert stream_events == events
+
+def test_text_stream_matches_two_stage(vc):
+    speech, events = vc.textToSpeech(TEXT, raw = True)
+    chunks, stream_events = collect(vc.textToSpeechStream(TEXT))
+    assert b"".join(chunks) == speech
+    assert stream_events == events
+
+def test_stream_events_fall_inside_their_chunk(vc):
+    total_samples = 0
+    stream = vc.textToSpeechStream(TEXT)
+    for data, events in stream:
+        start_tick = total_samples * 1000 // 44100
+        total_samples += len(data) // 2
+        end_tick = total_samples * 1000 // 44100
+        for tick, _, _ in events:
+            assert start_tick <= tick <= end_tick
+
+def test_stream_with_header(vc):
+    speech, _ = vc.textToSpeech(TEXT, raw = True)
+    chunks, _ = collect(vc.textToSpeechStream(TEXT, raw = False))
+    assert chunks[0] == createWaveHeader(None)
+    assert b"".join(chunks[1:]) == speech
+
+def test_stream_closed_early_releases_the_job(vc):
+    stream = vc.textToSpeechStream(TEXT)
+    next(stream)
+    stream.close()
+    # The slots are free again so that both conversions run
+    speech, _ = vc.textToSpeech(TEXT, raw = True)
+    assert b"".join(collect(vc.textToSpeechStream(TEXT))[0]) == speech
+
+def test_direct_matches_two_stage(vc):
+    speech, events = vc.textToSpeech(TEXT)
+    direct_speech, direct_events = vc.textToSpeech(TEXT, direct = True)
+    assert direct_speech == speech
+    assert direct_events == events
+    assert positions(direct_events) == [0, 8, 16, 33, 43]
+
+def test_direct_stream_matches_two_stage(vc):
+    speech, events = vc.textToSpeech(TEXT, raw = True)
+    chunks, stream_events = collect(vc.textToSpeechStream(TEXT, direct = True))
+    assert b"".join(chunks) == speech
+    assert stream_events == events
+
+@pytest.mark.parametrize("chunk_length", [17, 20, 200])
+def test_chunk_length_matches_two_stage(vc, chunk_length):
+    speech, events = vc.textToSpeech(TEXT)
+    chunked_speech, chunked_events = vc.textToSpeech(TEXT, chunk_length = chunk_length)
+    assert chunked_speech == speech
+    # The positions are rebased onto the whole text
+    assert positions(chunked_events) == positions(events)
+    # The ticks are rebased onto the whole speech, rounded at the sentence boundaries
+    assert len(chunked_events) == len(events)
+    for (tick, event_type, value), (chunked_tick, chunked_type, chunked_value) in zip(events, chunked_events):
+        assert (chunked_type, chunked_value) == (event_type, value)
+        assert abs(chunked_tick - tick) <= 1
+
+def test_chunk_length_splitting_a_sentence(vc):
+    speech, events = vc.textToSpeech(TEXT)
+    chunked_speech, chunked_events = vc.textToSpeech(TEXT, chunk_length = 10)
+    assert chunked_speech == speech
+    # The 17 characters sentence at 16 is split at 26, which starts a sentence of its own
+    assert positions(chunked_events) == [0, 8, 16, 26, 33, 43]
+
+def test_chunk_length_stream_matches_two_stage(vc):
+    speech, events = vc.textToSpeech(TEXT, raw = True)
+    chunks, stream_events = collect(vc.textToSpeechStream(TEXT, chunk_length = 17, raw = False))
+    assert chunks[0] == createWaveHeader(None)
+    assert b"".join(chunks[1:]) == speech
+    assert positions(stream_events) == positions(events)
+    for (tick, _, _), (stream_tick, _, _) in zip(events, stream_events):
+        assert abs(stream_tick - tick) <= 1
+
+@pytest.mark.parametrize("raw", [True, False])
+def test_output_grows_bytearray(vc, raw):
+    speech, events = vc.textToSpeech(TEXT, raw = raw)
+    output = bytearray()
+    view, output_events = vc.textToSpeech(TEXT, raw = raw, output = output)
+    assert isinstance(view, memoryview)
+    assert view.obj is output
+    assert view == speech
+    assert output_events == events
+    view.release()
+
+def test_output_reuses_larger_buffer(vc):
+    speech, _ = vc.kanaToSpeech(vc.textToKana(TEXT))
+    output = bytearray(len(speech) * 2)
+    with vc.kanaToSpeech(vc.textToKana(TEXT), output = output)[0] as view:
+        assert view == speech
+    assert len(output) == len(speech) * 2
+
+def test_output_too_small_raises(vc):
+    speech, _ = vc.textToSpeech(TEXT, raw = True)
+    with pytest.raises(BufferError):
+        vc.textToSpeech(TEXT, raw = True, output = memoryview(bytearray(len(speech) // 2)))
+
+def test_sink_writes_complete_wave(vc):
+    speech, events = vc.textToSpeech(TEXT)
+    sink = io.BytesIO()
+    size, sink_events = vc.textToSpeech(TEXT, sink = sink)
+    assert size == len(speech)
+    assert sink.getvalue() == speech
+    assert sink_events == events
+
+def test_sink_raw_and_chunked(vc):
+    speech, _ = vc.textToSpeech(TEXT, raw = True)
+    sink = io.BytesIO()
+    assert vc.textToSpeech(TEXT, raw = True, chunk_length = 10, sink = sink)[0] == len(speech)
+    assert sink.getvalue() == speech
+
+def test_sink_unseekable_keeps_streaming_header(vc):
+    class Pipe(object):
+        def __init__(self):
+            self.data = bytearray()
+        def write(self, data):
+            self.data += data
+    speech, _ = vc.textToSpeech(TEXT)
+    pipe = Pipe()
+    vc.textToSpeech(TEXT, sink = pipe)
+    assert bytes(pipe.data[0:WAVE_HEADER_SIZE]) == createWaveHeader(None)
+    assert bytes(pipe.data[WAVE_HEADER_SIZE:]) == speech[WAVE_HEADER_SIZE:]
+
+def test_output_and_sink_are_exclusive(vc):
+    with pytest.raises(ValueError):
+        vc.textToSpeech(TEXT, output = bytearray(), sink = io.BytesIO())